@@ -145,16 +145,44 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@certificates.com')
+# Throttle for batched certificate emails (0 = no limit)
+CERTIFICATE_EMAIL_RATE_PER_MINUTE = config('CERTIFICATE_EMAIL_RATE_PER_MINUTE', default=0, cast=int)
+
+# Attach the certificate PNG/PDF to emails; when False the email carries a
+# signed download link valid for CERTIFICATE_DOWNLOAD_LINK_MAX_AGE seconds
+CERTIFICATE_EMAIL_ATTACHMENTS = config('CERTIFICATE_EMAIL_ATTACHMENTS', default=True, cast=bool)
+CERTIFICATE_DOWNLOAD_LINK_MAX_AGE = config('CERTIFICATE_DOWNLOAD_LINK_MAX_AGE', default=7 * 24 * 3600, cast=int)
+CERTIFICATE_DOWNLOAD_BASE_URL = config('CERTIFICATE_DOWNLOAD_BASE_URL', default='https://verify.cscindia.org.in')
+
+# Email outbox: messages per batch, attempts before a message is dead, backoff
+# (seconds, doubled per failed attempt up to the max) and how long a claimed
+# batch may stay unconfirmed before another worker picks it up again
+CERTIFICATE_EMAIL_BATCH_SIZE = config('CERTIFICATE_EMAIL_BATCH_SIZE', default=50, cast=int)
+CERTIFICATE_EMAIL_MAX_ATTEMPTS = config('CERTIFICATE_EMAIL_MAX_ATTEMPTS', default=6, cast=int)
+CERTIFICATE_EMAIL_RETRY_DELAY = config('CERTIFICATE_EMAIL_RETRY_DELAY', default=60, cast=int)
+CERTIFICATE_EMAIL_RETRY_MAX_DELAY = config('CERTIFICATE_EMAIL_RETRY_MAX_DELAY', default=3600, cast=int)
+CERTIFICATE_EMAIL_CLAIM_TIMEOUT = config('CERTIFICATE_EMAIL_CLAIM_TIMEOUT', default=600, cast=int)
 
 # Google Drive API Configuration
 GOOGLE_DRIVE_CREDENTIALS_FILE = '/home/Certifycscindia/certificate_generation_system/certificate_system/credentials.json'
 GOOGLE_DRIVE_FOLDER_ID = '1-sAu1jCGNFgBQdpbE3kS63wWP6Ha-7yH'
+# Override the Drive API server (e.g. a local fake Drive for testing)
+GOOGLE_DRIVE_API_ROOT = config('GOOGLE_DRIVE_API_ROOT', default='')
+# Parallel uploads, resumable upload chunk size (a multiple of 256 KB) and retries
+GOOGLE_DRIVE_UPLOAD_WORKERS = config('GOOGLE_DRIVE_UPLOAD_WORKERS', default=4, cast=int)
+GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE = config('GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE', default=1024 * 1024, cast=int)
+GOOGLE_DRIVE_NUM_RETRIES = config('GOOGLE_DRIVE_NUM_RETRIES', default=3, cast=int)
+# Upload certificates created by bulk generation right away
+GOOGLE_DRIVE_UPLOAD_ON_GENERATE = config('GOOGLE_DRIVE_UPLOAD_ON_GENERATE', default=False, cast=bool)
 
 
 # Certificate Template Configuration
 CERTIFICATE_TEMPLATE_PATH = MEDIA_ROOT / 'templates' / 'original_certificate.jpg'
 CERTIFICATE_OUTPUT_PATH = MEDIA_ROOT / 'certificates'
 
+# Upper bound for decoded template images kept in memory per process
+CERTIFICATE_TEMPLATE_CACHE_MAX_BYTES = config('CERTIFICATE_TEMPLATE_CACHE_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+
 CERTIFICATE_FONT_PATH = BASE_DIR / 'static' / 'fonts' / 'Roboto' / 'static' / 'Roboto-SemiBold.ttf'
 
 
@@ -162,6 +190,90 @@ CERTIFICATE_FONT_PATH = BASE_DIR / 'static' / 'fonts' / 'Roboto' / 'static' / 'R
 
 CERTIFICATE_FONT_SIZE = config('CERTIFICATE_FONT_SIZE', default=24, cast=int)
 
+# Extra font families ({family: path}); CERTIFICATE_FONT_PATH is the "default" family
+CERTIFICATE_FONT_FAMILIES = {
+    'bold': BASE_DIR / 'static' / 'fonts' / 'Roboto' / 'static' / 'Roboto-Bold.ttf',
+}
+
+# Per-template font families by role ("name", "body", "small"), e.g.
+# {'Proplore': {'body': 'bold'}}. Unmapped roles use the "default" family.
+CERTIFICATE_TEMPLATE_FONTS = {}
+
+# How often (seconds) each process checks the CertificateTemplate table for
+# edits made by other processes before reusing its compiled render plans
+CERTIFICATE_RENDER_PLAN_CHECK_INTERVAL = config('CERTIFICATE_RENDER_PLAN_CHECK_INTERVAL', default=5, cast=float)
+
+# Bulk generation: render processes (default: one per CPU core) and rows per chunk
+CERTIFICATE_RENDER_WORKERS = config('CERTIFICATE_RENDER_WORKERS', default=0, cast=int) or None
+CERTIFICATE_BULK_CHUNK_SIZE = config('CERTIFICATE_BULK_CHUNK_SIZE', default=50, cast=int)
+
+# Rows validated per DataFrame and written per bulk_create when importing
+# uploaded student sheets
+STUDENT_IMPORT_FRAME_ROWS = config('STUDENT_IMPORT_FRAME_ROWS', default=10000, cast=int)
+STUDENT_IMPORT_CHUNK_SIZE = config('STUDENT_IMPORT_CHUNK_SIZE', default=500, cast=int)
+
+# Create certificates without images and render them on first download,
+# email or admin preview; concurrent first requests wait up to
+# CERTIFICATE_RENDER_LOCK_TIMEOUT seconds for the one rendering it
+CERTIFICATE_LAZY_RENDERING = config('CERTIFICATE_LAZY_RENDERING', default=False, cast=bool)
+CERTIFICATE_RENDER_LOCK_TIMEOUT = config('CERTIFICATE_RENDER_LOCK_TIMEOUT', default=60, cast=int)
+
+# Public verification lookups are cached in the "verification" cache for
+# CERTIFICATE_VERIFICATION_CACHE_TTL seconds (lookups that found nothing for
+# CERTIFICATE_VERIFICATION_MISS_TTL). The cache must be shared by every
+# process: the job and outbox workers (see start.sh) create and render
+# certificates and drop their cached lookups, which a per-process LocMemCache
+# in the web process would never see. The default is a file-based cache in
+# VERIFICATION_CACHE_LOCATION, shared by the processes of one host; use e.g.
+# django.core.cache.backends.redis.RedisCache across several hosts. Either
+# evicts beyond VERIFICATION_CACHE_MAX_ENTRIES entries.
+VERIFICATION_CACHE_BACKEND = config(
+    'VERIFICATION_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'verification': {
+        'BACKEND': VERIFICATION_CACHE_BACKEND,
+        'LOCATION': config('VERIFICATION_CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'verification')),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('VERIFICATION_CACHE_MAX_ENTRIES', default=20000, cast=int),
+        } if VERIFICATION_CACHE_BACKEND.endswith(('LocMemCache', 'FileBasedCache')) else {},
+    },
+}
+CERTIFICATE_VERIFICATION_CACHE_TTL = config('CERTIFICATE_VERIFICATION_CACHE_TTL', default=300, cast=int)
+CERTIFICATE_VERIFICATION_MISS_TTL = config('CERTIFICATE_VERIFICATION_MISS_TTL', default=30, cast=int)
+
+# Bloom filter of issued certificate IDs that turns away lookups of IDs that
+# were never issued: false-positive rate, seconds between full rebuilds, and
+# the file whose token tells every process that certificates were inserted
+CERTIFICATE_ID_FILTER_ENABLED = config('CERTIFICATE_ID_FILTER_ENABLED', default=True, cast=bool)
+CERTIFICATE_ID_FILTER_ERROR_RATE = config('CERTIFICATE_ID_FILTER_ERROR_RATE', default=0.001, cast=float)
+CERTIFICATE_ID_FILTER_REBUILD_INTERVAL = config('CERTIFICATE_ID_FILTER_REBUILD_INTERVAL', default=3600, cast=int)
+CERTIFICATE_ID_FILTER_STAMP = MEDIA_ROOT / '.certificate_ids.stamp'
+
+# Most IDs / roll numbers one call to the batch verification API may look up,
+# and most rows of a CSV uploaded to its CSV variant
+CERTIFICATE_BATCH_VERIFY_MAX_ITEMS = config('CERTIFICATE_BATCH_VERIFY_MAX_ITEMS', default=1000, cast=int)
+CERTIFICATE_BATCH_VERIFY_MAX_CSV_ROWS = config('CERTIFICATE_BATCH_VERIFY_MAX_CSV_ROWS', default=50000, cast=int)
+# The batch verification API answers only requests carrying one of these
+# keys (comma-separated) in an X-API-Key header, and at most
+# CERTIFICATE_BATCH_VERIFY_RATE_LIMIT requests per key and minute (0 = no
+# limit); without keys it is switched off
+CERTIFICATE_BATCH_VERIFY_API_KEYS = config(
+    'CERTIFICATE_BATCH_VERIFY_API_KEYS', default='',
+    cast=lambda value: [key.strip() for key in value.split(',') if key.strip()],
+)
+CERTIFICATE_BATCH_VERIFY_RATE_LIMIT = config('CERTIFICATE_BATCH_VERIFY_RATE_LIMIT', default=30, cast=int)
+
+# Ed25519 private key (PEM, see the generate_qr_signing_key command) that signs
+# the token in each certificate's QR code; leave empty for plain URLs
+CERTIFICATE_QR_SIGNING_KEY_FILE = config('CERTIFICATE_QR_SIGNING_KEY_FILE', default='')
+
+# Seconds without a heartbeat before another worker resumes a running job
+CERTIFICATE_JOB_STALE_AFTER = config('CERTIFICATE_JOB_STALE_AFTER', default=600, cast=int)
+
 # Domain for QR code verification URLs
 SITE_DOMAIN = config('SITE_DOMAIN', default='localhost:8000')
 SITE_PROTOCOL = config('SITE_PROTOCOL', default='http')
@@ -4,7 +4,7 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import Certificate, CertificateTemplate
 import csv
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import datetime
 import zipfile
 from io import BytesIO
@@ -86,7 +86,7 @@ class CertificateAdmin(admin.ModelAdmin):
         }),
     )
 
-    actions = ['send_email_certificates', 'upload_to_drive', 'regenerate_certificates','export_certificates_csv','export_certificates_zip']
+    actions = ['send_email_certificates', 'upload_to_drive', 'regenerate_certificates','export_certificates_csv','export_certificates_zip','export_certificates_pdf']
 
 
 
@@ -97,6 +97,13 @@ class CertificateAdmin(admin.ModelAdmin):
 
     def certificate_preview(self, obj):
         """Display certificate image preview"""
+        from .utils import ensure_certificate_rendered
+
+        if obj.pk:
+            try:
+                ensure_certificate_rendered(obj)
+            except Exception as e:
+                return f"Rendering failed: {e}"
         if obj.certificate_image:
             return format_html(
                 '<img src="{}" style="max-width: 300px; max-height: 200px;" />',
@@ -107,6 +114,13 @@ class CertificateAdmin(admin.ModelAdmin):
 
     def qr_code_preview(self, obj):
         """Display QR code preview"""
+        from .utils import ensure_certificate_rendered
+
+        if obj.pk:
+            try:
+                ensure_certificate_rendered(obj)
+            except Exception as e:
+                return f"Rendering failed: {e}"
         if obj.qr_code_image:
             return format_html(
                 '<img src="{}" style="max-width: 100px; max-height: 100px;" />',
@@ -127,34 +141,28 @@ class CertificateAdmin(admin.ModelAdmin):
 
     def send_email_certificates(self, request, queryset):
         """Admin action to send email certificates"""
-        from .utils import send_certificate_email
+        from .outbox import enqueue_certificate_emails
 
-        sent_count = 0
-        for certificate in queryset:
-            if not certificate.email_sent and certificate.certificate_image:
-                try:
-                    send_certificate_email(certificate)
-                    sent_count += 1
-                except Exception as e:
-                    self.message_user(request, f"Failed to send email for {certificate.full_name}: {str(e)}", level='ERROR')
+        # Certificates without images yet are rendered by the mailer before sending
+        pending = list(queryset.filter(email_sent=False))
+        enqueue_certificate_emails(pending)
 
-        if sent_count > 0:
-            self.message_user(request, f"Successfully sent {sent_count} certificate emails.")
+        if pending:
+            self.message_user(request, f"Queued {len(pending)} certificate emails for delivery.")
 
     send_email_certificates.short_description = "Send certificate emails"
 
     def upload_to_drive(self, request, queryset):
         """Admin action to upload certificates to Google Drive"""
-        from .utils import upload_to_google_drive
+        from .drive import DriveUploader, certificates_needing_sync
 
+        pending = list(certificates_needing_sync(queryset))
         uploaded_count = 0
-        for certificate in queryset:
-            if not certificate.drive_uploaded and certificate.certificate_image:
-                try:
-                    upload_to_google_drive(certificate)
-                    uploaded_count += 1
-                except Exception as e:
-                    self.message_user(request, f"Failed to upload to Drive for {certificate.full_name}: {str(e)}", level='ERROR')
+        for outcome in DriveUploader().upload(pending):
+            if outcome.uploaded:
+                uploaded_count += 1
+            else:
+                self.message_user(request, f"Failed to upload to Drive for {outcome.certificate.full_name}: {str(outcome.error)}", level='ERROR')
 
         if uploaded_count > 0:
             self.message_user(request, f"Successfully uploaded {uploaded_count} certificates to Google Drive.")
@@ -163,18 +171,23 @@ class CertificateAdmin(admin.ModelAdmin):
 
     def regenerate_certificates(self, request, queryset):
         """Admin action to regenerate certificates"""
-        from .utils import generate_certificate
+        from .utils import regenerate_certificate
 
         regenerated_count = 0
+        unchanged_count = 0
         for certificate in queryset:
             try:
-                generate_certificate(certificate)
-                regenerated_count += 1
+                if regenerate_certificate(certificate):
+                    regenerated_count += 1
+                else:
+                    unchanged_count += 1
             except Exception as e:
                 self.message_user(request, f"Failed to regenerate certificate for {certificate.full_name}: {str(e)}", level='ERROR')
 
         if regenerated_count > 0:
             self.message_user(request, f"Successfully regenerated {regenerated_count} certificates.")
+        if unchanged_count > 0:
+            self.message_user(request, f"Skipped {unchanged_count} certificates that are already up to date.")
 
     regenerate_certificates.short_description = "Regenerate certificates"
 
@@ -205,10 +218,16 @@ class CertificateAdmin(admin.ModelAdmin):
         """
         Export certificate image files as a ZIP with the college name in the filename.
         """
+        from .utils import ensure_certificate_rendered
+
         buffer = BytesIO()
         zip_file = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED)
 
         for certificate in queryset:
+            try:
+                ensure_certificate_rendered(certificate)
+            except Exception as e:
+                self.message_user(request, f"Failed to render certificate for {certificate.full_name}: {str(e)}", level='ERROR')
             if certificate.certificate_image:
                 file_path = certificate.certificate_image.path
                 file_name = os.path.basename(file_path)
@@ -233,6 +252,26 @@ class CertificateAdmin(admin.ModelAdmin):
         response['Content-Disposition'] = f'attachment; filename={zip_filename}'
         return response
 
+    def export_certificates_pdf(self, request, queryset):
+        """
+        Stream the selected certificates as one printable PDF booklet, named
+        after the college like the ZIP export.
+        """
+        from .pdf import booklet_filename, check_booklet, stream_certificates_pdf
+
+        try:
+            check_booklet(queryset)
+        except Exception as e:
+            self.message_user(request, f"Cannot build the PDF booklet: {e}", level='ERROR')
+            return None
+
+        response = StreamingHttpResponse(
+            stream_certificates_pdf(queryset.order_by('roll_number', 'pk')), content_type='application/pdf'
+        )
+        response['Content-Disposition'] = f'attachment; filename={booklet_filename(queryset)}'
+        return response
+    export_certificates_pdf.short_description = "Export PDF booklet"
+
 
 @admin.register(CertificateTemplate)
 class CertificateTemplateAdmin(admin.ModelAdmin):
@@ -273,7 +312,8 @@ class CertificateTemplateAdmin(admin.ModelAdmin):
                 ('roll_x', 'roll_y'),
                 ('cert_id_x', 'cert_id_y'),
                 ('date_x', 'date_y'),
-                ('qr_x', 'qr_y')
+                ('qr_x', 'qr_y'),
+                ('qr_size', 'text_align')
             )
         }),
         ('Font Settings', {
@@ -314,24 +354,58 @@ class CertificateExcelUploadAdmin(admin.ModelAdmin):
     actions = ['process_excel_file']
 
     def process_excel_file(self, request, queryset):
+        from .importers import InvalidSheet, import_student_sheet
+
         for upload in queryset:
-            df = pd.read_excel(upload.excel_file.path)
-
-            for _, row in df.iterrows():
-                Certificate_student.objects.get_or_create(
-                    full_name=row['Name'],
-                    course=row['Course'],
-                    roll_number=row['Roll No'],
-                    college_name=row['College Name'],
-                    affiliated_name=row['Affiliated Name'],
-                    start_date=parse_date(str(row['Start Date'])),
-                    end_date=parse_date(str(row['End Date'])),
-                    email=row['Email'],
-                    contact=str(row['Contact']),
-                    gender=row['Gender']
-                )
-        self.message_user(request, "Certificates imported successfully.")
+            try:
+                report = import_student_sheet(upload.excel_file.path)
+            except InvalidSheet as e:
+                self.message_user(request, f"{upload.excel_file.name}: {e}", level='ERROR')
+                continue
+
+            self.message_user(request, f"{upload.excel_file.name}: {report}.")
+            for row_number, error in report.errors[:20]:
+                self.message_user(request, f"{upload.excel_file.name} row {row_number}: {error}", level='WARNING')
     process_excel_file.short_description = "Process and import certificate data"
 
 
 
+
+
+from .models import CertificateJob, CertificateJobResult, EmailOutbox
+
+
+class CertificateJobResultInline(admin.TabularInline):
+    model = CertificateJobResult
+    extra = 0
+    can_delete = False
+    readonly_fields = ['student_id', 'full_name', 'roll_number', 'status', 'certificate', 'message', 'created_at']
+
+
+@admin.register(CertificateJob)
+class CertificateJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'template_name', 'status', 'total_count', 'success_count', 'fail_count', 'duplicate_count', 'created_at', 'finished_at']
+    list_filter = ['status', 'template_name']
+    readonly_fields = ['created_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at', 'worker']
+    inlines = [CertificateJobResultInline]
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['certificate', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['certificate__certificate_id', 'certificate__email', 'certificate__roll_number']
+    readonly_fields = ['claim_token', 'claimed_at', 'created_at', 'sent_at', 'last_error']
+    raw_id_fields = ['certificate']
+    actions = ['retry_messages']
+
+    def retry_messages(self, request, queryset):
+        """Send dead or pending messages again on the next drain"""
+        from django.utils import timezone
+
+        updated = queryset.filter(status__in=[EmailOutbox.STATUS_DEAD, EmailOutbox.STATUS_PENDING]).update(
+            status=EmailOutbox.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} messages will be retried.")
+
+    retry_messages.short_description = "Retry selected messages"
@@ -1,6 +1,40 @@
 from django.apps import AppConfig
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class CertificatesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'certificates'
+
+    def ready(self):
+        """
+        Connect the signals that keep render plans, verification results and
+        the certificate ID filter up to date, and load the certificate fonts
+        once at startup so renders never parse them.
+        """
+        from django.db.models.signals import post_delete, post_save, pre_save
+        from .layout import invalidate_render_plans
+        from .idfilter import register_saved_certificate
+        from .models import Certificate, CertificateTemplate
+        from .verification import forget_replaced_lookups, invalidate_certificate_verification
+
+        # Recompile render plans when a template's layout changes
+        post_save.connect(invalidate_render_plans, sender=CertificateTemplate)
+        post_delete.connect(invalidate_render_plans, sender=CertificateTemplate)
+
+        # Drop cached verification results of changed certificates, under
+        # their old roll number and email too
+        pre_save.connect(forget_replaced_lookups, sender=Certificate)
+        post_save.connect(invalidate_certificate_verification, sender=Certificate)
+        post_delete.connect(invalidate_certificate_verification, sender=Certificate)
+
+        # Teach the certificate ID filter about new certificates
+        post_save.connect(register_saved_certificate, sender=Certificate)
+
+        try:
+            from .fonts import font_registry
+            font_registry.warm()
+        except Exception as e:
+            logger.warning(f"Could not warm certificate fonts: {e}")
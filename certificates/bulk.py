@@ -0,0 +1,307 @@
+"""
+Bulk certificate generation from uploaded Certificate_student rows.
+
+The CPU heavy part of a certificate (drawing, QR code, PNG encoding) runs in
+a process pool; creating rows, saving files, PDFs and emails stay in the
+calling process so all database and storage writes happen in one place.
+"""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .drive import DriveUploader
+from .idfilter import register_certificate_ids
+from .layout import get_render_plan
+from .models import Certificate, Certificate_student, CertificateJobResult, allocate_certificate_ids
+from .outbox import enqueue_certificate_emails
+from .verification import forget_certificates
+from .utils import (
+    build_certificate_record,
+    generate_certificate_pdf,
+    get_render_fields,
+    get_render_fingerprint,
+    lazy_rendering_enabled,
+    render_certificate,
+    save_certificate_images,
+)
+
+logger = logging.getLogger(__name__)
+
+SUCCESS = CertificateJobResult.STATUS_SUCCESS
+FAILED = CertificateJobResult.STATUS_FAILED
+DUPLICATE = CertificateJobResult.STATUS_DUPLICATE
+
+
+def get_render_workers():
+    """Number of render processes, CERTIFICATE_RENDER_WORKERS or one per core."""
+    workers = getattr(settings, 'CERTIFICATE_RENDER_WORKERS', None)
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def _init_render_worker():
+    # Needed when the pool starts workers with "spawn"/"forkserver"; a no-op
+    # for forked workers that inherit the configured apps.
+    import django
+    django.setup()
+
+
+def _render(args):
+    fields, plan = args
+    return render_certificate(fields, plan=plan)
+
+
+class BulkResult:
+    """Counters for a bulk generation run."""
+
+    def __init__(self):
+        self.success_count = 0
+        self.fail_count = 0
+        self.duplicate_count = 0
+
+    def __str__(self):
+        return (
+            f"{self.success_count} generated, {self.fail_count} failed, "
+            f"{self.duplicate_count} duplicates"
+        )
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def existing_roll_numbers(roll_numbers, batch_size=500):
+    """
+    Return the subset of ``roll_numbers`` that already have a certificate.
+
+    Looks them up with one ``IN`` query per ``batch_size`` values instead of
+    one query per student.
+    """
+    roll_numbers = list(dict.fromkeys(roll_numbers))
+    existing = set()
+    for batch in _chunked(roll_numbers, batch_size):
+        existing.update(
+            Certificate.objects.filter(roll_number__in=batch).values_list('roll_number', flat=True)
+        )
+    return existing
+
+
+def student_form_data(student, template_name):
+    """Build the form data process_certificate_request expects for a student."""
+    return {
+        'full_name': student.full_name.upper(),
+        'course': student.course,
+        'roll_number': student.roll_number,
+        'college_name': student.college_name,
+        'affiliated_name': student.affiliated_name,
+        'start_date': student.start_date,
+        'end_date': student.end_date,
+        'email': student.email,
+        'template': template_name,
+    }
+
+
+class BulkCertificateGenerator:
+    """
+    Generate certificates for Certificate_student rows.
+
+    Successfully processed students are deleted, failed ones are kept so they
+    can be retried, and students whose roll number already has a certificate
+    are skipped as duplicates.
+
+    Every chunk is committed in one transaction together with its email
+    outbox rows and its checkpoint (see chunk_done), so an interrupted run can resume after the
+    last committed chunk. Image and PDF files are written before that
+    transaction, so a queued email never goes out ahead of its attachments;
+    their names are reported to files_written first so a resumed run can
+    remove the files of a chunk that never committed.
+    """
+
+    def __init__(self, template_name, workers=None, chunk_size=None):
+        self.template_name = template_name
+        self.workers = workers or get_render_workers()
+        self.chunk_size = chunk_size or getattr(settings, 'CERTIFICATE_BULK_CHUNK_SIZE', self.workers * 8)
+        self.result = BulkResult()
+        self.lazy = lazy_rendering_enabled()
+
+    def run(self, students):
+        executor = None
+        if self.workers > 1 and not self.lazy:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_render_worker)
+        try:
+            # Walk primary keys rather than an open cursor, rows get deleted as we go
+            student_ids = list(students.order_by('pk').values_list('pk', flat=True))
+            for chunk_ids in _chunked(student_ids, self.chunk_size):
+                chunk = list(students.model.objects.filter(pk__in=chunk_ids).order_by('pk'))
+                if chunk:
+                    self.process_chunk(chunk, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.result
+
+    def process_chunk(self, students, executor=None):
+        # Step 1: skip duplicates and build the (unsaved) certificates
+        pending = []
+        taken_roll_numbers = existing_roll_numbers(student.roll_number for student in students)
+        certificate_ids = allocate_certificate_ids(len(students))
+        for student in students:
+            if student.roll_number in taken_roll_numbers:
+                logger.info(f"Certificate already exists for roll number: {student.roll_number}. Skipping.")
+                self.record(student, DUPLICATE)
+                continue
+            try:
+                certificate = build_certificate_record(
+                    student_form_data(student, self.template_name),
+                    certificate_id=certificate_ids.pop(),
+                )
+            except Exception as e:
+                logger.error(f"Error for {student.full_name}: {str(e)}")
+                self.record(student, FAILED, error=e)
+                continue
+            taken_roll_numbers.add(student.roll_number)
+            pending.append((student, certificate))
+
+        # Steps 2 and 3: render and write the files (skipped in lazy mode,
+        # images are then rendered on first access)
+        if self.lazy:
+            rendered = pending
+        else:
+            rendered = self.render_chunk(pending, executor)
+
+        # Step 4: insert certificates, queue their emails, delete students
+        # and checkpoint atomically, so a crash after the commit cannot lose
+        # the emails of a chunk a resumed run will skip
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    created = Certificate.objects.bulk_create([certificate for _, certificate in rendered])
+                    Certificate_student.objects.filter(pk__in=[student.pk for student, _ in rendered]).delete()
+                # bulk_create sends no post_save: register the new IDs with the
+                # certificate ID filter (the stamp is touched on commit)
+                register_certificate_ids([certificate.certificate_id for certificate in created])
+                for student, certificate in rendered:
+                    self.record(student, SUCCESS, certificate=certificate)
+            except IntegrityError:
+                # Another run issued one of the roll numbers (or IDs) since
+                # step 1, sort the chunk out row by row.
+                created = self.insert_one_by_one(rendered)
+            enqueue_certificate_emails(created)
+            self.chunk_done(students[-1].pk)
+
+        # Step 5: optional follow-ups that must not hold the transaction open
+        self.finish(created)
+
+    def render_chunk(self, pending, executor=None):
+        """Render the pending certificates and write their files; returns the ones that succeeded."""
+        # Step 2: render in the process pool; the plan is compiled once and
+        # shipped with each job so workers never look it up
+        plan = get_render_plan(self.template_name)
+        jobs = [(get_render_fields(certificate), plan) for _, certificate in pending]
+        if executor is not None:
+            futures = [executor.submit(_render, job) for job in jobs]
+            outcomes = [self._outcome(future.result) for future in futures]
+        else:
+            outcomes = [self._outcome(_render, job) for job in jobs]
+
+        # Step 3: write the image files, reporting them before the commit
+        rendered = []
+        for (student, certificate), (fields, _), (images, error) in zip(pending, jobs, outcomes):
+            if error is None:
+                certificate.render_fingerprint = get_render_fingerprint(fields, self.template_name, plan)
+                error = self._outcome(save_certificate_images, certificate, *images, save=False)[1]
+            if error is not None:
+                logger.error(f"Error for {student.full_name}: {str(error)}")
+                self.delete_files(certificate)
+                self.record(student, FAILED, error=error)
+                continue
+            # Generate PDF (optional); the email attaches it when missing
+            pdf_error = self._outcome(generate_certificate_pdf, certificate, save=False)[1]
+            if pdf_error is not None:
+                logger.warning(f"PDF generation failed: {pdf_error}")
+            rendered.append((student, certificate))
+        self.files_written([
+            field_file.name
+            for _, certificate in rendered
+            for field_file in self.certificate_files(certificate)
+            if field_file
+        ])
+        return rendered
+
+    def insert_one_by_one(self, rendered):
+        created = []
+        for student, certificate in rendered:
+            certificate.pk = None
+            try:
+                with transaction.atomic():
+                    certificate.save(force_insert=True)
+                    Certificate_student.objects.filter(pk=student.pk).delete()
+            except IntegrityError as e:
+                self.delete_files(certificate)
+                if Certificate.objects.filter(roll_number=student.roll_number).exists():
+                    logger.info(f"Certificate already exists for roll number: {student.roll_number}. Skipping.")
+                    self.record(student, DUPLICATE)
+                else:
+                    logger.error(f"Error for {student.full_name}: {str(e)}")
+                    self.record(student, FAILED, error=e)
+                continue
+            except Exception as e:
+                logger.error(f"Error for {student.full_name}: {str(e)}")
+                self.delete_files(certificate)
+                self.record(student, FAILED, error=e)
+                continue
+            self.record(student, SUCCESS, certificate=certificate)
+            created.append(certificate)
+        return created
+
+    @staticmethod
+    def _outcome(func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs), None
+        except Exception as e:
+            return None, e
+
+    @staticmethod
+    def certificate_files(certificate):
+        return (certificate.certificate_image, certificate.qr_code_image, certificate.certificate_pdf)
+
+    @classmethod
+    def delete_files(cls, certificate):
+        """Remove the files written for a certificate that was not created."""
+        for field_file in cls.certificate_files(certificate):
+            if field_file:
+                field_file.delete(save=False)
+
+    def finish(self, certificates):
+        """Back up a chunk's committed certificates."""
+        # bulk_create sends no post_save: forget cached "not found" lookups here
+        forget_certificates(certificates)
+
+        # Back up to Google Drive (if enabled); failures are logged by the uploader
+        if getattr(settings, 'GOOGLE_DRIVE_UPLOAD_ON_GENERATE', False) and not self.lazy:
+            DriveUploader().upload(certificates)
+
+    def record(self, student, status, certificate=None, error=None):
+        """Count the outcome of one student; subclasses may persist it."""
+        if status == SUCCESS:
+            self.result.success_count += 1
+        elif status == DUPLICATE:
+            self.result.duplicate_count += 1
+        else:
+            self.result.fail_count += 1
+
+    def files_written(self, names):
+        """Called with the storage names written for a chunk before it commits."""
+
+    def chunk_done(self, last_student_id):
+        """Called inside each chunk's transaction; subclasses checkpoint here."""
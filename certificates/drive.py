@@ -0,0 +1,317 @@
+"""
+Google Drive backups of certificate images.
+
+The service-account credentials and the Drive discovery document are loaded
+once per process; each thread gets its own Drive service on top of them
+because httplib2 connections must not be shared between threads.
+DriveUploader uploads a batch of certificates from a bounded thread pool,
+shared by the whole process so its threads keep their Drive services
+across batches, using resumable, chunked uploads and records the results
+with one bulk_update.
+
+Every upload records the SHA-256 of the uploaded image in drive_sha256;
+sync_drive_backups only uploads certificates whose image_sha256 differs
+from it, replacing the existing Drive file in place when there is one.
+
+Setting GOOGLE_DRIVE_API_ROOT points the client at another server (e.g. a
+local fake Drive for testing); without a credentials file the requests are
+then sent unauthenticated.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Certificate
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/drive.file']
+
+_lock = threading.Lock()
+_credentials = None
+_discovery_document = None
+_local = threading.local()
+_upload_pools = {}
+
+
+def get_drive_credentials():
+    """Service-account credentials, loaded once per process."""
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            credentials_file = settings.GOOGLE_DRIVE_CREDENTIALS_FILE
+            if credentials_file and os.path.exists(credentials_file):
+                from google.oauth2.service_account import Credentials
+                _credentials = Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+            elif getattr(settings, 'GOOGLE_DRIVE_API_ROOT', ''):
+                from google.auth.credentials import AnonymousCredentials
+                _credentials = AnonymousCredentials()
+            else:
+                raise FileNotFoundError("Google Drive credentials file not found")
+        return _credentials
+
+
+def get_discovery_document():
+    """The Drive v3 discovery document (bundled with the client), as JSON text."""
+    global _discovery_document
+    with _lock:
+        if _discovery_document is None:
+            from googleapiclient.discovery_cache import get_static_doc
+
+            document = json.loads(get_static_doc('drive', 'v3'))
+            api_root = getattr(settings, 'GOOGLE_DRIVE_API_ROOT', '')
+            if api_root:
+                # Media uploads are addressed from rootUrl, not from the
+                # client's api_endpoint, so rewrite the document itself
+                api_root = api_root.rstrip('/') + '/'
+                document['rootUrl'] = api_root
+                document['baseUrl'] = api_root + document['servicePath']
+                document.pop('mtlsRootUrl', None)
+            _discovery_document = json.dumps(document)
+        return _discovery_document
+
+
+def get_drive_service():
+    """The calling thread's Drive service, built on first use."""
+    service = getattr(_local, 'service', None)
+    if service is None:
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build_from_document
+        from googleapiclient.http import build_http
+
+        # build_http() stops httplib2 from treating the resumable upload's
+        # "308 Resume Incomplete" as a redirect
+        http = build_http()
+        http.timeout = getattr(settings, 'GOOGLE_DRIVE_TIMEOUT', 60)
+        service = build_from_document(
+            get_discovery_document(),
+            http=AuthorizedHttp(get_drive_credentials(), http=http),
+        )
+        _local.service = service
+    return service
+
+
+def get_upload_pool(workers):
+    """The process's upload thread pool with ``workers`` threads, started on first use."""
+    with _lock:
+        pool = _upload_pools.get(workers)
+        if pool is None:
+            pool = _upload_pools[workers] = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix='drive-upload',
+            )
+        return pool
+
+
+def reset_drive_clients():
+    """Forget cached credentials, documents and upload threads (e.g. after changing settings)."""
+    global _credentials, _discovery_document
+    with _lock:
+        _credentials = None
+        _discovery_document = None
+        pools = list(_upload_pools.values())
+        _upload_pools.clear()
+    # The pool threads hold Drive services built from the old settings
+    for pool in pools:
+        pool.shutdown()
+    _local.__dict__.clear()
+
+
+def drive_file_name(certificate_obj):
+    return f"{certificate_obj.full_name.replace(' ', '_')}.png"
+
+
+def file_sha256(field_file):
+    """SHA-256 of a stored file, read in blocks."""
+    digest = hashlib.sha256()
+    with field_file.open('rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _run_upload(request):
+    num_retries = getattr(settings, 'GOOGLE_DRIVE_NUM_RETRIES', 3)
+    response = None
+    while response is None:
+        _, response = request.next_chunk(num_retries=num_retries)
+    return response['id']
+
+
+def upload_certificate_image(certificate_obj):
+    """
+    Upload a certificate image with a resumable, chunked upload; returns the Drive file ID.
+
+    A certificate that already has a drive_file_id gets that file's content
+    replaced; a new file is created if it has none or the file is gone.
+    """
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaFileUpload
+
+    if not certificate_obj.certificate_image:
+        raise ValueError("Certificate image must be generated first")
+
+    def media():
+        return MediaFileUpload(
+            certificate_obj.certificate_image.path,
+            mimetype='image/png',
+            resumable=True,
+            chunksize=getattr(settings, 'GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE', 1024 * 1024),
+        )
+
+    files = get_drive_service().files()
+    if certificate_obj.drive_file_id:
+        try:
+            return _run_upload(files.update(
+                fileId=certificate_obj.drive_file_id,
+                body={'name': drive_file_name(certificate_obj)},
+                media_body=media(),
+                fields='id',
+            ))
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            logger.warning(f"Drive file {certificate_obj.drive_file_id} is gone, uploading a new copy")
+
+    file_metadata = {
+        'name': drive_file_name(certificate_obj),
+        'parents': [settings.GOOGLE_DRIVE_FOLDER_ID] if settings.GOOGLE_DRIVE_FOLDER_ID else []
+    }
+    return _run_upload(files.create(body=file_metadata, media_body=media(), fields='id'))
+
+
+class UploadOutcome:
+    """Result of uploading one certificate."""
+
+    def __init__(self, certificate, file_id=None, sha256='', error=None):
+        self.certificate = certificate
+        self.file_id = file_id
+        self.sha256 = sha256
+        self.error = error
+
+    @property
+    def uploaded(self):
+        return self.error is None
+
+
+class DriveUploader:
+    """
+    Upload certificates to Drive from a bounded thread pool.
+
+    Media uploads cannot be combined into Drive batch requests, so the
+    throughput comes from running GOOGLE_DRIVE_UPLOAD_WORKERS uploads at once,
+    each over its thread's own connection. Uploaders with the same number of
+    workers share one pool (see get_upload_pool).
+    """
+
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or getattr(settings, 'GOOGLE_DRIVE_UPLOAD_WORKERS', 4))
+
+    def _upload(self, certificate):
+        try:
+            # Hash what is about to be uploaded; older rows have no hash yet
+            sha256 = certificate.image_sha256 or file_sha256(certificate.certificate_image)
+            file_id = upload_certificate_image(certificate)
+        except Exception as e:
+            logger.error(f"❌ Error uploading to Google Drive: {str(e)}")
+            return UploadOutcome(certificate, error=e)
+        logger.info(f"✅ Certificate uploaded to Google Drive: {file_id}")
+        return UploadOutcome(certificate, file_id=file_id, sha256=sha256)
+
+    def upload(self, certificates):
+        """Upload the certificates and return an UploadOutcome for each, in order."""
+        certificates = list(certificates)
+        if not certificates:
+            return []
+        outcomes = list(get_upload_pool(self.workers).map(self._upload, certificates))
+
+        uploaded_at = timezone.now()
+        uploaded = []
+        for outcome in outcomes:
+            if outcome.uploaded:
+                certificate = outcome.certificate
+                certificate.drive_uploaded = True
+                certificate.drive_file_id = outcome.file_id
+                certificate.drive_uploaded_at = uploaded_at
+                certificate.drive_sha256 = outcome.sha256
+                uploaded.append(certificate)
+                if not certificate.image_sha256:
+                    # Only fill in a missing hash, a concurrent regenerate may have stored a newer one
+                    Certificate.objects.filter(pk=certificate.pk, image_sha256='').update(image_sha256=outcome.sha256)
+                    certificate.image_sha256 = outcome.sha256
+        # Only the Drive columns: image_sha256 may have changed since the rows were read
+        Certificate.objects.bulk_update(
+            uploaded,
+            ['drive_uploaded', 'drive_file_id', 'drive_uploaded_at', 'drive_sha256'],
+        )
+        return outcomes
+
+
+def backfill_image_hashes(queryset=None, batch_size=500):
+    """Hash certificate images that have no image_sha256 yet; returns the number hashed."""
+    queryset = queryset if queryset is not None else Certificate.objects.all()
+    missing = queryset.filter(image_sha256='').exclude(certificate_image='').order_by('pk')
+    hashed = 0
+    last_pk = 0
+    while True:
+        batch = list(missing.filter(pk__gt=last_pk).only('pk', 'certificate_image')[:batch_size])
+        if not batch:
+            return hashed
+        last_pk = batch[-1].pk
+        for certificate in batch:
+            try:
+                certificate.image_sha256 = file_sha256(certificate.certificate_image)
+            except OSError as e:
+                logger.warning(f"Cannot hash image of certificate {certificate.pk}: {e}")
+        Certificate.objects.bulk_update([c for c in batch if c.image_sha256], ['image_sha256'])
+        hashed += sum(1 for c in batch if c.image_sha256)
+
+
+def trust_existing_backups(queryset=None):
+    """
+    Treat Drive copies uploaded before hashes were recorded as current by
+    copying image_sha256 into drive_sha256; returns the number of rows updated.
+    """
+    queryset = queryset if queryset is not None else Certificate.objects.all()
+    return queryset.filter(drive_uploaded=True, drive_sha256='').exclude(drive_file_id='').exclude(
+        image_sha256=''
+    ).update(drive_sha256=F('image_sha256'))
+
+
+def certificates_needing_sync(queryset=None):
+    """Certificates whose image is not on Drive or differs from the uploaded copy."""
+    queryset = queryset if queryset is not None else Certificate.objects.all()
+    return queryset.exclude(certificate_image='').filter(
+        Q(drive_file_id='') | Q(image_sha256='') | ~Q(drive_sha256=F('image_sha256'))
+    )
+
+
+def sync_drive_backups(queryset=None, batch_size=200, workers=None):
+    """
+    Upload every certificate whose image changed since its last Drive upload.
+
+    Returns ``(uploaded, failed)`` counts. Rows are walked by primary key in
+    batches, so failures do not stop the sync and are retried on the next run.
+    """
+    uploader = DriveUploader(workers=workers)
+    stale = certificates_needing_sync(queryset).order_by('pk')
+    uploaded = failed = 0
+    last_pk = 0
+    while True:
+        batch = list(stale.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return uploaded, failed
+        last_pk = batch[-1].pk
+        for outcome in uploader.upload(batch):
+            if outcome.uploaded:
+                uploaded += 1
+            else:
+                failed += 1
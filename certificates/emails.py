@@ -0,0 +1,220 @@
+"""
+Certificate email bodies.
+
+The subject, plain-text and HTML bodies are compiled once at import as
+string.Template objects; building an email only substitutes the
+per-certificate fields (HTML-escaped for the HTML body). With
+CERTIFICATE_EMAIL_ATTACHMENTS disabled the email carries a signed,
+expiring download link instead of the PNG/PDF attachments.
+"""
+
+from string import Template
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils.html import escape
+
+DOWNLOAD_LINK_SALT = 'certificates.download'
+
+SUBJECT_TEMPLATE = Template("🎓 Internship Completion Certificate – ${course}")
+
+TEXT_TEMPLATE = Template("""
+Dear ${full_name},
+
+Greetings from Council for Skills and Competencies (CSC India)!
+
+We are delighted to inform you that you have successfully completed the internship program titled "${course}", organized under the guidance of CSC India.
+
+${delivery_text} You may also verify the certificate using the unique Certificate ID or through the link provided below.
+Verify your certificate at "https://verify.cscindia.org.in/".
+Certificate Details:
+• Course: ${course}
+• College: ${college_name}
+• Roll Number: ${roll_number}
+• Certificate ID: ${certificate_id}
+• Issue Date: ${issue_date}
+
+Verify your certificate here: ${verification_url}
+
+We congratulate you on this achievement and wish you continued success in your academic and professional journey.
+
+Warm regards,
+Certificate Management Team
+Council for Skills and Competencies (CSC India)
+Visakhapatnam, Andhra Pradesh, India
+
+WhatsApp: 9666500222
+Email: rammohan@cscindia.org.in
+Website: www.cscindia.org.in
+""")
+
+HTML_TEMPLATE = Template("""
+<html>
+<head>
+<style>
+    body {
+        font-family: 'Segoe UI', Tahoma, sans-serif;
+        background-color: #f9fafc;
+        color: #333;
+        padding: 30px;
+    }
+    .container {
+        background: #fff;
+        border-radius: 12px;
+        box-shadow: 0 4px 10px rgba(0,0,0,0.05);
+        max-width: 600px;
+        margin: auto;
+        padding: 30px;
+    }
+    h2 {
+        text-align: center;
+        color: #2c3e50;
+    }
+    p {
+        font-size: 15px;
+        line-height: 1.6;
+    }
+    .details-table {
+        width: 100%;
+        border-collapse: collapse;
+        margin: 20px 0;
+    }
+    .details-table th {
+        background-color: #004c97;
+        color: white;
+        padding: 10px;
+        text-align: left;
+    }
+    .details-table td {
+        padding: 10px;
+        border-bottom: 1px solid #ddd;
+    }
+    .verify-button {
+        display: block;
+        width: max-content;
+        margin: 20px auto;
+        padding: 12px 20px;
+        background-color: #28a745;
+        color: white;
+        text-decoration: none;
+        font-weight: bold;
+        border-radius: 5px;
+    }
+    .important {
+        font-size: 13px;
+        text-align: center;
+        margin-top: 30px;
+    }
+</style>
+</head>
+<body>
+<div class="container">
+    <h2>🎉 Congratulations, ${full_name}!</h2>
+
+    <p>We are pleased to inform you that you have successfully completed the internship program titled
+    <strong>"${course}"</strong>, organized under the guidance of the <strong>Council for Skills and Competencies (CSC India)</strong>.</p>
+
+    <p>${delivery_html} You may also verify the authenticity of this certificate using the Certificate ID mentioned below or by visiting the verification link provided.</p>
+		 
+    <table class="details-table">
+        <tr><th colspan="2">📋 Certificate Summary</th></tr>
+        <tr><td><strong>Full Name</strong></td><td>${full_name}</td></tr>
+        <tr><td><strong>Course</strong></td><td>${course}</td></tr>
+        <tr><td><strong>College</strong></td><td>${college_name}</td></tr>
+        <tr><td><strong>Roll Number</strong></td><td>${roll_number}</td></tr>
+        <tr><td><strong>Certificate ID</strong></td><td>${certificate_id}</td></tr>
+        <tr><td><strong>Issue Date</strong></td><td>${issue_date}</td></tr>
+    </table>
+
+    <a class="verify-button" href="${verification_url}" target="_blank">✅ Verify Certificate</a>
+
+    <div class="important">
+        Best Regards,<br>
+        <strong>Certificate Management Team</strong><br>
+        Council for Skills and Competencies (CSC India)<br>
+        Visakhapatnam, Andhra Pradesh, India<br><br>
+        <b>WhatsApp:</b> 9666500222<br>
+        <b>Email:</b> <a href="mailto:rammohan@cscindia.org.in">rammohan@cscindia.org.in</a><br>
+        <b>Website:</b> <a href="https://www.cscindia.org.in" target="_blank">www.cscindia.org.in</a><br>
+        <b>Credentials can be verified at</b> <a href="https://verify.cscindia.org.in/" target="_blank">verify.cscindia.org.in</a><br>
+    </div>
+</div>
+</body>
+</html>
+""")
+
+ATTACHED_TEXT = "Your official internship certificate is attached with this email."
+ATTACHED_HTML = "Your internship completion certificate is attached for your reference."
+
+LINK_TEXT = Template(
+    "You can download your official internship certificate from ${download_url} "
+    "(the link is valid for ${valid_days} days)."
+)
+LINK_HTML = Template(
+    'You can <a href="${download_url}" target="_blank">download your internship completion certificate here</a> '
+    '(the link is valid for ${valid_days} days).'
+)
+
+
+def attachments_enabled():
+    return getattr(settings, 'CERTIFICATE_EMAIL_ATTACHMENTS', True)
+
+
+def get_download_link_max_age():
+    """Lifetime of signed download links in seconds."""
+    return getattr(settings, 'CERTIFICATE_DOWNLOAD_LINK_MAX_AGE', 7 * 24 * 3600)
+
+
+def make_download_token(certificate_obj):
+    return signing.TimestampSigner(salt=DOWNLOAD_LINK_SALT).sign(certificate_obj.certificate_id)
+
+
+def read_download_token(token):
+    """
+    Return the certificate ID a download token was issued for.
+
+    Raises signing.SignatureExpired or signing.BadSignature for expired or
+    tampered tokens.
+    """
+    return signing.TimestampSigner(salt=DOWNLOAD_LINK_SALT).unsign(token, max_age=get_download_link_max_age())
+
+
+def get_download_url(certificate_obj):
+    base_url = getattr(settings, 'CERTIFICATE_DOWNLOAD_BASE_URL', 'https://verify.cscindia.org.in')
+    path = reverse('signed_certificate_download', args=[make_download_token(certificate_obj)])
+    return f"{base_url.rstrip('/')}{path}"
+
+
+def render_certificate_email(certificate_obj, with_attachments=None):
+    """Return (subject, text_content, html_content) for a certificate email."""
+    if with_attachments is None:
+        with_attachments = attachments_enabled()
+
+    fields = {
+        'full_name': certificate_obj.full_name,
+        'course': certificate_obj.course,
+        'college_name': certificate_obj.college_name,
+        'roll_number': certificate_obj.roll_number,
+        'certificate_id': certificate_obj.certificate_id,
+        'issue_date': certificate_obj.created_at.strftime("%d %B %Y"),
+        'verification_url': certificate_obj.verification_url,
+    }
+    html_fields = {name: escape(value) for name, value in fields.items()}
+
+    if with_attachments:
+        fields['delivery_text'] = ATTACHED_TEXT
+        html_fields['delivery_html'] = ATTACHED_HTML
+    else:
+        link = {
+            'download_url': get_download_url(certificate_obj),
+            'valid_days': max(1, get_download_link_max_age() // 86400),
+        }
+        fields['delivery_text'] = LINK_TEXT.substitute(link)
+        html_fields['delivery_html'] = LINK_HTML.substitute({name: escape(value) for name, value in link.items()})
+
+    return (
+        SUBJECT_TEMPLATE.substitute(fields),
+        TEXT_TEMPLATE.substitute(fields),
+        HTML_TEMPLATE.substitute(html_fields),
+    )
@@ -0,0 +1,106 @@
+"""
+Fonts used to draw certificates, loaded once per process.
+"""
+
+import logging
+import os
+import threading
+
+from django.conf import settings
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Font sizes used by generate_certificate, relative to CERTIFICATE_FONT_SIZE
+CERTIFICATE_FONT_SCALES = {
+    'name': 1.4,
+    'body': 1.0,
+    'small': 0.8,
+}
+
+
+class FontRegistry:
+    """
+    Process-wide registry of loaded fonts.
+
+    Each (font file, size) pair is parsed by FreeType once and reused by every
+    later render. Font families are configured with CERTIFICATE_FONT_FAMILIES
+    ({family: path}); CERTIFICATE_FONT_PATH is always available as "default".
+    """
+
+    def __init__(self):
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def families(self):
+        families = {'default': getattr(settings, "CERTIFICATE_FONT_PATH", None)}
+        families.update(getattr(settings, "CERTIFICATE_FONT_FAMILIES", {}))
+        return families
+
+    def get_path(self, family='default'):
+        families = self.families()
+        if family not in families:
+            logger.warning(f"Unknown font family '{family}', using default font")
+        return families.get(family) or families['default']
+
+    def get(self, size, family='default'):
+        """Return the font for ``family`` at ``size``, loading it on first use."""
+        return self.get_file(self.get_path(family), size)
+
+    def get_file(self, font_path, size):
+        """Return the font at ``font_path`` and ``size``, loading it on first use."""
+        key = (str(font_path), int(size))
+        font = self._fonts.get(key)
+        if font is not None:
+            return font
+
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                font = self._load(font_path, int(size))
+                self._fonts[key] = font
+        return font
+
+    def _load(self, font_path, size):
+        try:
+            if font_path and os.path.exists(font_path):
+                return ImageFont.truetype(str(font_path), size)
+            logger.warning(f"Font path not found: {font_path}. Using default PIL font.")
+        except Exception as e:
+            logger.warning(f"Font loading error for {font_path}: {e}")
+        return ImageFont.load_default()
+
+    def warm(self):
+        """Load every configured family at the sizes generate_certificate uses."""
+        base_size = settings.CERTIFICATE_FONT_SIZE
+        for family in self.families():
+            for scale in CERTIFICATE_FONT_SCALES.values():
+                self.get(int(base_size * scale), family)
+        return len(self._fonts)
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+
+
+font_registry = FontRegistry()
+
+
+def get_template_font_specs(template_name):
+    """
+    Return {role: (family, size)} for a template's "name", "body" and
+    "small" text.
+
+    CERTIFICATE_TEMPLATE_FONTS may map a template name to {role: family} to
+    give a template its own font families; unmapped roles use "default".
+    """
+    base_size = settings.CERTIFICATE_FONT_SIZE
+    template_key = template_name.lower().replace(' ', '')
+    template_families = {
+        name.lower().replace(' ', ''): families
+        for name, families in getattr(settings, "CERTIFICATE_TEMPLATE_FONTS", {}).items()
+    }.get(template_key, {})
+    return {
+        role: (template_families.get(role, 'default'), int(base_size * scale))
+        for role, scale in CERTIFICATE_FONT_SCALES.items()
+    }
@@ -0,0 +1,199 @@
+"""
+In-memory Bloom filter of issued certificate IDs.
+
+Scrapers and mistyped QR scans ask /verify/<id>/ and /api/verify/<id>/ for
+IDs that were never issued. CertificateIdFilter answers "definitely not
+issued" for those without a database query; anything the filter might
+contain goes on to the normal (cached) lookup, so responses are unchanged.
+
+The filter is built in a background thread on first use and rebuilt every
+CERTIFICATE_ID_FILTER_REBUILD_INTERVAL seconds, which also forgets deleted
+certificates. Every insert writes a new token to the
+CERTIFICATE_ID_FILTER_STAMP file once committed; before answering "not
+issued" a filter that has not seen the current token first adds the
+certificates inserted since it last looked, so IDs issued by another
+process are never rejected.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Certificate
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def normalise_certificate_id(certificate_id):
+    # Verification lookups are case-insensitive (see certificates.verification)
+    return str(certificate_id).strip().lower()
+
+
+def get_stamp_path():
+    return Path(getattr(settings, 'CERTIFICATE_ID_FILTER_STAMP', Path(settings.MEDIA_ROOT) / '.certificate_ids.stamp'))
+
+
+def read_stamp():
+    try:
+        return get_stamp_path().read_text()
+    except OSError:
+        return ''
+
+
+def touch_stamp():
+    """Write a new random token to the stamp file (atomically, mtimes are too coarse)."""
+    path = get_stamp_path()
+    temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex}")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary.write_text(uuid.uuid4().hex)
+        os.replace(temporary, path)
+    except OSError as e:
+        logger.warning(f"Could not touch certificate ID stamp {path}: {e}")
+
+
+class CertificateIdFilter:
+    """Process-wide membership filter of issued certificate IDs."""
+
+    def __init__(self):
+        self._filter = None
+        self._stamp = ''
+        self._max_pk = 0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._building = False
+
+    def enabled(self):
+        return getattr(settings, 'CERTIFICATE_ID_FILTER_ENABLED', True)
+
+    def build(self):
+        """Build a fresh filter from the database and swap it in."""
+        stamp = read_stamp()
+        count = Certificate.objects.count()
+        bloom = BloomFilter(
+            # Headroom so certificates issued until the next rebuild keep the error rate
+            max(count * 2, 10000),
+            getattr(settings, 'CERTIFICATE_ID_FILTER_ERROR_RATE', 0.001),
+        )
+        max_pk = 0
+        for pk, certificate_id in Certificate.objects.order_by().values_list('pk', 'certificate_id').iterator(
+            chunk_size=5000
+        ):
+            bloom.add(normalise_certificate_id(certificate_id))
+            max_pk = max(max_pk, pk)
+        with self._lock:
+            self._filter, self._stamp, self._max_pk, self._built_at = bloom, stamp, max_pk, time.monotonic()
+        logger.info(f"Built certificate ID filter over {bloom.count} IDs")
+        return bloom
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            logger.warning(f"Could not build certificate ID filter: {e}")
+        finally:
+            self._building = False
+            connection.close()
+
+    def _schedule_build(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build_in_background, name='certificate-id-filter', daemon=True).start()
+
+    def _catch_up(self, stamp):
+        """Add certificates inserted since the filter last looked."""
+        with self._lock:
+            max_pk = self._max_pk
+        new_rows = list(Certificate.objects.order_by().filter(pk__gt=max_pk).values_list('pk', 'certificate_id'))
+        with self._lock:
+            for pk, certificate_id in new_rows:
+                self._filter.add(normalise_certificate_id(certificate_id))
+                self._max_pk = max(self._max_pk, pk)
+            self._stamp = stamp
+
+    def add(self, certificate_ids):
+        """Register IDs issued by this process."""
+        with self._lock:
+            if self._filter is not None:
+                for certificate_id in certificate_ids:
+                    self._filter.add(normalise_certificate_id(certificate_id))
+
+    def might_be_issued(self, certificate_id):
+        """
+        False only if ``certificate_id`` was definitely never issued. Answers
+        True (fall through to the database) while the filter is being built.
+        """
+        if not self.enabled():
+            return True
+        bloom = self._filter
+        if bloom is None:
+            self._schedule_build()
+            return True
+
+        interval = getattr(settings, 'CERTIFICATE_ID_FILTER_REBUILD_INTERVAL', 3600)
+        if time.monotonic() - self._built_at > interval or bloom.count > bloom.capacity:
+            self._schedule_build()
+
+        certificate_id = normalise_certificate_id(certificate_id)
+        if certificate_id in bloom:
+            return True
+        stamp = read_stamp()
+        if stamp == self._stamp:
+            return False
+        # Someone issued certificates since, look again after adding them
+        self._catch_up(stamp)
+        return certificate_id in self._filter
+
+
+certificate_id_filter = CertificateIdFilter()
+
+
+def register_certificate_ids(certificate_ids):
+    """
+    Record newly issued certificate IDs: this process's filter learns them
+    now, other processes through the stamp once the transaction commits.
+    """
+    certificate_id_filter.add(certificate_ids)
+    transaction.on_commit(touch_stamp)
+
+
+def register_saved_certificate(instance, created=False, **kwargs):
+    """Signal handler for Certificate post_save."""
+    if created:
+        register_certificate_ids([instance.certificate_id])
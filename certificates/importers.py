@@ -0,0 +1,276 @@
+"""
+Import of uploaded student Excel sheets into Certificate_student.
+
+Rows are streamed from the workbook in read-only mode into DataFrames of
+STUDENT_IMPORT_FRAME_ROWS rows, each validated and normalised a whole
+column at a time with pandas, so only the clean rows of the sheet are kept
+in memory. Once the whole file has been validated the clean rows are
+written with bulk_create one chunk at a time.
+"""
+
+import logging
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from openpyxl import load_workbook
+
+from .models import Certificate_student
+
+logger = logging.getLogger(__name__)
+
+# Sheet header -> Certificate_student field
+COLUMN_MAP = {
+    'Name': 'full_name',
+    'Course': 'course',
+    'Roll No': 'roll_number',
+    'College Name': 'college_name',
+    'Affiliated Name': 'affiliated_name',
+    'Start Date': 'start_date',
+    'End Date': 'end_date',
+    'Email': 'email',
+    'Contact': 'contact',
+    'Gender': 'gender',
+}
+
+REQUIRED_COLUMNS = [
+    'Name', 'Course', 'Roll No', 'College Name', 'Affiliated Name', 'Start Date', 'End Date', 'Email',
+]
+
+DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y']
+
+
+class InvalidSheet(ValueError):
+    """The uploaded file cannot be imported at all (e.g. missing columns)."""
+
+
+class ImportReport:
+    """
+    Inserted/skipped counts of an import, per chunk and in total, and the
+    rows validation rejected (``errors``, see validate_student_frame).
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.errors = []
+
+    def add_chunk(self, inserted, skipped):
+        self.chunks.append({'inserted': inserted, 'skipped': skipped})
+
+    @property
+    def inserted(self):
+        return sum(chunk['inserted'] for chunk in self.chunks)
+
+    @property
+    def skipped(self):
+        return sum(chunk['skipped'] for chunk in self.chunks)
+
+    @property
+    def invalid(self):
+        return len(self.errors)
+
+    def __str__(self):
+        return f"{self.inserted} inserted, {self.skipped} skipped, {self.invalid} invalid"
+
+
+def iter_sheet_rows(path):
+    """
+    Yield (excel_row_number, {header: value}) for every non-empty data row of
+    the first worksheet, reading the workbook in read-only mode.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise InvalidSheet("The Excel file is empty.")
+        header = [str(cell).strip() if cell is not None else '' for cell in header]
+
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            raise InvalidSheet(f"Missing required columns: {', '.join(missing)}")
+
+        for row_number, values in enumerate(rows, start=2):
+            if all(value is None or str(value).strip() == '' for value in values):
+                continue
+            yield row_number, {
+                column: value for column, value in zip(header, values) if column in COLUMN_MAP
+            }
+    finally:
+        workbook.close()
+
+
+# Loose syntax check; the address is only used as an email recipient
+EMAIL_PATTERN = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+# Letters, spaces, hyphens, apostrophes and periods, as CertificateForm.clean_full_name
+NAME_PATTERN = r"(?:[^\W\d_]|[\s'\-.])+"
+
+# Minimum lengths enforced by CertificateForm.clean_*
+MIN_LENGTHS = {'Name': 2, 'Course': 2, 'College Name': 2, 'Roll No': 3}
+
+
+def student_frame(rows):
+    """A DataFrame of (row_number, values) pairs from iter_sheet_rows, indexed by Excel row number."""
+    return pd.DataFrame(
+        [values for _, values in rows],
+        index=pd.Index([row_number for row_number, _ in rows], name='row'),
+        columns=list(COLUMN_MAP),
+        dtype=object,
+    )
+
+
+def iter_student_frames(path, rows_per_frame):
+    """Yield the sheet as DataFrames (see student_frame) of up to ``rows_per_frame`` rows."""
+    rows = []
+    for row in iter_sheet_rows(path):
+        rows.append(row)
+        if len(rows) >= rows_per_frame:
+            yield student_frame(rows)
+            rows = []
+    if rows:
+        yield student_frame(rows)
+
+
+def _text_column(column):
+    """Cell values as stripped strings; whole-number floats lose their ".0"."""
+    text = column.astype('string').fillna('').str.strip()
+    numbers = pd.to_numeric(column, errors='coerce')
+    whole = numbers.notna() & (numbers % 1 == 0)
+    return text.where(~whole, text.str.replace(r'\.0+$', '', regex=True))
+
+
+def _date_column(text):
+    """Parse a text column trying each of DATE_FORMATS; unparseable values are NaT."""
+    text = text.str[:10]
+    parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        parsed = parsed.fillna(pd.to_datetime(text, format=date_format, errors='coerce'))
+    return parsed
+
+
+def validate_student_frame(frame, seen_rolls=None):
+    """
+    Validate and normalise a sheet DataFrame one column at a time.
+
+    Returns ``(valid, errors)``: ``valid`` holds the clean rows keyed by
+    Certificate_student field name, ``errors`` is a sorted list of
+    ``(row_number, message)`` for every rejected row. Normalisation matches
+    CertificateForm: names are title-cased, roll numbers upper-cased and
+    emails lower-cased. A roll number repeated within the file is rejected
+    on every row after its first occurrence; pass the same ``seen_rolls``
+    dict (roll number -> first row) for every frame of a file so repeats
+    across frames are caught too.
+    """
+    if seen_rolls is None:
+        seen_rolls = {}
+    text = pd.DataFrame({column: _text_column(frame[column]) for column in COLUMN_MAP}, index=frame.index)
+    problems = []
+
+    for column in REQUIRED_COLUMNS:
+        problems.append((text[column].eq(''), f"{column} is required"))
+    for column, length in MIN_LENGTHS.items():
+        short = text[column].ne('') & text[column].str.len().lt(length)
+        problems.append((short, f"{column} must be at least {length} characters long"))
+
+    text['Name'] = text['Name'].str.title()
+    text['Roll No'] = text['Roll No'].str.upper()
+    text['Email'] = text['Email'].str.lower()
+
+    bad_name = text['Name'].ne('') & ~text['Name'].str.fullmatch(NAME_PATTERN)
+    problems.append((bad_name, "Name can only contain letters, spaces, hyphens, apostrophes, and periods"))
+    bad_email = text['Email'].ne('') & ~text['Email'].str.fullmatch(EMAIL_PATTERN)
+    problems.append((bad_email, "Email is not a valid address"))
+
+    dates = {}
+    for column in ('Start Date', 'End Date'):
+        dates[column] = _date_column(text[column])
+        bad_date = text[column].ne('') & dates[column].isna()
+        problems.append((bad_date, f"{column}: invalid date"))
+    reversed_dates = dates['End Date'].lt(dates['Start Date'])
+    problems.append((reversed_dates, "End Date is before Start Date"))
+
+    rolls = text['Roll No']
+    earlier = rolls.map(seen_rolls)
+    repeated = rolls.ne('') & (rolls.duplicated(keep='first') | earlier.notna())
+    first_rows = earlier.fillna(pd.Series(text.index, index=text.index).groupby(rolls).transform('first'))
+    for roll_number, row_number in zip(rolls, text.index):
+        if roll_number:
+            seen_rolls.setdefault(roll_number, row_number)
+
+    messages = {}
+    for mask, message in problems:
+        for row_number in text.index[mask]:
+            messages.setdefault(row_number, []).append(message)
+    for row_number in text.index[repeated]:
+        messages.setdefault(row_number, []).append(f"Roll No repeats row {int(first_rows[row_number])}")
+
+    valid = text.loc[~text.index.isin(list(messages))].rename(columns=COLUMN_MAP)
+    for column in ('Start Date', 'End Date'):
+        valid[COLUMN_MAP[column]] = dates[column][valid.index].dt.date
+    valid['contact'] = valid['contact'].replace('', 'NONE')
+    valid['gender'] = valid['gender'].replace('', 'NONE')
+
+    errors = [(row_number, '; '.join(messages[row_number])) for row_number in sorted(messages)]
+    return valid, errors
+
+
+def validate_student_sheet(path, rows_per_frame=None):
+    """
+    Validate a whole sheet without touching the database.
+
+    The sheet is read ``rows_per_frame`` rows (STUDENT_IMPORT_FRAME_ROWS) at
+    a time and each frame is validated with validate_student_frame, sharing
+    the roll numbers seen so far. Returns ``(valid, errors)`` like
+    validate_student_frame, for the whole file.
+    """
+    rows_per_frame = rows_per_frame or getattr(settings, 'STUDENT_IMPORT_FRAME_ROWS', 10000)
+    seen_rolls = {}
+    valid_frames = []
+    errors = []
+    for frame in iter_student_frames(path, rows_per_frame):
+        valid, frame_errors = validate_student_frame(frame, seen_rolls)
+        valid_frames.append(valid)
+        errors.extend(frame_errors)
+    if not valid_frames:
+        return validate_student_frame(student_frame([]))[0], errors
+    return pd.concat(valid_frames), errors
+
+
+def import_student_sheet(path, chunk_size=None, rows_per_frame=None):
+    """
+    Import an uploaded sheet into Certificate_student.
+
+    The whole sheet is validated first (see validate_student_sheet); rows
+    that fail are counted as invalid and listed in ``report.errors``. Only
+    then are the valid rows written: those whose roll number is already
+    waiting in Certificate_student are skipped, the rest are written with
+    bulk_create one chunk at a time, each chunk inside its own transaction.
+    """
+    chunk_size = chunk_size or getattr(settings, 'STUDENT_IMPORT_CHUNK_SIZE', 500)
+    report = ImportReport()
+
+    valid, report.errors = validate_student_sheet(path, rows_per_frame)
+    records = valid.to_dict('records')
+    for start in range(0, len(records), chunk_size):
+        _import_chunk(records[start:start + chunk_size], report)
+
+    logger.info(f"Imported {path}: {report}")
+    return report
+
+
+def _import_chunk(records, report):
+    waiting = set(
+        Certificate_student.objects.filter(
+            roll_number__in=[record['roll_number'] for record in records]
+        ).values_list('roll_number', flat=True)
+    )
+    new_students = [
+        Certificate_student(**record) for record in records if record['roll_number'] not in waiting
+    ]
+
+    with transaction.atomic():
+        Certificate_student.objects.bulk_create(new_students)
+
+    report.add_chunk(
+        inserted=len(new_students),
+        skipped=len(records) - len(new_students),
+    )
@@ -0,0 +1,187 @@
+"""
+Background jobs for bulk certificate generation.
+
+The bulk generation page only enqueues a CertificateJob; the
+``run_certificate_jobs`` management command claims queued jobs from the
+database and runs them with BulkCertificateGenerator, checkpointing
+counters, per-row results and a cursor with every committed chunk so the
+page can poll for progress and a job interrupted by a crash resumes after
+its last committed chunk.
+"""
+
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Max
+from django.utils import timezone
+
+from .bulk import BulkCertificateGenerator
+from .models import Certificate, Certificate_student, CertificateJob, CertificateJobResult
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_bulk_job(template_name, user=None):
+    """Queue a job for every Certificate_student row uploaded so far."""
+    students = Certificate_student.objects.all()
+    return CertificateJob.objects.create(
+        template_name=template_name,
+        max_student_id=students.aggregate(max_id=Max('pk'))['max_id'],
+        total_count=students.count(),
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def claim_next_job(worker_name=None, stale_after=None):
+    """
+    Atomically claim a job and return it, or None if there is nothing to do.
+
+    Running jobs whose worker has not sent a heartbeat for ``stale_after``
+    seconds (CERTIFICATE_JOB_STALE_AFTER) are taken over first so they resume
+    where they stopped; otherwise the oldest queued job is started. The
+    conditional UPDATE only succeeds for one worker, so several workers can
+    poll the same database without running a job twice.
+    """
+    worker_name = worker_name or get_worker_name()
+    if stale_after is None:
+        stale_after = getattr(settings, 'CERTIFICATE_JOB_STALE_AFTER', 600)
+    now = timezone.now()
+
+    stale = CertificateJob.objects.filter(
+        status=CertificateJob.STATUS_RUNNING,
+        heartbeat_at__lt=now - timedelta(seconds=stale_after),
+    ).order_by('created_at', 'pk')
+    for job_id, heartbeat_at in stale.values_list('pk', 'heartbeat_at')[:10]:
+        claimed = CertificateJob.objects.filter(
+            pk=job_id, status=CertificateJob.STATUS_RUNNING, heartbeat_at=heartbeat_at
+        ).update(worker=worker_name, heartbeat_at=now)
+        if claimed:
+            logger.info(f"Resuming stale certificate job {job_id}")
+            return CertificateJob.objects.get(pk=job_id)
+
+    queued = CertificateJob.objects.filter(status=CertificateJob.STATUS_QUEUED).order_by('created_at', 'pk')
+    for job_id in queued.values_list('pk', flat=True)[:10]:
+        claimed = CertificateJob.objects.filter(pk=job_id, status=CertificateJob.STATUS_QUEUED).update(
+            status=CertificateJob.STATUS_RUNNING,
+            worker=worker_name,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return CertificateJob.objects.get(pk=job_id)
+    return None
+
+
+def cleanup_pending_files(job):
+    """
+    Delete media written by a chunk that never committed.
+
+    Files still referenced by a certificate are kept, whatever the checkpoint
+    says. Returns the number of files removed.
+    """
+    names = [name for name in job.pending_files if name]
+    removed = 0
+    if names:
+        referenced = set(
+            Certificate.objects.filter(certificate_image__in=names).values_list('certificate_image', flat=True)
+        ) | set(
+            Certificate.objects.filter(qr_code_image__in=names).values_list('qr_code_image', flat=True)
+        ) | set(
+            Certificate.objects.filter(certificate_pdf__in=names).values_list('certificate_pdf', flat=True)
+        )
+        for name in names:
+            if name in referenced or not default_storage.exists(name):
+                continue
+            default_storage.delete(name)
+            removed += 1
+        logger.info(f"Removed {removed} orphaned files of certificate job {job.pk}")
+    job.pending_files = []
+    CertificateJob.objects.filter(pk=job.pk).update(pending_files=[])
+    return removed
+
+
+class JobCertificateGenerator(BulkCertificateGenerator):
+    """BulkCertificateGenerator that records its progress on a CertificateJob."""
+
+    def __init__(self, job, **kwargs):
+        super().__init__(job.template_name, **kwargs)
+        self.job = job
+        self.pending_results = []
+        # Continue the counters of a resumed job
+        self.result.success_count = job.success_count
+        self.result.fail_count = job.fail_count
+        self.result.duplicate_count = job.duplicate_count
+
+    def record(self, student, status, certificate=None, error=None):
+        super().record(student, status, certificate=certificate, error=error)
+        self.pending_results.append(CertificateJobResult(
+            job=self.job,
+            student_id=student.pk,
+            full_name=student.full_name,
+            roll_number=student.roll_number,
+            status=status,
+            certificate=certificate,
+            message=str(error) if error else '',
+        ))
+
+    def files_written(self, names):
+        # Committed on its own, before the chunk's transaction starts
+        self.job.pending_files = names
+        CertificateJob.objects.filter(pk=self.job.pk).update(pending_files=names, heartbeat_at=timezone.now())
+
+    def chunk_done(self, last_student_id):
+        CertificateJobResult.objects.bulk_create(self.pending_results)
+        self.pending_results = []
+        self.job.cursor = last_student_id
+        self.job.pending_files = []
+        CertificateJob.objects.filter(pk=self.job.pk).update(
+            cursor=last_student_id,
+            pending_files=[],
+            success_count=self.result.success_count,
+            fail_count=self.result.fail_count,
+            duplicate_count=self.result.duplicate_count,
+            heartbeat_at=timezone.now(),
+        )
+
+
+def run_job(job, workers=None):
+    """
+    Run a claimed job to completion and store its final state.
+
+    A job that was interrupted first has the files of its uncommitted chunk
+    removed and then continues after its last committed chunk.
+    """
+    cleanup_pending_files(job)
+
+    students = Certificate_student.objects.filter(pk__gt=job.cursor)
+    if job.max_student_id is not None:
+        students = students.filter(pk__lte=job.max_student_id)
+    else:
+        students = students.none()
+
+    generator = JobCertificateGenerator(job, workers=workers)
+    try:
+        result = generator.run(students)
+    except Exception as e:
+        logger.error(f"Certificate job {job.pk} failed: {str(e)}")
+        job.status = CertificateJob.STATUS_FAILED
+        job.error = str(e)
+        # The interrupted chunk rolled back; drop what it wrote
+        job.refresh_from_db(fields=['pending_files'])
+        cleanup_pending_files(job)
+    else:
+        logger.info(f"Certificate job {job.pk} finished: {result}")
+        job.status = CertificateJob.STATUS_COMPLETED
+
+    job.refresh_from_db(fields=['cursor', 'success_count', 'fail_count', 'duplicate_count'])
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
@@ -0,0 +1,243 @@
+"""
+Certificate layouts compiled into immutable render plans.
+
+A RenderPlan holds everything render_certificate needs besides the
+certificate's own fields: the background image, every text box with its
+resolved font, position and alignment, and the QR box. Plans come from the
+active CertificateTemplate row with a matching name or, when there is none,
+from the built-in layout of the image templates in media/templates.
+
+Compiled plans are cached per process. At most every
+CERTIFICATE_RENDER_PLAN_CHECK_INTERVAL seconds a lookup reads the number of
+CertificateTemplate rows and their latest updated_at (one aggregate query)
+and drops the cached plans when that changed, so a template edited in the
+admin is picked up by every process, including the job and outbox workers,
+within that interval. Saving or deleting a CertificateTemplate also clears
+this process's cache right away.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+from django.conf import settings
+
+from .fonts import font_registry, get_template_font_specs
+from .template_images import get_template_path
+
+ALIGN_LEFT = 'left'
+ALIGN_CENTER = 'center'
+ALIGN_RIGHT = 'right'
+
+DATE_FORMAT = "%d-%m-%Y"
+
+# Where the image templates have room for the QR code: the blank area below
+# the tagline. With its 4-module quiet zone and 2 px per module, this box
+# holds a plain verification URL at error correction H and a signed one
+# (see certificates.qrtoken) at M.
+DEFAULT_QR_BOX = (955, 246, 130, 130)
+
+
+@dataclass(frozen=True)
+class TextBox:
+    """
+    One piece of text drawn on a certificate.
+
+    ``field`` names a value of get_render_fields(); static text uses
+    ``text`` instead. Centred and right-aligned text is placed within
+    ``x``..``x + width`` (a width of 0 centres on / aligns to ``x``).
+    """
+    field: str
+    x: int
+    y: int
+    font_path: str
+    font_size: int
+    align: str = ALIGN_LEFT
+    width: int = 0
+    fill: str = 'black'
+    date_format: str = ''
+    text: str = ''
+
+    def get_text(self, fields):
+        if not self.field:
+            return self.text
+        value = fields[self.field]
+        if self.date_format:
+            return value.strftime(self.date_format)
+        return str(value)
+
+
+@dataclass(frozen=True)
+class QRBox:
+    """Where the verification QR code goes, in template pixels."""
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+@dataclass(frozen=True)
+class RenderPlan:
+    template_name: str
+    background_path: str
+    texts: tuple
+    qr: QRBox
+    source: str = 'builtin'
+
+    @property
+    def digest(self):
+        """Stable hash of the plan, part of a certificate's render fingerprint."""
+        return plan_digest(self)
+
+
+@lru_cache(maxsize=128)
+def plan_digest(plan):
+    return hashlib.sha256(json.dumps(asdict(plan), sort_keys=True, default=str).encode()).hexdigest()
+
+
+def normalise_template_name(template_name):
+    return template_name.lower().replace(' ', '')
+
+
+def build_default_plan(template_name):
+    """The layout of the image templates in media/templates (the original hardcoded one)."""
+    fonts = {
+        role: (str(font_registry.get_path(family)), size)
+        for role, (family, size) in get_template_font_specs(template_name).items()
+    }
+    body = fonts['body']
+    small = fonts['small']
+
+    def centred(field, y, x_start, x_end, font=body, **kwargs):
+        return TextBox(field, x_start, y, *font, align=ALIGN_CENTER, width=x_end - x_start, **kwargs)
+
+    texts = (
+        centred('full_name', 375, 460, 1080),
+        centred('college_name', 415, 245, 1065),
+        centred('affiliated_name', 462, 290, 670),
+        centred('roll_number', 458, 915, 1080),
+        centred('course', 512, 690, 1130),
+        centred('start_date', 605, 600, 830, date_format=DATE_FORMAT),
+        centred('end_date', 605, 910, 1130, date_format=DATE_FORMAT),
+        TextBox('certificate_id', 296, 665, *small),
+        TextBox('created_at', 229, 700, *small, date_format=DATE_FORMAT),
+        centred('', 805, 292, 1080, font=small, text="Verify at https://verify.cscindia.org.in/"),
+    )
+    return RenderPlan(
+        template_name=template_name,
+        background_path=str(get_template_path(template_name)),
+        texts=texts,
+        qr=QRBox(*DEFAULT_QR_BOX),
+    )
+
+
+# CertificateTemplate coordinate fields -> render field drawn there
+TEMPLATE_FIELD_COORDINATES = [
+    ('full_name', 'name_x', 'name_y'),
+    ('course', 'course_x', 'course_y'),
+    ('college_name', 'college_x', 'college_y'),
+    ('roll_number', 'roll_x', 'roll_y'),
+    ('certificate_id', 'cert_id_x', 'cert_id_y'),
+    ('created_at', 'date_x', 'date_y'),
+]
+
+
+def compile_template(template):
+    """Compile a CertificateTemplate row into a RenderPlan."""
+    font_path = str(font_registry.get_path('default'))
+    texts = tuple(
+        TextBox(
+            field,
+            getattr(template, x_field),
+            getattr(template, y_field),
+            font_path,
+            template.font_size,
+            align=template.text_align,
+            fill=template.font_color,
+            date_format=DATE_FORMAT if field == 'created_at' else '',
+        )
+        for field, x_field, y_field in TEMPLATE_FIELD_COORDINATES
+    )
+    return RenderPlan(
+        template_name=template.name,
+        background_path=template.template_image.path,
+        texts=texts,
+        qr=QRBox(template.qr_x, template.qr_y, template.qr_size, template.qr_size),
+        source=f"CertificateTemplate:{template.pk}:{template.updated_at.isoformat()}",
+    )
+
+
+class RenderPlanCache:
+    """Process-wide cache of compiled plans keyed by normalised template name."""
+
+    def __init__(self):
+        self._plans = {}
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_signature():
+        """Changes whenever a CertificateTemplate is added, edited or deleted."""
+        from django.db.models import Count, Max
+
+        from .models import CertificateTemplate
+
+        summary = CertificateTemplate.objects.aggregate(count=Count('pk'), latest=Max('updated_at'))
+        return summary['count'], summary['latest']
+
+    def check_due(self, now):
+        interval = getattr(settings, 'CERTIFICATE_RENDER_PLAN_CHECK_INTERVAL', 5)
+        with self._lock:
+            return self._checked_at is None or now - self._checked_at >= interval
+
+    def get(self, template_name):
+        key = normalise_template_name(template_name)
+        now = time.monotonic()
+        if self.check_due(now):
+            signature = self.get_signature()
+            with self._lock:
+                if signature != self._signature:
+                    self._plans.clear()
+                    self._signature = signature
+                self._checked_at = now
+        with self._lock:
+            plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        plan = self._compile(template_name)
+        with self._lock:
+            self._plans[key] = plan
+        return plan
+
+    def _compile(self, template_name):
+        from .models import CertificateTemplate
+
+        key = normalise_template_name(template_name)
+        for template in CertificateTemplate.objects.filter(is_active=True).order_by('-updated_at'):
+            if normalise_template_name(template.name) == key and template.template_image:
+                return compile_template(template)
+        return build_default_plan(template_name)
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+            self._signature = None
+            self._checked_at = None
+
+
+plan_cache = RenderPlanCache()
+
+
+def get_render_plan(template_name):
+    """The compiled RenderPlan for a template name."""
+    return plan_cache.get(template_name)
+
+
+def invalidate_render_plans(**kwargs):
+    """Signal handler: drop this process's compiled plans (others notice on their next lookup)."""
+    plan_cache.clear()
@@ -0,0 +1,140 @@
+"""
+Batched delivery of certificate emails over one reused SMTP connection.
+
+send_certificate_email opens (and logs in to) a new connection for every
+message. CertificateMailer keeps one connection open for a whole batch,
+reconnects when the server drops it, and throttles to
+CERTIFICATE_EMAIL_RATE_PER_MINUTE so large campaigns stay under the
+provider's sending limits.
+"""
+
+import logging
+import smtplib
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.utils import timezone
+
+from .models import Certificate
+from .utils import build_certificate_email
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection (not the message) is broken; the message
+# is retried once on a fresh connection.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class MailOutcome:
+    """Result of sending one certificate email."""
+
+    def __init__(self, certificate, error=None):
+        self.certificate = certificate
+        self.error = error
+
+    @property
+    def sent(self):
+        return self.error is None
+
+
+class CertificateMailer:
+    """
+    Send certificate emails over a single reused connection.
+
+    Use one mailer per worker (thread or process); it is not thread-safe.
+    Can be used as a context manager so the connection is closed at the end.
+    """
+
+    def __init__(self, rate_per_minute=None, connection=None):
+        if rate_per_minute is None:
+            rate_per_minute = getattr(settings, 'CERTIFICATE_EMAIL_RATE_PER_MINUTE', 0)
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0
+        self._next_send = 0.0
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+        self.connection.open()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception as e:
+                logger.warning(f"Error closing mail connection: {e}")
+
+    def reconnect(self):
+        self.close()
+        self.connection = None
+        return self.open()
+
+    def _throttle(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next_send:
+            time.sleep(self._next_send - now)
+            now = self._next_send
+        self._next_send = now + self.interval
+
+    def send_message(self, message):
+        """Send one prepared EmailMessage, reconnecting once if the connection dropped."""
+        self._throttle()
+        connection = self.open()
+        try:
+            sent = connection.send_messages([message])
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"Mail connection lost ({e}), reconnecting")
+            sent = self.reconnect().send_messages([message])
+        if not sent:
+            raise smtplib.SMTPException("Message was not accepted for delivery")
+
+    def send_certificates(self, certificates, update=True):
+        """
+        Email every certificate and return a MailOutcome per certificate.
+
+        With ``update`` the certificates that were sent are flagged with
+        email_sent/email_sent_at in one UPDATE query.
+        """
+        outcomes = []
+        for certificate in certificates:
+            try:
+                self.send_message(build_certificate_email(certificate))
+            except Exception as e:
+                logger.error(f"❌ Error sending certificate email to {certificate.email}: {str(e)}")
+                outcomes.append(MailOutcome(certificate, e))
+                continue
+            logger.info(f"✅ Certificate email sent successfully to {certificate.email}")
+            outcomes.append(MailOutcome(certificate))
+
+        if update:
+            mark_email_sent([outcome.certificate for outcome in outcomes if outcome.sent])
+        return outcomes
+
+
+def mark_email_sent(certificates):
+    """Flag certificates as emailed with a single UPDATE."""
+    if not certificates:
+        return
+    sent_at = timezone.now()
+    Certificate.objects.filter(pk__in=[certificate.pk for certificate in certificates]).update(
+        email_sent=True, email_sent_at=sent_at
+    )
+    for certificate in certificates:
+        certificate.email_sent = True
+        certificate.email_sent_at = sent_at
+
+
+def send_certificate_emails(certificates, rate_per_minute=None):
+    """Send a batch of certificate emails over one connection; returns MailOutcomes."""
+    with CertificateMailer(rate_per_minute=rate_per_minute) as mailer:
+        return mailer.send_certificates(certificates)
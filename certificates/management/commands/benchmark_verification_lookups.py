@@ -0,0 +1,137 @@
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import setup_databases, teardown_databases
+
+from certificates.models import Certificate
+from certificates.verification import LOOKUP_FIELDS, find_certificates
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the verification lookups against a growing number of synthetic certificates. "
+        "The rows go to a throwaway test database unless --database names another "
+        "configured alias, and are inserted in a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=500000,
+            help='Certificates to insert in total',
+        )
+        parser.add_argument(
+            '--lookups',
+            type=int,
+            default=2000,
+            help='Lookups timed per method at each size',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk_create',
+        )
+        parser.add_argument(
+            '--database',
+            help='A migrated scratch database alias to benchmark against instead of a throwaway '
+                 'test database. The default database is refused.',
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+        if database is None:
+            # Same as the test runner: the default alias points at test_<NAME>
+            # until teardown, the live database is never touched
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS})
+            try:
+                self.benchmark(DEFAULT_DB_ALIAS, options)
+            finally:
+                teardown_databases(old_config, verbosity=0)
+            return
+        if database == DEFAULT_DB_ALIAS:
+            raise CommandError(
+                "Refusing to insert synthetic certificates into the default database; "
+                "leave out --database to use a throwaway one"
+            )
+        if database not in connections:
+            raise CommandError(f"Unknown database alias {database!r}")
+        self.benchmark(database, options)
+
+    def benchmark(self, database, options):
+        self.database = database
+        rows = options['rows']
+        checkpoints = sorted({size for size in (1000, 10000, 100000, rows) if size <= rows})
+        try:
+            with transaction.atomic(using=database):
+                inserted = 0
+                for checkpoint in checkpoints:
+                    while inserted < checkpoint:
+                        count = min(options['batch_size'], checkpoint - inserted)
+                        Certificate.objects.using(database).bulk_create(
+                            [self.synthetic(i) for i in range(inserted, inserted + count)]
+                        )
+                        inserted += count
+                    self.report(inserted, options['lookups'])
+                self.explain()
+                self.compare_iexact(inserted)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Rolled back the synthetic certificates")
+
+    def synthetic(self, i):
+        return Certificate(
+            certificate_id=f"BENCH-{i:010d}",
+            full_name=f"Bench Student {i}",
+            college_name="Bench College",
+            affiliated_name="Bench University",
+            roll_number=f"BENCH{i:010d}",
+            course="Benchmark",
+            email=f"bench.student{i}@example.com",
+            start_date=date(2024, 1, 1),
+            end_date=date(2024, 3, 1),
+            verification_url=f"https://example.com/verify/BENCH-{i:010d}/",
+            is_verified=True,
+        )
+
+    def lookup_values(self, i):
+        # Mixed case on purpose, the lookups are case-insensitive
+        return {
+            'certificate_id': f"bench-{i:010d}",
+            'email': f"Bench.Student{i}@Example.com",
+            'roll_number': f"bench{i:010d}",
+        }
+
+    def report(self, size, lookups):
+        samples = [self.lookup_values(random.randrange(size)) for _ in range(lookups)]
+        timings = []
+        for method in LOOKUP_FIELDS:
+            start = time.perf_counter()
+            for values in samples:
+                if find_certificates(method, values[method]).using(self.database).first() is None:
+                    raise AssertionError(f"{method} lookup found nothing for {values[method]}")
+            timings.append(f"{method} {(time.perf_counter() - start) / lookups * 1e6:.0f} us")
+        self.stdout.write(f"{size:>9} rows: " + ", ".join(timings))
+
+    def explain(self):
+        values = self.lookup_values(0)
+        for method in LOOKUP_FIELDS:
+            plan = find_certificates(method, values[method]).using(self.database).explain()
+            self.stdout.write(f"{method} plan: {' | '.join(plan.splitlines())}")
+
+    def compare_iexact(self, size, lookups=5):
+        start = time.perf_counter()
+        for _ in range(lookups):
+            value = self.lookup_values(random.randrange(size))['email']
+            Certificate.objects.using(self.database).filter(email__iexact=value, is_verified=True).first()
+        self.stdout.write(
+            f"email__iexact (before): {(time.perf_counter() - start) / lookups * 1e6:.0f} us per lookup"
+        )
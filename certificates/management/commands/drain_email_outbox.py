@@ -0,0 +1,47 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from certificates.mailer import CertificateMailer
+from certificates.outbox import drain_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Deliver queued certificate emails from the outbox, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Send the messages that are due and exit instead of polling for new ones',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when nothing is due',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Messages claimed per batch (default: CERTIFICATE_EMAIL_BATCH_SIZE)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Email outbox worker started")
+
+        with CertificateMailer() as mailer:
+            while True:
+                result = drain_outbox(options['batch_size'], mailer=mailer)
+                if result.processed_count:
+                    self.stdout.write(f"Outbox batch: {result}")
+                    continue
+                if options['once']:
+                    break
+                # Do not keep an idle SMTP session open between polls
+                mailer.close()
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the Ed25519 key that signs the tokens in certificate QR codes. "
+        "Point CERTIFICATE_QR_SIGNING_KEY_FILE at the private key; the public key is "
+        "published at /api/verify/public-key/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Where to write the private key (PEM)')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Overwrite an existing key (tokens signed with it stop verifying)',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if path.exists() and not options['force']:
+            raise CommandError(f"{path} exists, pass --force to replace it")
+
+        key = Ed25519PrivateKey.generate()
+        path.write_bytes(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+        path.chmod(0o600)
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
+        self.stdout.write(public_pem.decode())
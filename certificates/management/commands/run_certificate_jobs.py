@@ -0,0 +1,57 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from certificates.jobs import claim_next_job, get_worker_name, run_job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Claim queued bulk certificate jobs from the database and run them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the queued jobs and exit instead of polling for new ones',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=None,
+            help='Seconds without a heartbeat before a running job is resumed '
+                 '(default: CERTIFICATE_JOB_STALE_AFTER)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Render processes per job (default: CERTIFICATE_RENDER_WORKERS)',
+        )
+
+    def handle(self, *args, **options):
+        worker_name = get_worker_name()
+        self.stdout.write(f"Certificate job worker {worker_name} started")
+
+        while True:
+            job = claim_next_job(worker_name, stale_after=options['stale_after'])
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Running job #{job.pk} ({job.template_name}, {job.total_count} rows)")
+            job = run_job(job, workers=options['workers'])
+            self.stdout.write(
+                f"Job #{job.pk} {job.status}: {job.success_count} generated, "
+                f"{job.fail_count} failed, {job.duplicate_count} duplicates"
+            )
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from certificates.drive import (
+    backfill_image_hashes,
+    certificates_needing_sync,
+    sync_drive_backups,
+    trust_existing_backups,
+)
+
+
+class Command(BaseCommand):
+    help = "Upload certificates whose image changed since their last Google Drive backup"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Certificates uploaded per batch',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Parallel uploads (default: GOOGLE_DRIVE_UPLOAD_WORKERS)',
+        )
+        parser.add_argument(
+            '--trust-existing',
+            action='store_true',
+            help='Treat Drive copies uploaded before hashes were recorded as up to date '
+                 'instead of uploading them again',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many certificates would be uploaded',
+        )
+
+    def handle(self, *args, **options):
+        hashed = backfill_image_hashes()
+        if hashed:
+            self.stdout.write(f"Hashed {hashed} certificate images")
+        if options['trust_existing']:
+            self.stdout.write(f"Trusted {trust_existing_backups()} existing Drive copies")
+
+        pending = certificates_needing_sync().count()
+        self.stdout.write(f"{pending} certificates need uploading")
+        if options['dry_run'] or not pending:
+            return
+
+        uploaded, failed = sync_drive_backups(batch_size=options['batch_size'], workers=options['workers'])
+        self.stdout.write(f"Uploaded {uploaded} certificates, {failed} failed")
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0006_certificatejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificatejob',
+            name='cursor',
+            field=models.BigIntegerField(default=0, help_text='Last Certificate_student id of the most recently committed chunk'),
+        ),
+        migrations.AddField(
+            model_name='certificatejob',
+            name='pending_files',
+            field=models.JSONField(blank=True, default=list, help_text='Media files written by the chunk in progress, removed if it never commits'),
+        ),
+    ]
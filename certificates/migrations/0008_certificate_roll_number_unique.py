@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_roll_numbers(apps, schema_editor):
+    """Fail with a readable message instead of a bare UNIQUE constraint error"""
+    Certificate = apps.get_model('certificates', 'Certificate')
+    duplicates = list(
+        Certificate.objects.values('roll_number')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .values_list('roll_number', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Certificates share roll numbers, resolve these before migrating: "
+            + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0007_certificatejob_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_roll_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='certificate',
+            name='roll_number',
+            field=models.CharField(help_text='Student roll number', max_length=50, unique=True),
+        ),
+    ]
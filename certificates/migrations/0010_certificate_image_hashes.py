@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0009_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='drive_sha256',
+            field=models.CharField(blank=True, help_text='SHA-256 of the certificate image last uploaded to Google Drive', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='image_sha256',
+            field=models.CharField(blank=True, help_text='SHA-256 of the current certificate image', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0010_certificate_image_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='template_name',
+            field=models.CharField(blank=True, help_text='Certificate template the images are rendered with', max_length=100),
+        ),
+    ]
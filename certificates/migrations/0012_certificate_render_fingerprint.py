@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0011_certificate_template_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='render_fingerprint',
+            field=models.CharField(blank=True, help_text='Hash of the template, fonts, layout and fields the images were rendered from', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0012_certificate_render_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificatetemplate',
+            name='qr_size',
+            field=models.PositiveIntegerField(default=110, help_text='Width and height of the QR code in pixels'),
+        ),
+        migrations.AddField(
+            model_name='certificatetemplate',
+            name='text_align',
+            field=models.CharField(choices=[('left', 'Left (X is where the text starts)'), ('center', 'Center (X is the middle of the text)'), ('right', 'Right (X is where the text ends)')], default='left', help_text='How text is aligned on its X coordinate', max_length=10),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:02
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0013_certificatetemplate_layout'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='certificate',
+            index=models.Index(django.db.models.functions.text.Lower('certificate_id'), name='certificate_id_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificate',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='certificate_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificate',
+            index=models.Index(django.db.models.functions.text.Lower('roll_number'), name='certificate_roll_lower_idx'),
+        ),
+    ]
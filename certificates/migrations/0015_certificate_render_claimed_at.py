@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('certificates', '0014_certificate_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='render_claimed_at',
+            field=models.DateTimeField(blank=True, help_text='When a process claimed the first render of a lazily created certificate', null=True),
+        ),
+    ]
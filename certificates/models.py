@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 import uuid
 from django.utils import timezone
 import os
@@ -26,6 +27,7 @@ class Certificate(models.Model):
 
     roll_number = models.CharField(
         max_length=50,
+        unique=True,
         help_text="Student roll number"
     )
 
@@ -51,6 +53,12 @@ class Certificate(models.Model):
         help_text="Student email address"
     )
 
+    template_name = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Certificate template the images are rendered with"
+    )
+
     # Certificate Files
     certificate_image = models.ImageField(
         upload_to='certificates/',
@@ -125,6 +133,30 @@ class Certificate(models.Model):
         help_text="Drive upload timestamp"
     )
 
+    image_sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="SHA-256 of the current certificate image"
+    )
+
+    render_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Hash of the template, fonts, layout and fields the images were rendered from"
+    )
+
+    render_claimed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="When a process claimed the first render of a lazily created certificate"
+    )
+
+    drive_sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="SHA-256 of the certificate image last uploaded to Google Drive"
+    )
+
     # Additional metadata
     notes = models.TextField(
         blank=True,
@@ -135,6 +167,12 @@ class Certificate(models.Model):
         ordering = ['-created_at']
         verbose_name = "Certificate"
         verbose_name_plural = "Certificates"
+        # Case-insensitive verification lookups: filter with field__lower=value.lower()
+        indexes = [
+            models.Index(Lower('certificate_id'), name='certificate_id_lower_idx'),
+            models.Index(Lower('email'), name='certificate_email_lower_idx'),
+            models.Index(Lower('roll_number'), name='certificate_roll_lower_idx'),
+        ]
 
     def __str__(self):
         return f"Certificate for {self.full_name} - {self.course}"
@@ -155,22 +193,59 @@ class Certificate(models.Model):
         """Generate filename for QR code image"""
         return f"qr_{self.certificate_id}.png"
 
-    def save(self, *args, **kwargs):
-        """Override save to set verification URL"""
+    def assign_certificate_id(self, certificate_id=None):
+        """Set a free certificate ID and the verification URL if missing"""
         if not self.certificate_id:
-            new_id = generate_certificate_id()
-            while Certificate.objects.filter(certificate_id=new_id).exists():
-                new_id = generate_certificate_id()
-            self.certificate_id = new_id
+            self.certificate_id = certificate_id or allocate_certificate_ids(1)[0]
         if not self.verification_url:
             self.verification_url = self.get_verification_url()
+
+    def save(self, *args, **kwargs):
+        """Override save to set verification URL"""
+        self.assign_certificate_id()
         super().save(*args, **kwargs)
+
+
+# field__lower=value compiles to LOWER(field) = value, which the functional
+# indexes on Certificate can seek; __iexact cannot use an index. Registered
+# on the indexed fields only, not on every CharField of every app.
+for _field_name in ('certificate_id', 'email', 'roll_number'):
+    Certificate._meta.get_field(_field_name).register_lookup(Lower)
+
         
 def generate_certificate_id():
         prefix = "CSCIndia-"
         suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
         return prefix + suffix
 
+
+def allocate_certificate_ids(count, batch_size=500):
+    """
+    Return ``count`` distinct certificate IDs that are not in use yet.
+
+    Candidates are checked with one IN query per batch and only the ones
+    that collide with an existing certificate are drawn again, so a whole
+    bulk insert costs a single lookup in the common case. The unique index
+    on certificate_id still guards against another process inserting the
+    same ID before these are saved.
+    """
+    allocated = set()
+    while len(allocated) < count:
+        candidates = set()
+        while len(candidates) < count - len(allocated):
+            candidate = generate_certificate_id()
+            if candidate not in allocated:
+                candidates.add(candidate)
+        candidates = list(candidates)
+        taken = set()
+        for start in range(0, len(candidates), batch_size):
+            taken.update(
+                Certificate.objects.filter(certificate_id__in=candidates[start:start + batch_size])
+                .values_list('certificate_id', flat=True)
+            )
+        allocated.update(c for c in candidates if c not in taken)
+    return list(allocated)
+
 class CertificateTemplate(models.Model):
     """Model to store certificate template configurations"""
 
@@ -205,6 +280,19 @@ class CertificateTemplate(models.Model):
 
     qr_x = models.IntegerField(default=360, help_text="X coordinate for QR code")
     qr_y = models.IntegerField(default=465, help_text="Y coordinate for QR code")
+    qr_size = models.PositiveIntegerField(default=110, help_text="Width and height of the QR code in pixels")
+
+    TEXT_ALIGN_CHOICES = [
+        ('left', 'Left (X is where the text starts)'),
+        ('center', 'Center (X is the middle of the text)'),
+        ('right', 'Right (X is where the text ends)'),
+    ]
+    text_align = models.CharField(
+        max_length=10,
+        choices=TEXT_ALIGN_CHOICES,
+        default='left',
+        help_text="How text is aligned on its X coordinate"
+    )
 
     # Font settings
     font_size = models.IntegerField(default=24, help_text="Font size for text")
@@ -254,3 +342,222 @@ class CertificateExcelUpload(models.Model):
     excel_file = models.FileField(upload_to='uploads/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+
+
+class CertificateJob(models.Model):
+    """A queued bulk generation run over the uploaded Certificate_student rows"""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    template_name = models.CharField(
+        max_length=100,
+        help_text="Certificate template used for the run"
+    )
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+        db_index=True
+    )
+
+    max_student_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Highest Certificate_student id included in the job"
+    )
+
+    cursor = models.BigIntegerField(
+        default=0,
+        help_text="Last Certificate_student id of the most recently committed chunk"
+    )
+
+    pending_files = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Media files written by the chunk in progress, removed if it never commits"
+    )
+
+    total_count = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    fail_count = models.PositiveIntegerField(default=0)
+    duplicate_count = models.PositiveIntegerField(default=0)
+
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Worker that claimed the job"
+    )
+
+    error = models.TextField(blank=True)
+
+    created_by = models.ForeignKey(
+        'auth.User',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Certificate Job"
+        verbose_name_plural = "Certificate Jobs"
+
+    def __str__(self):
+        return f"Job #{self.pk} ({self.template_name}) - {self.status}"
+
+    @property
+    def processed_count(self):
+        return self.success_count + self.fail_count + self.duplicate_count
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+
+    def get_throughput(self):
+        """Processed rows per second since the job started"""
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.processed_count / elapsed, 2) if elapsed > 0 else 0.0
+
+    def as_progress(self):
+        """JSON-serialisable progress summary polled by the bulk generation page"""
+        return {
+            'job_id': self.pk,
+            'status': self.status,
+            'template': self.template_name,
+            'total': self.total_count,
+            'processed': self.processed_count,
+            'done': self.success_count,
+            'failed': self.fail_count,
+            'duplicate': self.duplicate_count,
+            'throughput': self.get_throughput(),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'error': self.error,
+        }
+
+
+class CertificateJobResult(models.Model):
+    """Outcome of one Certificate_student row within a CertificateJob"""
+
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_DUPLICATE = 'duplicate'
+    STATUS_CHOICES = [
+        (STATUS_SUCCESS, 'Success'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_DUPLICATE, 'Duplicate'),
+    ]
+
+    job = models.ForeignKey(
+        CertificateJob,
+        related_name='results',
+        on_delete=models.CASCADE
+    )
+
+    # The student row is deleted on success, so keep its identifying fields
+    student_id = models.BigIntegerField()
+    full_name = models.CharField(max_length=100)
+    roll_number = models.CharField(max_length=50)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+
+    certificate = models.ForeignKey(
+        Certificate,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['pk']
+
+    def __str__(self):
+        return f"{self.roll_number}: {self.status}"
+
+
+class EmailOutbox(models.Model):
+    """
+    A certificate email waiting to be delivered by the drain_email_outbox worker.
+
+    Rows are claimed with a token, retried with exponential backoff when the
+    send fails and moved to "dead" once they run out of attempts.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead'),
+    ]
+
+    certificate = models.ForeignKey(
+        Certificate,
+        related_name='outbox_messages',
+        on_delete=models.CASCADE
+    )
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    claim_token = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="Token of the worker batch currently sending this message"
+    )
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Email Outbox Message"
+        verbose_name_plural = "Email Outbox"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        constraints = [
+            # At most one undelivered message per certificate
+            models.UniqueConstraint(
+                fields=['certificate'],
+                condition=models.Q(status__in=['pending', 'sending']),
+                name='unique_undelivered_certificate_email',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Email for {self.certificate_id} - {self.status}"
@@ -0,0 +1,197 @@
+"""
+Offline verification of the signed tokens in certificate QR codes.
+
+The QR code on a certificate points at its verification URL with a signed
+token in the ``t`` query parameter:
+
+    https://verify.cscindia.org.in/verify/<certificate ID>/?t=<token>
+
+The token is the claims below followed by an Ed25519 signature over the
+certificate ID and the claims, base32-encoded (uppercase, no padding, so QR
+codes store it in their compact alphanumeric mode):
+
+    version     1 byte   TOKEN_VERSION
+    issue date  2 bytes  days since 2000-01-01, big-endian
+    name hash   8 bytes  start of the SHA-256 of the normalised holder name
+    course      rest     UTF-8
+
+Anyone with the published public key (GET /api/verify/public-key/) can check
+a token without calling the verification server. That proves the
+certificate was issued with these details; whether it has since been
+withdrawn or corrected is only known to the online verification.
+
+This module only needs the standard library and ``cryptography`` so partner
+institutions can copy it on its own and verify scans in bulk:
+
+    python offline_verifier.py --public-key public_key.pem scans.csv > results.csv
+
+where scans.csv has a ``qr`` column with the scanned text and, optionally, a
+``full_name`` column to check against the name hash.
+"""
+
+import base64
+import csv
+import hashlib
+import struct
+import sys
+from dataclasses import dataclass
+from datetime import date, timedelta
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+TOKEN_VERSION = 1
+TOKEN_PARAMETER = 't'
+EPOCH = date(2000, 1, 1)
+NAME_DIGEST_SIZE = 8
+SIGNATURE_SIZE = 64
+
+_HEADER = struct.Struct('>BH')
+
+# Columns appended to each row by verify_rows
+RESULT_COLUMNS = ['certificate_id', 'valid', 'name_matches', 'course', 'issue_date', 'error']
+
+
+class InvalidToken(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Claims:
+    """What a valid token vouches for."""
+    certificate_id: str
+    name_digest: bytes
+    course: str
+    issue_date: date
+
+    def matches_name(self, full_name):
+        return name_digest(full_name) == self.name_digest
+
+
+def normalise_name(full_name):
+    return ' '.join(str(full_name).split()).casefold()
+
+
+def name_digest(full_name):
+    return hashlib.sha256(normalise_name(full_name).encode()).digest()[:NAME_DIGEST_SIZE]
+
+
+def encode_claims(full_name, course, issue_date):
+    """The claims part of a token (see the module docstring)."""
+    return _HEADER.pack(TOKEN_VERSION, (issue_date - EPOCH).days) + name_digest(full_name) + course.encode()
+
+
+def signed_message(certificate_id, claims):
+    """The bytes the signature covers: the certificate ID is in the URL, not the token."""
+    return str(certificate_id).encode() + b'\0' + claims
+
+
+def encode_token(claims, signature):
+    return base64.b32encode(claims + signature).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    """(claims, signature) of a token, without checking the signature."""
+    token = token.strip().upper()
+    try:
+        raw = base64.b32decode(token + '=' * (-len(token) % 8))
+    except ValueError:
+        raise InvalidToken('Token is not base32')
+    if len(raw) < _HEADER.size + NAME_DIGEST_SIZE + SIGNATURE_SIZE:
+        raise InvalidToken('Token is too short')
+    return raw[:-SIGNATURE_SIZE], raw[-SIGNATURE_SIZE:]
+
+
+def load_public_key(data):
+    """An Ed25519 public key from PEM or the base64 of its 32 raw bytes."""
+    if isinstance(data, str):
+        data = data.encode()
+    if data.lstrip().startswith(b'-----BEGIN'):
+        key = serialization.load_pem_public_key(data)
+        if not isinstance(key, Ed25519PublicKey):
+            raise ValueError('Not an Ed25519 public key')
+        return key
+    return Ed25519PublicKey.from_public_bytes(base64.b64decode(data))
+
+
+def verify_token(certificate_id, token, public_key):
+    """The Claims of ``token`` for ``certificate_id``; raises InvalidToken unless validly signed."""
+    claims, signature = decode_token(token)
+    try:
+        public_key.verify(signature, signed_message(certificate_id, claims))
+    except InvalidSignature:
+        raise InvalidToken('Bad signature')
+
+    version, days = _HEADER.unpack_from(claims)
+    if version != TOKEN_VERSION:
+        raise InvalidToken(f"Unknown token version {version}")
+    offset = _HEADER.size
+    return Claims(
+        certificate_id=str(certificate_id),
+        name_digest=claims[offset:offset + NAME_DIGEST_SIZE],
+        course=claims[offset + NAME_DIGEST_SIZE:].decode('utf-8', errors='replace'),
+        issue_date=EPOCH + timedelta(days=days),
+    )
+
+
+def parse_qr(text):
+    """(certificate ID, token) from the text of a scanned QR code (a verification URL)."""
+    url = urlsplit(text.strip())
+    parts = [part for part in url.path.split('/') if part]
+    token = parse_qs(url.query).get(TOKEN_PARAMETER, [''])[0]
+    if len(parts) < 2 or parts[-2] != 'verify' or not token:
+        raise InvalidToken('Not a signed verification URL')
+    return unquote(parts[-1]), token
+
+
+def verify_qr(text, public_key):
+    """The Claims of a scanned QR code; raises InvalidToken."""
+    return verify_token(*parse_qr(text), public_key)
+
+
+def verify_rows(rows, public_key, qr_column='qr', name_column='full_name'):
+    """
+    Verify CSV rows (dicts) in bulk: yields each row with RESULT_COLUMNS
+    added. ``name_matches`` is left blank for rows without a name.
+    """
+    for row in rows:
+        result = dict.fromkeys(RESULT_COLUMNS, '')
+        try:
+            claims = verify_qr(row.get(qr_column) or '', public_key)
+        except InvalidToken as e:
+            result.update(valid='no', error=str(e))
+        else:
+            result.update(
+                certificate_id=claims.certificate_id,
+                valid='yes',
+                course=claims.course,
+                issue_date=claims.issue_date.isoformat(),
+            )
+            if row.get(name_column):
+                result['name_matches'] = 'yes' if claims.matches_name(row[name_column]) else 'no'
+        yield {**row, **result}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Verify scanned certificate QR codes offline.')
+    parser.add_argument('--public-key', required=True, help='PEM file with the published public key')
+    parser.add_argument('csv', help='CSV with a "qr" column (and optionally "full_name"), or - for stdin')
+    args = parser.parse_args(argv)
+
+    with open(args.public_key, 'rb') as key_file:
+        public_key = load_public_key(key_file.read())
+    source = sys.stdin if args.csv == '-' else open(args.csv, newline='', encoding='utf-8-sig')
+    with source:
+        reader = csv.DictReader(source)
+        columns = list(reader.fieldnames or []) + [c for c in RESULT_COLUMNS if c not in (reader.fieldnames or [])]
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(verify_rows(reader, public_key))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Durable outbox for certificate emails.
+
+Creating a certificate only inserts an EmailOutbox row; the
+``drain_email_outbox`` management command claims due rows in batches and
+delivers them with CertificateMailer. A failed send is retried with
+exponential backoff until CERTIFICATE_EMAIL_MAX_ATTEMPTS is reached, after
+which the row is parked as "dead" for someone to look at in the admin.
+
+Delivery is at-least-once: a worker that dies after the SMTP server has
+accepted a message but before marking it sent leaves the row claimed, and it
+is sent again once the claim goes stale. A live worker renews its claim
+before every send, so a batch that is slow to send (e.g. under
+CERTIFICATE_EMAIL_RATE_PER_MINUTE) is never handed to another worker.
+"""
+
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .mailer import CertificateMailer, mark_email_sent
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxResult:
+    """Counters for one drain of the outbox."""
+
+    def __init__(self):
+        self.sent_count = 0
+        self.retry_count = 0
+        self.dead_count = 0
+
+    @property
+    def processed_count(self):
+        return self.sent_count + self.retry_count + self.dead_count
+
+    def __str__(self):
+        return f"{self.sent_count} sent, {self.retry_count} to retry, {self.dead_count} dead"
+
+
+def enqueue_certificate_emails(certificates):
+    """
+    Queue an email for each saved certificate.
+
+    Certificates that already have an undelivered message are left alone
+    (see the unique_undelivered_certificate_email constraint).
+    """
+    EmailOutbox.objects.bulk_create(
+        [EmailOutbox(certificate=certificate) for certificate in certificates if certificate.pk],
+        ignore_conflicts=True,
+    )
+
+
+def enqueue_certificate_email(certificate):
+    enqueue_certificate_emails([certificate])
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after ``attempts`` failed sends."""
+    base = getattr(settings, 'CERTIFICATE_EMAIL_RETRY_DELAY', 60)
+    ceiling = getattr(settings, 'CERTIFICATE_EMAIL_RETRY_MAX_DELAY', 3600)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), ceiling))
+
+
+def claim_outbox_batch(limit=None, stale_after=None):
+    """
+    Claim up to ``limit`` due messages and return ``(claim_token, messages)``.
+
+    Messages left in "sending" by a worker that stopped for ``stale_after``
+    seconds are released first. The claim is a conditional UPDATE on
+    still-pending rows under a fresh token, so concurrent workers never
+    receive the same message.
+    """
+    if limit is None:
+        limit = getattr(settings, 'CERTIFICATE_EMAIL_BATCH_SIZE', 50)
+    if stale_after is None:
+        stale_after = getattr(settings, 'CERTIFICATE_EMAIL_CLAIM_TIMEOUT', 600)
+    token = uuid.uuid4().hex
+    now = timezone.now()
+
+    released = EmailOutbox.objects.filter(
+        status=EmailOutbox.STATUS_SENDING,
+        claimed_at__lt=now - timedelta(seconds=stale_after),
+    ).update(status=EmailOutbox.STATUS_PENDING, claim_token='')
+    if released:
+        logger.warning(f"Released {released} stale outbox messages")
+
+    due = EmailOutbox.objects.filter(
+        status=EmailOutbox.STATUS_PENDING,
+        next_attempt_at__lte=now,
+    ).order_by('next_attempt_at', 'pk')
+    ids = list(due.values_list('pk', flat=True)[:limit])
+    if ids:
+        EmailOutbox.objects.filter(pk__in=ids, status=EmailOutbox.STATUS_PENDING).update(
+            status=EmailOutbox.STATUS_SENDING,
+            claim_token=token,
+            claimed_at=now,
+        )
+    messages = list(
+        EmailOutbox.objects.filter(claim_token=token).select_related('certificate').order_by('pk')
+    )
+    return token, messages
+
+
+def drain_outbox(limit=None, mailer=None):
+    """Claim one batch of due messages, send them and record the outcomes."""
+    result = OutboxResult()
+    token, messages = claim_outbox_batch(limit)
+    if not messages:
+        return result
+
+    max_attempts = getattr(settings, 'CERTIFICATE_EMAIL_MAX_ATTEMPTS', 6)
+    claimed = EmailOutbox.objects.filter(claim_token=token)
+
+    # Certificates emailed some other way since they were queued count as sent
+    already_sent = [message for message in messages if message.certificate.email_sent]
+    to_send = [message for message in messages if not message.certificate.email_sent]
+
+    own_mailer = mailer is None
+    mailer = mailer or CertificateMailer()
+    attempted = []
+    try:
+        for message in to_send:
+            # Renew the claim of the rest of the batch; a message whose claim
+            # went stale anyway belongs to another worker now
+            claimed.filter(status=EmailOutbox.STATUS_SENDING).update(claimed_at=timezone.now())
+            if not claimed.filter(pk=message.pk).exists():
+                logger.warning(f"Lost the claim on outbox message {message.pk}, not sending it")
+                continue
+            attempted.append((message, mailer.send_certificates([message.certificate], update=False)[0]))
+    finally:
+        if own_mailer:
+            mailer.close()
+
+    now = timezone.now()
+    sent = already_sent + [message for message, outcome in attempted if outcome.sent]
+    mark_email_sent([message.certificate for message in sent if not message.certificate.email_sent])
+    claimed.filter(pk__in=[message.pk for message in sent]).update(
+        status=EmailOutbox.STATUS_SENT,
+        attempts=F('attempts') + 1,
+        sent_at=now,
+        last_error='',
+        claim_token='',
+    )
+    result.sent_count = len(sent)
+
+    for message, outcome in attempted:
+        if outcome.sent:
+            continue
+        attempts = message.attempts + 1
+        if attempts >= max_attempts:
+            status, next_attempt_at = EmailOutbox.STATUS_DEAD, now
+            result.dead_count += 1
+            logger.error(f"Giving up on certificate email {message.pk} after {attempts} attempts")
+        else:
+            status, next_attempt_at = EmailOutbox.STATUS_PENDING, now + retry_delay(attempts)
+            result.retry_count += 1
+        claimed.filter(pk=message.pk).update(
+            status=status,
+            attempts=attempts,
+            next_attempt_at=next_attempt_at,
+            last_error=str(outcome.error),
+            claim_token='',
+        )
+
+    return result
@@ -0,0 +1,494 @@
+"""
+Direct PDF output for certificates, without an HTML-to-PDF engine.
+
+PDFWriter executes the same RenderPlan as render_certificate (see
+certificates.layout), but as PDF operations: the template JPEG is embedded
+as-is as one DCTDecode image stream, the text is set in the embedded
+TrueType font and the QR code is drawn as filled rectangles, so text and QR
+stay sharp at any print size.
+
+Objects are written to the output stream as soon as they are complete and
+background images and fonts are written once per file, so a file with many
+certificates holds a single copy of each template image. stream_certificates_pdf
+builds on that to send booklets of any size page by page.
+"""
+
+import io
+import logging
+import os
+import re
+import struct
+import zlib
+from functools import lru_cache
+
+from PIL import Image, ImageColor
+
+from .fonts import font_registry
+from .layout import ALIGN_CENTER, ALIGN_RIGHT, get_render_plan
+from .qr import fit_qr_matrix
+from .utils import get_render_fields
+
+logger = logging.getLogger(__name__)
+
+# Width of a page in points (A4 landscape); the height follows the
+# template image's aspect ratio
+PAGE_WIDTH = 841.89
+
+JPEG_COLOR_SPACES = {
+    'RGB': '/DeviceRGB',
+    'L': '/DeviceGray',
+    'CMYK': '/DeviceCMYK /Decode [1 0 1 0 1 0 1 0]',
+}
+
+
+def _num(value):
+    """Format a number for a PDF content stream."""
+    return f"{value:.3f}".rstrip('0').rstrip('.') or '0'
+
+
+class TrueTypeFont:
+    """The parts of a TrueType font file needed to embed it in a PDF."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.name = re.sub(r'[^A-Za-z0-9-]', '', os.path.splitext(os.path.basename(path))[0]) or 'Font'
+
+        tables = {}
+        num_tables = struct.unpack_from('>H', self.data, 4)[0]
+        for i in range(num_tables):
+            tag, _, offset, length = struct.unpack_from('>4sIII', self.data, 12 + 16 * i)
+            tables[tag.decode('latin-1')] = offset
+        self._tables = tables
+
+        head = tables['head']
+        self.units_per_em = struct.unpack_from('>H', self.data, head + 18)[0]
+        self.bbox = struct.unpack_from('>hhhh', self.data, head + 36)
+
+        hhea = tables['hhea']
+        self.ascent, self.descent = struct.unpack_from('>hh', self.data, hhea + 4)
+        num_metrics = struct.unpack_from('>H', self.data, hhea + 34)[0]
+        self.advances = [
+            struct.unpack_from('>H', self.data, tables['hmtx'] + 4 * i)[0] for i in range(num_metrics)
+        ]
+
+        self.cap_height = self.ascent
+        if 'OS/2' in tables:
+            os2 = tables['OS/2']
+            if struct.unpack_from('>H', self.data, os2)[0] >= 2:
+                self.cap_height = struct.unpack_from('>h', self.data, os2 + 88)[0]
+        self.italic_angle = 0
+        if 'post' in tables:
+            self.italic_angle = struct.unpack_from('>i', self.data, tables['post'] + 4)[0] / 65536
+
+        self.cmap = self._read_cmap()
+
+    def _read_cmap(self):
+        cmap = self._tables['cmap']
+        num_subtables = struct.unpack_from('>H', self.data, cmap + 2)[0]
+        subtables = {}
+        for i in range(num_subtables):
+            platform, encoding, offset = struct.unpack_from('>HHI', self.data, cmap + 4 + 8 * i)
+            subtables[(platform, encoding)] = cmap + offset
+
+        # Prefer the full Unicode table, then the BMP one
+        for key in [(3, 10), (0, 4), (3, 1), (0, 3)]:
+            if key not in subtables:
+                continue
+            offset = subtables[key]
+            fmt = struct.unpack_from('>H', self.data, offset)[0]
+            if fmt == 12:
+                return self._read_cmap_format12(offset)
+            if fmt == 4:
+                return self._read_cmap_format4(offset)
+        raise ValueError(f"Font {self.name} has no supported Unicode cmap")
+
+    def _read_cmap_format4(self, offset):
+        segments = struct.unpack_from('>H', self.data, offset + 6)[0] // 2
+        ends = offset + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        range_offsets = deltas + 2 * segments
+        mapping = {}
+        for i in range(segments):
+            end, = struct.unpack_from('>H', self.data, ends + 2 * i)
+            start, = struct.unpack_from('>H', self.data, starts + 2 * i)
+            delta, = struct.unpack_from('>h', self.data, deltas + 2 * i)
+            range_offset, = struct.unpack_from('>H', self.data, range_offsets + 2 * i)
+            for char in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    address = range_offsets + 2 * i + range_offset + 2 * (char - start)
+                    glyph, = struct.unpack_from('>H', self.data, address)
+                    glyph = (glyph + delta) & 0xFFFF if glyph else 0
+                else:
+                    glyph = (char + delta) & 0xFFFF
+                if glyph:
+                    mapping[char] = glyph
+        return mapping
+
+    def _read_cmap_format12(self, offset):
+        groups = struct.unpack_from('>I', self.data, offset + 12)[0]
+        mapping = {}
+        for i in range(groups):
+            start, end, glyph = struct.unpack_from('>III', self.data, offset + 16 + 12 * i)
+            for char in range(start, end + 1):
+                mapping[char] = glyph + char - start
+        return mapping
+
+    def glyph_id(self, char):
+        return self.cmap.get(ord(char), 0)
+
+    def advance(self, glyph):
+        return self.advances[min(glyph, len(self.advances) - 1)]
+
+    def text_width(self, text, size):
+        """Advance width of ``text`` at ``size`` (in the same unit as ``size``)."""
+        return sum(self.advance(self.glyph_id(char)) for char in text) * size / self.units_per_em
+
+    def scaled(self, value):
+        """Font units -> PDF glyph space (1000 units per em)."""
+        return round(value * 1000 / self.units_per_em)
+
+    @property
+    def compressed_data(self):
+        data = getattr(self, '_compressed_data', None)
+        if data is None:
+            data = self._compressed_data = zlib.compress(self.data)
+        return data
+
+
+@lru_cache(maxsize=16)
+def load_truetype(path):
+    """Parsed TrueTypeFont for ``path``, once per process."""
+    return TrueTypeFont(path)
+
+
+def resolve_font(path):
+    """
+    load_truetype(path), falling back to the default certificate font when
+    the file cannot be used (render_certificate falls back the same way).
+    """
+    try:
+        return load_truetype(path)
+    except Exception as e:
+        default = str(font_registry.get_path('default'))
+        if path == default:
+            raise
+        logger.warning(f"Could not load font {path} for PDF, using {default}: {e}")
+        return load_truetype(default)
+
+
+class PDFWriter:
+    """
+    Write certificates as pages of a PDF to a binary stream.
+
+    Call add_certificate (or add_page) once per page, then close() to
+    write the font objects, page tree and cross-reference table. Only
+    ``write`` is used on the stream, so it can be a file, a BytesIO or a
+    generator-backed buffer for streaming responses.
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, stream, compress=True):
+        self.stream = stream
+        self.compress = compress
+        self.position = 0
+        self.offsets = {}
+        self.next_id = 3
+        self.page_ids = []
+        self.images = {}  # background path -> (object id, resource name, width, height)
+        self.fonts = {}  # font path -> (object id, resource name, TrueTypeFont, used glyphs)
+        self.plans = {}  # template name -> RenderPlan, resolved once per file
+        self._write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+
+    def _allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, dictionary, data=None):
+        self.offsets[obj_id] = self.position
+        if data is None:
+            self._write(f"{obj_id} 0 obj\n{dictionary}\nendobj\n".encode('latin-1'))
+            return
+        self._write(f"{obj_id} 0 obj\n<< {dictionary} /Length {len(data)} >>\nstream\n".encode('latin-1'))
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+
+    def _write_stream(self, obj_id, data, dictionary=''):
+        if self.compress:
+            data = zlib.compress(data)
+            dictionary = f"{dictionary} /Filter /FlateDecode".strip()
+        self._write_object(obj_id, dictionary, data)
+
+    def _image(self, path):
+        image = self.images.get(path)
+        if image is not None:
+            return image
+
+        with Image.open(path) as im:
+            width, height = im.size
+            if im.format == 'JPEG' and im.mode in JPEG_COLOR_SPACES:
+                color_space = JPEG_COLOR_SPACES[im.mode]
+                with open(path, 'rb') as f:
+                    data = f.read()
+            else:
+                # Only JPEGs can be embedded unchanged
+                buffer = io.BytesIO()
+                im.convert('RGB').save(buffer, format='JPEG', quality=95)
+                color_space = JPEG_COLOR_SPACES['RGB']
+                data = buffer.getvalue()
+
+        obj_id = self._allocate()
+        self._write_object(
+            obj_id,
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode",
+            data,
+        )
+        image = self.images[path] = (obj_id, f"Im{len(self.images) + 1}", width, height)
+        return image
+
+    def _font(self, path):
+        font = self.fonts.get(path)
+        if font is None:
+            # Load before allocating, an object id must never be left unwritten
+            truetype = resolve_font(path)
+            font = self.fonts[path] = (self._allocate(), f"F{len(self.fonts) + 1}", truetype, {})
+        return font
+
+    def add_certificate(self, certificate_obj, plan=None):
+        """Add a page for a Certificate."""
+        if plan is None:
+            template_name = certificate_obj.template_name or 'CSCIndia'
+            plan = self.plans.get(template_name)
+            if plan is None:
+                plan = self.plans[template_name] = get_render_plan(template_name)
+        self.add_page(get_render_fields(certificate_obj), plan)
+
+    def add_page(self, fields, plan):
+        """Add a page drawing ``fields`` (see get_render_fields) with ``plan``."""
+        image_id, image_name, image_width, image_height = self._image(plan.background_path)
+        scale = PAGE_WIDTH / image_width
+        page_height = image_height * scale
+
+        ops = [f"q {_num(PAGE_WIDTH)} 0 0 {_num(page_height)} 0 0 cm /{image_name} Do Q"]
+
+        fonts_used = {}
+        for box in plan.texts:
+            font_id, font_name, font, glyphs = self._font(box.font_path)
+            fonts_used[font_name] = font_id
+            text = box.get_text(fields)
+            width = font.text_width(text, box.font_size)
+            x = box.x
+            if box.align == ALIGN_CENTER:
+                x = box.x + (box.width - width) / 2
+            elif box.align == ALIGN_RIGHT:
+                x = box.x + box.width - width
+            # Pillow places text by the top of its ascender, PDF by the baseline
+            baseline = box.y + font.ascent * box.font_size / font.units_per_em
+
+            encoded = []
+            for char in text:
+                glyph = font.glyph_id(char)
+                glyphs.setdefault(glyph, char)
+                encoded.append(f"{glyph:04X}")
+            r, g, b = ImageColor.getrgb(box.fill)[:3]
+            ops.append(
+                f"BT /{font_name} {_num(box.font_size * scale)} Tf "
+                f"{_num(r / 255)} {_num(g / 255)} {_num(b / 255)} rg "
+                f"1 0 0 1 {_num(x * scale)} {_num(page_height - baseline * scale)} Tm "
+                f"<{''.join(encoded)}> Tj ET"
+            )
+
+        ops.extend(self._qr_ops(fields['verification_url'], plan.qr, scale, page_height))
+
+        content_id = self._allocate()
+        self._write_stream(content_id, "\n".join(ops).encode('latin-1'))
+
+        page_id = self._allocate()
+        font_resources = ' '.join(f"/{name} {obj_id} 0 R" for name, obj_id in fonts_used.items())
+        self._write_object(
+            page_id,
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R "
+            f"/MediaBox [0 0 {_num(PAGE_WIDTH)} {_num(page_height)}] "
+            f"/Resources << /XObject << /{image_name} {image_id} 0 R >> /Font << {font_resources} >> >> "
+            f"/Contents {content_id} 0 R >>",
+        )
+        self.page_ids.append(page_id)
+
+    def _qr_ops(self, data, qr, scale, page_height):
+        """White QR box plus one rectangle per horizontal run of dark modules."""
+        modules, cells, module = fit_qr_matrix(data, min(qr.width, qr.height))
+        left = qr.x + (qr.width - modules * module) // 2
+        top = qr.y + (qr.height - modules * module) // 2
+
+        def rect(x, y, width, height):
+            return (
+                f"{_num(x * scale)} {_num(page_height - (y + height) * scale)} "
+                f"{_num(width * scale)} {_num(height * scale)} re"
+            )
+
+        ops = ["1 1 1 rg", rect(qr.x, qr.y, qr.width, qr.height), "f", "0 0 0 rg"]
+        for row in range(modules):
+            cells_row = cells[row * modules:(row + 1) * modules]
+            column = 0
+            while column < modules:
+                if not cells_row[column]:
+                    column += 1
+                    continue
+                start = column
+                while column < modules and cells_row[column]:
+                    column += 1
+                ops.append(rect(left + start * module, top + row * module, (column - start) * module, module))
+        ops.append("f")
+        return ops
+
+    def _write_font(self, obj_id, name, font, glyphs):
+        cid_id, descriptor_id, file_id, unicode_id = (self._allocate() for _ in range(4))
+
+        self._write_object(
+            obj_id,
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{font.name} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_id} 0 R] /ToUnicode {unicode_id} 0 R >>",
+        )
+        widths = ' '.join(f"{glyph} [{font.scaled(font.advance(glyph))}]" for glyph in sorted(glyphs))
+        self._write_object(
+            cid_id,
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{font.name} "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {descriptor_id} 0 R /CIDToGIDMap /Identity /W [{widths}] >>",
+        )
+        bbox = ' '.join(str(font.scaled(value)) for value in font.bbox)
+        self._write_object(
+            descriptor_id,
+            f"<< /Type /FontDescriptor /FontName /{font.name} /Flags 32 /FontBBox [{bbox}] "
+            f"/ItalicAngle {_num(font.italic_angle)} /Ascent {font.scaled(font.ascent)} "
+            f"/Descent {font.scaled(font.descent)} /CapHeight {font.scaled(font.cap_height)} "
+            f"/StemV 80 /FontFile2 {file_id} 0 R >>",
+        )
+        self._write_object(
+            file_id, f"/Length1 {len(font.data)} /Filter /FlateDecode", font.compressed_data
+        )
+
+        mappings = [
+            f"<{glyph:04X}> <{char.encode('utf-16-be').hex().upper()}>" for glyph, char in sorted(glyphs.items())
+        ]
+        chunks = [mappings[i:i + 100] for i in range(0, len(mappings), 100)]
+        cmap = "\n".join([
+            "/CIDInit /ProcSet findresource begin",
+            "12 dict begin",
+            "begincmap",
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+            f"/CMapName /{name}-UCS def",
+            "/CMapType 2 def",
+            "1 begincodespacerange <0000> <FFFF> endcodespacerange",
+            *(f"{len(chunk)} beginbfchar\n" + "\n".join(chunk) + "\nendbfchar" for chunk in chunks),
+            "endcmap",
+            "CMapName currentdict /CMap defineresource pop",
+            "end",
+            "end",
+        ])
+        self._write_stream(unicode_id, cmap.encode('latin-1'))
+
+    def close(self):
+        """Write the fonts, page tree, catalog and cross-reference table."""
+        for obj_id, name, font, glyphs in self.fonts.values():
+            self._write_font(obj_id, name, font, glyphs)
+
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._write_object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self._write_object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>")
+
+        xref = self.position
+        size = self.next_id
+        lines = ["xref", f"0 {size}", "0000000000 65535 f "]
+        lines.extend(f"{self.offsets[obj_id]:010d} 00000 n " for obj_id in range(1, size))
+        lines.extend(["trailer", f"<< /Size {size} /Root {self.CATALOG_ID} 0 R >>", "startxref", str(xref), "%%EOF", ""])
+        self._write("\n".join(lines).encode('latin-1'))
+
+
+def render_certificate_pdf(fields, template_name='CSCIndia', plan=None):
+    """A single-page certificate PDF as bytes (the PDF counterpart of render_certificate)."""
+    buffer = io.BytesIO()
+    writer = PDFWriter(buffer)
+    writer.add_page(fields, plan or get_render_plan(template_name))
+    writer.close()
+    return buffer.getvalue()
+
+
+class _PendingBytes:
+    """Write target that collects output until it is taken."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def stream_certificates_pdf(certificates, chunk_size=200):
+    """
+    Yield a multi-page PDF of ``certificates`` (a queryset) piece by piece.
+
+    Rows are fetched ``chunk_size`` at a time and each page is yielded as
+    soon as it is written, so memory stays flat however many pages the
+    booklet has; only the background image and fonts are kept.
+
+    A certificate that cannot be drawn aborts the booklet (the download
+    fails) rather than being left out of it; call check_booklet first to
+    catch broken templates before the response starts.
+    """
+    buffer = _PendingBytes()
+    writer = PDFWriter(buffer)
+    for certificate in certificates.iterator(chunk_size=chunk_size):
+        try:
+            writer.add_certificate(certificate)
+        except Exception as e:
+            logger.error(f"PDF booklet aborted at certificate {certificate.certificate_id}: {e}")
+            raise
+        yield buffer.take()
+    writer.close()
+    yield buffer.take()
+
+
+def check_booklet(certificates):
+    """
+    Resolve the plan, background image and fonts of every template the
+    ``certificates`` use; raises if one of them cannot be drawn.
+    """
+    template_names = certificates.order_by().values_list('template_name', flat=True).distinct()
+    for template_name in template_names:
+        plan = get_render_plan(template_name or 'CSCIndia')
+        with Image.open(plan.background_path):
+            pass
+        for box in plan.texts:
+            resolve_font(box.font_path)
+
+
+def booklet_filename(certificates):
+    """``<college>.pdf`` for a booklet, named after the first certificate's college."""
+    first = certificates.first()
+    college_name = (first.college_name if first else '') or 'college'
+    safe_college_name = re.sub(r'\W+', '_', college_name.strip().lower())
+    return f"{safe_college_name}.pdf"
+
+
+def write_certificates_pdf(stream, certificates):
+    """Write one page per certificate to ``stream``; returns the page count."""
+    writer = PDFWriter(stream)
+    for certificate in certificates:
+        writer.add_certificate(certificate)
+    writer.close()
+    return len(writer.page_ids)
@@ -0,0 +1,120 @@
+"""
+QR codes drawn on certificates and saved next to them.
+"""
+
+import logging
+from functools import lru_cache
+
+import qrcode
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Quiet zone (in modules) the QR specification requires around the symbol;
+# on a certificate it is reserved inside the QR box, which is filled white
+QR_BORDER = 4
+
+# Error correction levels from strongest to weakest; the strongest one whose
+# symbol plus its quiet zone still gets QR_MIN_MODULE_PIXELS per module in
+# the box is used
+QR_ERROR_CORRECTION_LEVELS = (
+    qrcode.constants.ERROR_CORRECT_H,
+    qrcode.constants.ERROR_CORRECT_Q,
+    qrcode.constants.ERROR_CORRECT_M,
+    qrcode.constants.ERROR_CORRECT_L,
+)
+QR_MIN_MODULE_PIXELS = 2
+
+
+@lru_cache(maxsize=4096)
+def get_qr_matrix(data, error_correction=qrcode.constants.ERROR_CORRECT_H):
+    """
+    The QR modules for ``data`` as ``(modules, cells)``: the symbol's width
+    in modules and one byte per module, 255 for dark and 0 for light.
+    """
+    qr = qrcode.QRCode(error_correction=error_correction, border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    return len(matrix), bytes(255 if module else 0 for row in matrix for module in row)
+
+
+def get_qr_modules(data, error_correction):
+    """Width in modules of the QR code for ``data``, without building the matrix."""
+    qr = qrcode.QRCode(error_correction=error_correction, border=0)
+    qr.add_data(data)
+    return qr.best_fit() * 4 + 17
+
+
+def fit_qr_matrix(data, side):
+    """
+    The QR code for ``data`` in a ``side`` pixel box as ``(modules, cells, scale)``.
+
+    Uses the strongest error correction whose symbol, with a quiet zone of
+    QR_BORDER modules on every side, gets QR_MIN_MODULE_PIXELS per module;
+    ``scale`` is the largest whole number of pixels per module that keeps
+    that quiet zone inside the box. Falling back to a weaker level, or to a
+    box too small for any level, is logged once per box and symbol size.
+    """
+    for error_correction in QR_ERROR_CORRECTION_LEVELS:
+        if (get_qr_modules(data, error_correction) + 2 * QR_BORDER) * QR_MIN_MODULE_PIXELS <= side:
+            break
+    else:
+        error_correction = QR_ERROR_CORRECTION_LEVELS[-1]
+    modules, cells = get_qr_matrix(data, error_correction)
+    scale = max(1, side // (modules + 2 * QR_BORDER))
+    if error_correction != QR_ERROR_CORRECTION_LEVELS[0] or scale < QR_MIN_MODULE_PIXELS:
+        _warn_small_qr_box(side, modules, error_correction, scale)
+    return modules, cells, scale
+
+
+@lru_cache(maxsize=64)
+def _warn_small_qr_box(side, modules, error_correction, scale):
+    level = {
+        qrcode.constants.ERROR_CORRECT_H: 'H',
+        qrcode.constants.ERROR_CORRECT_Q: 'Q',
+        qrcode.constants.ERROR_CORRECT_M: 'M',
+        qrcode.constants.ERROR_CORRECT_L: 'L',
+    }[error_correction]
+    logger.warning(
+        f"A {side}px QR box only fits a {modules}-module code with its quiet zone "
+        f"at error correction {level} and {scale}px per module"
+    )
+
+
+def rasterise_qr(data, size):
+    """
+    1-bit mask of the QR code (1 = dark module) at the module scale chosen
+    by fit_qr_matrix, so every module is a sharp square and the quiet zone
+    fits around it in ``size``.
+    """
+    modules, cells, scale = fit_qr_matrix(data, min(size))
+    mask = Image.frombytes('L', (modules, modules), cells).convert('1', dither=Image.Dither.NONE)
+    if scale > 1:
+        mask = mask.resize((modules * scale, modules * scale), Image.Resampling.NEAREST)
+    return mask
+
+
+def paste_qr_code(image, data, x, y, width, height):
+    """
+    Draw the QR code for ``data`` centred in the box at ``x``, ``y``: the
+    box is filled white, which leaves at least QR_BORDER modules of quiet
+    zone around the symbol, and the dark modules are painted through the mask.
+    """
+    mask = rasterise_qr(data, (width, height))
+    left = x + (width - mask.width) // 2
+    top = y + (height - mask.height) // 2
+    image.paste('white', (x, y, x + width, y + height))
+    image.paste('black', (left, top, left + mask.width, top + mask.height), mask)
+
+
+def generate_qr_code(data, size):
+    """
+    Standalone 1-bit QR code image for ``data``: the symbol as drawn in a
+    ``size`` box on the certificate, plus a quiet zone of QR_BORDER modules.
+    """
+    mask = rasterise_qr(data, size)
+    border = QR_BORDER * fit_qr_matrix(data, min(size))[2]
+    qr_img = Image.new('1', (mask.width + 2 * border, mask.height + 2 * border), 1)
+    qr_img.paste(0, (border, border, border + mask.width, border + mask.height), mask)
+    return qr_img
@@ -0,0 +1,118 @@
+"""
+Signed tokens in certificate QR codes.
+
+With CERTIFICATE_QR_SIGNING_KEY_FILE set to an Ed25519 private key (see the
+generate_qr_signing_key command), the QR code drawn on each certificate
+points at its verification URL plus a token signed with that key, carrying
+the certificate ID, a hash of the holder's name, the course and the issue
+date (the format lives in certificates.offline_verifier, which partners
+use with the public key from /api/verify/public-key/).
+
+The verify endpoints still look the certificate up (the page has to show
+the holder's name, and deleted or edited certificates must not verify from
+an old QR code) and report whether the scanned token is validly signed and
+matches the record (see verification.check_signed_qr). Without a key file
+the QR codes carry the plain verification URL as before.
+"""
+
+import base64
+import logging
+from functools import lru_cache
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.utils import timezone
+
+from .offline_verifier import (
+    TOKEN_PARAMETER, InvalidToken, encode_claims, encode_token, signed_message, verify_token,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4)
+def _load_private_key(path):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    with open(path, 'rb') as key_file:
+        key = serialization.load_pem_private_key(key_file.read(), password=None)
+    if not isinstance(key, Ed25519PrivateKey):
+        raise ValueError(f"{path} is not an Ed25519 private key")
+    return key
+
+
+def qr_signing_enabled():
+    return bool(getattr(settings, 'CERTIFICATE_QR_SIGNING_KEY_FILE', ''))
+
+
+def get_signing_key():
+    """The configured Ed25519 private key, or None when QR signing is off."""
+    if not qr_signing_enabled():
+        return None
+    return _load_private_key(str(settings.CERTIFICATE_QR_SIGNING_KEY_FILE))
+
+
+def get_public_key():
+    key = get_signing_key()
+    return key.public_key() if key is not None else None
+
+
+def get_issue_date(created_at):
+    """The (local) issue date the token carries for a certificate's created_at."""
+    if hasattr(created_at, 'hour'):
+        if timezone.is_aware(created_at):
+            created_at = timezone.localtime(created_at)
+        return created_at.date()
+    return created_at
+
+
+def sign_certificate(certificate_id, full_name, course, created_at):
+    """The QR token for a certificate, or '' when QR signing is off."""
+    key = get_signing_key()
+    if key is None:
+        return ''
+    claims = encode_claims(full_name, course, get_issue_date(created_at))
+    return encode_token(claims, key.sign(signed_message(certificate_id, claims)))
+
+
+def signed_verification_url(certificate_obj):
+    """The verification URL with the signed token, as encoded in the QR code."""
+    url = certificate_obj.get_verification_url()
+    token = sign_certificate(
+        certificate_obj.certificate_id, certificate_obj.full_name, certificate_obj.course, certificate_obj.created_at
+    )
+    if not token:
+        return url
+    return f"{url}?{urlencode({TOKEN_PARAMETER: token})}"
+
+
+def check_token(certificate_id, token):
+    """The Claims of a validly signed ``token`` for ``certificate_id``, else None."""
+    public_key = get_public_key()
+    if public_key is None or not token:
+        return None
+    try:
+        return verify_token(certificate_id, token, public_key)
+    except InvalidToken as e:
+        logger.info(f"Rejected QR token for {certificate_id}: {e}")
+        return None
+
+
+def public_key_payload():
+    """What /api/verify/public-key/ publishes, or None when QR signing is off."""
+    from cryptography.hazmat.primitives import serialization
+
+    from .offline_verifier import TOKEN_VERSION
+
+    public_key = get_public_key()
+    if public_key is None:
+        return None
+    raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    pem = public_key.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return {
+        'algorithm': 'Ed25519',
+        'token_version': TOKEN_VERSION,
+        'public_key': base64.b64encode(raw).decode('ascii'),
+        'pem': pem.decode('ascii'),
+    }
@@ -0,0 +1,97 @@
+"""
+Decoded certificate template images, cached per process.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from PIL import Image
+
+
+def get_template_path(template_name):
+    """Return the path of the base image for a certificate template name."""
+    template_filename = f"original_certificate_{template_name.lower().replace(' ', '')}.jpg"
+    return os.path.join(settings.MEDIA_ROOT, 'templates', template_filename)
+
+
+class TemplateImageCache:
+    """
+    Process-wide LRU cache of decoded RGB template images.
+
+    Entries are keyed by template name and remember the file mtime they were
+    decoded from, so replacing a template file on disk invalidates the entry
+    on the next lookup. Callers always get a copy they are free to draw on.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'CERTIFICATE_TEMPLATE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+    @property
+    def current_bytes(self):
+        return sum(entry[2] for entry in self._entries.values())
+
+    def get(self, template_name, template_path=None):
+        """
+        Return a fresh RGB copy of the template image for ``template_name``
+        (or of the image at ``template_path``, e.g. an uploaded template).
+        """
+        template_path = template_path or get_template_path(template_name)
+        try:
+            mtime = os.path.getmtime(template_path)
+        except OSError:
+            raise FileNotFoundError(f"Template not found: {template_path}")
+
+        key = str(template_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].copy()
+
+        # Decode outside the lock so other templates are not blocked meanwhile.
+        with Image.open(template_path) as source:
+            image = source.convert("RGB")
+        image.load()
+        size = image.width * image.height * len(image.getbands())
+
+        with self._lock:
+            self.misses += 1
+            self._entries.pop(key, None)
+            if size <= self.max_bytes:
+                self._entries[key] = (mtime, image, size)
+                while self.current_bytes > self.max_bytes:
+                    self._entries.popitem(last=False)
+        return image.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters and memory usage of the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+template_cache = TemplateImageCache()
@@ -1,3 +1,1789 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMessage
+from django.core.exceptions import FieldError
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+from PIL import Image, ImageFont
+import qrcode
+
+from .bulk import DUPLICATE, FAILED, SUCCESS, BulkCertificateGenerator
+from .drive import (
+    DriveUploader,
+    certificates_needing_sync,
+    get_upload_pool,
+    reset_drive_clients,
+    sync_drive_backups,
+    trust_existing_backups,
+)
+from .emails import get_download_url, make_download_token, render_certificate_email
+from .fonts import CERTIFICATE_FONT_SCALES, FontRegistry
+from .idfilter import BloomFilter, CertificateIdFilter, touch_stamp
+from .importers import import_student_sheet, student_frame, validate_student_frame, validate_student_sheet
+from .jobs import JobCertificateGenerator, claim_next_job, enqueue_bulk_job, run_job
+from .layout import DEFAULT_QR_BOX, get_render_plan, invalidate_render_plans
+from .mailer import CertificateMailer, MailOutcome, mark_email_sent
+from .models import (
+    Certificate,
+    Certificate_student,
+    CertificateJob,
+    CertificateJobResult,
+    CertificateTemplate,
+    EmailOutbox,
+)
+from .offline_verifier import InvalidToken, load_public_key, parse_qr, verify_qr, verify_rows, verify_token
+from .outbox import claim_outbox_batch, drain_outbox, enqueue_certificate_emails
+from .pdf import render_certificate_pdf, stream_certificates_pdf
+from .qrtoken import check_token, get_public_key, sign_certificate, signed_verification_url
+from .qr import QR_BORDER, fit_qr_matrix, generate_qr_code
+from .template_images import TemplateImageCache, get_template_path, template_cache
+from .utils import (
+    ensure_certificate_pdf,
+    ensure_certificate_rendered,
+    generate_certificate_pdf,
+    get_render_fields,
+    regenerate_certificate,
+    render_certificate,
+)
+from .verification import (
+    CSV_RESULT_COLUMNS,
+    annotate_csv,
+    check_signed_qr,
+    forget_certificates,
+    get_verification_cache,
+    lookup_certificate,
+    lookup_certificates,
+    serialise_certificate,
+)
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+FONTS_DIR = settings.BASE_DIR / 'static' / 'fonts' / 'Roboto' / 'static'
+
+
+def make_certificate(roll_number='CS2024001', **fields):
+    return Certificate.objects.create(**{
+        'full_name': 'ASHA VERMA',
+        'roll_number': roll_number,
+        'course': 'Python Programming',
+        'college_name': 'Tech University',
+        'affiliated_name': 'State University',
+        'email': 'asha.verma@example.com',
+        'start_date': date(2024, 1, 1),
+        'end_date': date(2024, 3, 31),
+        'is_verified': True,
+        **fields,
+    })
+
+
+def make_student(roll_number, **fields):
+    return Certificate_student.objects.create(**{
+        'full_name': f'Student {roll_number}',
+        'course': 'Python Programming',
+        'roll_number': roll_number,
+        'college_name': 'Tech University',
+        'affiliated_name': 'State University',
+        'start_date': date(2024, 1, 1),
+        'end_date': date(2024, 3, 31),
+        'email': f'{roll_number.lower()}@example.com',
+        'contact': 'NONE',
+        'gender': 'NONE',
+        **fields,
+    })
+
+
+def sheet_row(name='Asha Verma', roll='cs001', email='Asha@Example.com', start='01-01-2024', end='31-03-2024'):
+    return {
+        'Name': name, 'Course': 'Python Programming', 'Roll No': roll, 'College Name': 'Tech University',
+        'Affiliated Name': 'State University', 'Start Date': start, 'End Date': end, 'Email': email,
+        'Contact': None, 'Gender': None,
+    }
+
+
+class TemporaryMediaMixin:
+    """Run each test against an empty MEDIA_ROOT and verification cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_root, ignore_errors=True)
+        media_settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CERTIFICATE_ID_FILTER_STAMP=self.media_root / '.certificate_ids.stamp',
+            CACHES={
+                **settings.CACHES,
+                'verification': {**settings.CACHES['verification'], 'LOCATION': cache_root},
+            },
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        # Render plans and template images remember paths under MEDIA_ROOT
+        invalidate_render_plans()
+        template_cache.clear()
+        self.addCleanup(invalidate_render_plans)
+        self.addCleanup(template_cache.clear)
+
+    def write_template(self, template_name='CSCIndia', size=(2000, 1414), color='white'):
+        """Write the base image of an image template and return its path."""
+        path = Path(get_template_path(template_name))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new('RGB', size, color).save(path, quality=80)
+        return path
+
+
+class TemplateImageCacheTests(TemporaryMediaMixin, SimpleTestCase):
+
+    def test_hits_and_misses_are_counted(self):
+        self.write_template(size=(40, 30))
+        cache = TemplateImageCache()
+        cache.get('CSCIndia')
+        cache.get('CSCIndia')
+        cache.get('csc india')
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['bytes'], 40 * 30 * 3)
+
+    def test_callers_get_their_own_copy(self):
+        self.write_template(size=(40, 30))
+        cache = TemplateImageCache()
+        cache.get('CSCIndia').paste('black', (0, 0, 40, 30))
+        self.assertEqual(cache.get('CSCIndia').getpixel((0, 0)), (255, 255, 255))
+
+    def test_replaced_file_is_decoded_again(self):
+        path = self.write_template(size=(40, 30))
+        cache = TemplateImageCache()
+        cache.get('CSCIndia')
+
+        Image.new('RGB', (40, 30), 'black').save(path)
+        modified = os.path.getmtime(path) + 10
+        os.utime(path, (modified, modified))
+        self.assertEqual(cache.get('CSCIndia').getpixel((0, 0)), (0, 0, 0))
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['entries'], 1)
+
+    @override_settings(CERTIFICATE_TEMPLATE_CACHE_MAX_BYTES=2 * 40 * 30 * 3)
+    def test_least_recently_used_template_is_evicted(self):
+        for template_name in ('First', 'Second', 'Third'):
+            self.write_template(template_name, size=(40, 30))
+        cache = TemplateImageCache()
+        cache.get('First')
+        cache.get('Second')
+        cache.get('First')
+        cache.get('Third')
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertLessEqual(cache.stats()['bytes'], cache.max_bytes)
+
+        cache.get('First')
+        self.assertEqual(cache.stats()['misses'], 3)
+        cache.get('Second')
+        self.assertEqual(cache.stats()['misses'], 4)
+
+    @override_settings(CERTIFICATE_TEMPLATE_CACHE_MAX_BYTES=100)
+    def test_template_larger_than_the_cap_is_not_kept(self):
+        self.write_template(size=(40, 30))
+        cache = TemplateImageCache()
+        self.assertEqual(cache.get('CSCIndia').size, (40, 30))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_missing_template(self):
+        with self.assertRaises(FileNotFoundError):
+            TemplateImageCache().get('Nowhere')
+
+
+@override_settings(
+    CERTIFICATE_FONT_PATH=FONTS_DIR / 'Roboto-SemiBold.ttf',
+    CERTIFICATE_FONT_FAMILIES={'bold': FONTS_DIR / 'Roboto-Bold.ttf', 'light': FONTS_DIR / 'Roboto-Light.ttf'},
+    CERTIFICATE_FONT_SIZE=20,
+)
+class FontRegistryTests(SimpleTestCase):
+
+    def test_each_path_and_size_is_loaded_once(self):
+        registry = FontRegistry()
+        with mock.patch('certificates.fonts.ImageFont.truetype', wraps=ImageFont.truetype) as truetype:
+            first = registry.get(24)
+            self.assertIs(registry.get(24), first)
+            self.assertIs(registry.get_file(settings.CERTIFICATE_FONT_PATH, 24.0), first)
+            registry.get(30)
+            registry.get(24, 'bold')
+        self.assertEqual(truetype.call_count, 3)
+
+    def test_unknown_family_uses_the_default_font(self):
+        registry = FontRegistry()
+        with self.assertLogs('certificates.fonts', 'WARNING'):
+            self.assertEqual(registry.get_path('script'), settings.CERTIFICATE_FONT_PATH)
+        self.assertIs(registry.get(24, 'script'), registry.get(24))
+
+    def test_missing_font_file_falls_back_to_pil_default(self):
+        with override_settings(CERTIFICATE_FONT_FAMILIES={'gone': FONTS_DIR / 'missing.ttf'}):
+            with self.assertLogs('certificates.fonts', 'WARNING'):
+                with mock.patch('certificates.fonts.ImageFont.load_default') as load_default:
+                    font = FontRegistry().get(24, 'gone')
+        self.assertIs(font, load_default.return_value)
+
+    def test_warm_loads_every_family_at_every_size(self):
+        registry = FontRegistry()
+        self.assertEqual(registry.warm(), 3 * len(CERTIFICATE_FONT_SCALES))
+        with mock.patch('certificates.fonts.ImageFont.truetype') as truetype:
+            for family in ('default', 'bold', 'light'):
+                for scale in CERTIFICATE_FONT_SCALES.values():
+                    registry.get(int(20 * scale), family)
+        truetype.assert_not_called()
+
+
+def render_unless_broken(fields, plan=None):
+    """render_certificate that fails for students named BROKEN, in the render worker."""
+    if fields['full_name'] == 'BROKEN':
+        raise ValueError('Cannot draw this certificate')
+    return render_certificate(fields, plan=plan)
+
+
+class RecordingGenerator(BulkCertificateGenerator):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statuses = {}
+
+    def record(self, student, status, certificate=None, error=None):
+        super().record(student, status, certificate=certificate, error=error)
+        self.statuses[student.roll_number, student.full_name] = status
+
+
+@override_settings(CERTIFICATE_LAZY_RENDERING=False, GOOGLE_DRIVE_UPLOAD_ON_GENERATE=False)
+class BulkGenerationTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_template(size=(1200, 850))
+
+    def generate(self, workers):
+        """Generate a batch with successes, a failure and duplicates; returns the generator."""
+        Certificate.objects.all().delete()
+        Certificate_student.objects.all().delete()
+        make_certificate('CS000')
+        for roll_number in ('CS000', 'CS001', 'CS002', 'CS003', 'CS004', 'CS002'):
+            make_student(roll_number)
+        make_student('CS005', full_name='BROKEN')
+
+        generator = RecordingGenerator('CSCIndia', workers=workers, chunk_size=3)
+        with mock.patch('certificates.bulk.render_certificate', render_unless_broken):
+            generator.run(Certificate_student.objects.all())
+        return generator
+
+    def test_pooled_results_match_serial_results(self):
+        serial = self.generate(workers=1)
+        serial_rolls = sorted(Certificate.objects.values_list('roll_number', flat=True))
+        pooled = self.generate(workers=2)
+
+        self.assertEqual(str(serial.result), '4 generated, 1 failed, 2 duplicates')
+        self.assertEqual(str(pooled.result), str(serial.result))
+        self.assertEqual(pooled.statuses, serial.statuses)
+        self.assertEqual(pooled.statuses['CS005', 'BROKEN'], FAILED)
+        self.assertEqual(pooled.statuses['CS000', 'Student CS000'], DUPLICATE)
+        self.assertEqual(pooled.statuses['CS004', 'Student CS004'], SUCCESS)
+        self.assertEqual(sorted(Certificate.objects.values_list('roll_number', flat=True)), serial_rolls)
+
+        # Only successful students are removed, the failed one stays for a retry
+        self.assertEqual(
+            sorted(Certificate_student.objects.values_list('full_name', flat=True)),
+            ['BROKEN', 'Student CS000', 'Student CS002'],
+        )
+        for certificate in Certificate.objects.exclude(roll_number='CS000'):
+            self.assertTrue(certificate.certificate_image.storage.exists(certificate.certificate_image.name))
+            self.assertTrue(certificate.render_fingerprint)
+
+
+@override_settings(CERTIFICATE_LAZY_RENDERING=True, CERTIFICATE_ID_FILTER_ENABLED=False)
+class CertificateJobTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('staff', password='secret')
+        for roll_number in ('CS001', 'CS002', 'CS003'):
+            make_student(roll_number)
+
+    def test_post_only_queues_a_job(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('generate_certificates_from_db'), {'template': 'CSCIndia'},
+            headers={'x-requested-with': 'XMLHttpRequest'},
+        )
+        self.assertEqual(response.status_code, 202)
+        job = CertificateJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual(response.json()['progress_url'], reverse('certificate_job_progress', args=[job.pk]))
+        self.assertEqual((job.status, job.template_name, job.total_count), (CertificateJob.STATUS_QUEUED, 'CSCIndia', 3))
+        self.assertEqual(job.max_student_id, Certificate_student.objects.latest('pk').pk)
+        self.assertEqual(job.created_by, self.user)
+        self.assertFalse(Certificate.objects.exists())
+
+    def test_nothing_to_queue_without_students(self):
+        Certificate_student.objects.all().delete()
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('generate_certificates_from_db'), {'template': 'CSCIndia'})
+        self.assertRedirects(response, reverse('generate_certificates_from_db'), fetch_redirect_response=False)
+        self.assertFalse(CertificateJob.objects.exists())
+
+    def test_jobs_are_claimed_once_in_order(self):
+        first = enqueue_bulk_job('CSCIndia')
+        second = enqueue_bulk_job('CSCIndia')
+        self.assertEqual(claim_next_job(worker_name='a').pk, first.pk)
+        self.assertEqual(claim_next_job(worker_name='b').pk, second.pk)
+        # Both are running with a fresh heartbeat: nothing left to take
+        self.assertIsNone(claim_next_job(worker_name='c'))
+
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.worker), (CertificateJob.STATUS_RUNNING, 'a'))
+        self.assertIsNotNone(first.started_at)
+
+    def test_students_uploaded_after_queueing_are_left_out(self):
+        job = enqueue_bulk_job('CSCIndia')
+        make_student('CS004')
+        run_job(claim_next_job(), workers=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.success_count), (CertificateJob.STATUS_COMPLETED, 3))
+        self.assertEqual(list(Certificate_student.objects.values_list('roll_number', flat=True)), ['CS004'])
+
+    def test_progress_json(self):
+        job = enqueue_bulk_job('CSCIndia')
+        run_job(claim_next_job(), workers=1)
+        CertificateJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=10))
+
+        self.client.force_login(self.user)
+        progress = self.client.get(reverse('certificate_job_progress', args=[job.pk])).json()
+        self.assertEqual(progress['job_id'], job.pk)
+        self.assertEqual(progress['status'], CertificateJob.STATUS_COMPLETED)
+        self.assertEqual((progress['total'], progress['processed']), (3, 3))
+        self.assertEqual((progress['done'], progress['failed'], progress['duplicate']), (3, 0, 0))
+        self.assertGreater(progress['throughput'], 0)
+        self.assertIsNotNone(progress['finished_at'])
+
+    def test_progress_needs_login_and_a_job(self):
+        job = enqueue_bulk_job('CSCIndia')
+        response = self.client.get(reverse('certificate_job_progress', args=[job.pk]))
+        self.assertRedirects(response, reverse('page_not_found'), fetch_redirect_response=False)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('certificate_job_progress', args=[job.pk + 1])).status_code, 404)
+
+
+@override_settings(CERTIFICATE_LAZY_RENDERING=True, CERTIFICATE_ID_FILTER_ENABLED=False)
+class JobResumeTests(TemporaryMediaMixin, TestCase):
+
+    def test_resume_after_crash_continues_after_last_committed_chunk(self):
+        for number in range(1, 6):
+            make_student(f'CS00{number}')
+        enqueue_bulk_job('CSCIndia')
+        job = claim_next_job(worker_name='crashed')
+
+        chunk_done = JobCertificateGenerator.chunk_done
+        calls = []
+
+        def crash_on_second_chunk(generator, last_student_id):
+            calls.append(last_student_id)
+            if len(calls) == 2:
+                raise RuntimeError('worker died')
+            chunk_done(generator, last_student_id)
+
+        with mock.patch.object(JobCertificateGenerator, 'chunk_done', crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                JobCertificateGenerator(job, workers=1, chunk_size=2).run(Certificate_student.objects.all())
+
+        # Only the first chunk committed, with its outbox rows and checkpoint
+        job.refresh_from_db()
+        self.assertEqual(job.status, CertificateJob.STATUS_RUNNING)
+        self.assertEqual(job.success_count, 2)
+        self.assertEqual(Certificate.objects.count(), 2)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+        self.assertEqual(Certificate_student.objects.count(), 3)
+
+        CertificateJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        resumed = claim_next_job(worker_name='rescuer', stale_after=60)
+        self.assertEqual(resumed.pk, job.pk)
+        run_job(resumed, workers=1)
+
+        resumed.refresh_from_db()
+        self.assertEqual(resumed.status, CertificateJob.STATUS_COMPLETED)
+        self.assertEqual((resumed.success_count, resumed.fail_count, resumed.duplicate_count), (5, 0, 0))
+        self.assertEqual(Certificate.objects.count(), 5)
+        self.assertEqual(Certificate.objects.values('roll_number').distinct().count(), 5)
+        self.assertEqual(EmailOutbox.objects.count(), 5)
+        self.assertEqual(CertificateJobResult.objects.filter(job=job).count(), 5)
+        self.assertFalse(Certificate_student.objects.exists())
+
+    @override_settings(CERTIFICATE_LAZY_RENDERING=False, GOOGLE_DRIVE_UPLOAD_ON_GENERATE=False)
+    def test_resume_removes_files_of_the_uncommitted_chunk(self):
+        self.write_template(size=(1200, 850))
+        for number in range(1, 5):
+            make_student(f'CS00{number}')
+        enqueue_bulk_job('CSCIndia')
+        job = claim_next_job(worker_name='crashed')
+
+        chunk_done = JobCertificateGenerator.chunk_done
+
+        def crash_on_second_chunk(generator, last_student_id):
+            if generator.result.success_count > 2:
+                raise RuntimeError('worker died')
+            chunk_done(generator, last_student_id)
+
+        with mock.patch.object(JobCertificateGenerator, 'chunk_done', crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                JobCertificateGenerator(job, workers=1, chunk_size=2).run(Certificate_student.objects.all())
+        job.refresh_from_db()
+        self.assertEqual(len(job.pending_files), 6)
+
+        run_job(job, workers=1)
+        referenced = {
+            name
+            for certificate in Certificate.objects.all()
+            for name in (
+                certificate.certificate_image.name,
+                certificate.qr_code_image.name,
+                certificate.certificate_pdf.name,
+            )
+        }
+        on_disk = {
+            path.relative_to(self.media_root).as_posix()
+            for pattern in ('*.png', '*.pdf')
+            for path in self.media_root.rglob(pattern)
+        }
+        self.assertEqual(len(referenced), 12)
+        self.assertEqual(on_disk, referenced)
+
+
+class StudentImportTests(TestCase):
+
+    def test_validate_normalises_valid_rows(self):
+        valid, errors = validate_student_frame(student_frame([(2, sheet_row())]))
+        self.assertEqual(errors, [])
+        record = valid.to_dict('records')[0]
+        self.assertEqual(record['full_name'], 'Asha Verma')
+        self.assertEqual(record['roll_number'], 'CS001')
+        self.assertEqual(record['email'], 'asha@example.com')
+        self.assertEqual(record['start_date'], date(2024, 1, 1))
+        self.assertEqual(record['contact'], 'NONE')
+
+    def test_validate_reports_each_bad_row(self):
+        frame = student_frame([
+            (2, sheet_row()),
+            (3, sheet_row(name='R2D2', roll='cs002')),
+            (4, sheet_row(roll='cs003', email='not-an-email')),
+            (5, sheet_row(roll='cs004', start='31-03-2024', end='01-01-2024')),
+            (6, sheet_row(roll='CS001')),
+        ])
+        valid, errors = validate_student_frame(frame)
+        self.assertEqual(list(valid['roll_number']), ['CS001'])
+        self.assertEqual([row for row, _ in errors], [3, 4, 5, 6])
+        self.assertIn('Name can only contain', errors[0][1])
+        self.assertIn('Email is not a valid address', errors[1][1])
+        self.assertIn('End Date is before Start Date', errors[2][1])
+        self.assertIn('Roll No repeats row 2', errors[3][1])
+
+    def test_validate_catches_repeats_across_frames(self):
+        seen_rolls = {}
+        validate_student_frame(student_frame([(2, sheet_row())]), seen_rolls)
+        valid, errors = validate_student_frame(student_frame([(3, sheet_row(roll='CS001'))]), seen_rolls)
+        self.assertTrue(valid.empty)
+        self.assertEqual(errors, [(3, 'Roll No repeats row 2')])
+
+    def write_sheet(self, rows):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(list(sheet_row()))
+        for row in rows:
+            sheet.append(list(row.values()))
+        path = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False).name
+        self.addCleanup(Path(path).unlink)
+        workbook.save(path)
+        return path
+
+    def test_import_sheet_in_frames(self):
+        make_student('CS002')
+        path = self.write_sheet([
+            sheet_row(),
+            sheet_row(roll='cs002'),
+            sheet_row(name='', roll='cs003'),
+            sheet_row(roll='cs004'),
+            sheet_row(roll='cs001'),
+        ])
+
+        report = import_student_sheet(path, chunk_size=2, rows_per_frame=2)
+        self.assertEqual((report.inserted, report.skipped, report.invalid), (2, 1, 2))
+        self.assertEqual([row for row, _ in report.errors], [4, 6])
+        # One entry per chunk written, none for validation
+        self.assertEqual(report.chunks, [{'inserted': 1, 'skipped': 1}, {'inserted': 1, 'skipped': 0}])
+        self.assertEqual(
+            sorted(Certificate_student.objects.values_list('roll_number', flat=True)), ['CS001', 'CS002', 'CS004']
+        )
+
+    def test_whole_sheet_is_validated_before_anything_is_written(self):
+        path = self.write_sheet([sheet_row(roll=f'cs{number:03d}') for number in range(1, 6)])
+        validated = []
+
+        def validate_then_fail(frame, seen_rolls=None):
+            self.assertFalse(Certificate_student.objects.exists())
+            validated.append(len(frame))
+            if len(validated) == 3:
+                raise ValueError('Unreadable frame')
+            return validate_student_frame(frame, seen_rolls)
+
+        with mock.patch('certificates.importers.validate_student_frame', validate_then_fail):
+            with self.assertRaises(ValueError):
+                import_student_sheet(path, chunk_size=1, rows_per_frame=2)
+        self.assertEqual(validated, [2, 2, 1])
+        self.assertFalse(Certificate_student.objects.exists())
+
+    def test_validate_sheet_reports_without_writing(self):
+        path = self.write_sheet([sheet_row(), sheet_row(roll='cs002', email='nope'), sheet_row(roll='CS001')])
+        valid, errors = validate_student_sheet(path, rows_per_frame=1)
+        self.assertEqual(list(valid['roll_number']), ['CS001'])
+        self.assertEqual([row for row, _ in errors], [3, 4])
+        self.assertFalse(Certificate_student.objects.exists())
+
+
+class FakeConnection:
+    """Mail connection that drops the first ``failures`` sends."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+        self.opened = 0
+        self.closed = 0
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        self.closed += 1
+
+    def send_messages(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.extend(messages)
+        return len(messages)
+
+
+def plain_certificate_email(certificate, connection=None, with_attachments=None):
+    return EmailMessage('Certificate', certificate.full_name, 'noreply@example.com', [certificate.email])
+
+
+@mock.patch('certificates.mailer.build_certificate_email', plain_certificate_email)
+class CertificateMailerTests(TestCase):
+
+    def setUp(self):
+        self.certificates = [make_certificate(f'CS00{number}', email=f'cs00{number}@example.com') for number in range(1, 4)]
+
+    def test_batch_reuses_one_connection(self):
+        connection = FakeConnection()
+        with mock.patch('certificates.mailer.get_connection') as get_connection:
+            with CertificateMailer(connection=connection) as mailer:
+                outcomes = mailer.send_certificates(self.certificates)
+        get_connection.assert_not_called()
+        self.assertTrue(all(outcome.sent for outcome in outcomes))
+        self.assertEqual([message.to for message in connection.sent], [[c.email] for c in self.certificates])
+        self.assertEqual(connection.closed, 1)
+
+    def test_dropped_connection_is_reopened_once(self):
+        dropped = FakeConnection(failures=1)
+        fresh = FakeConnection()
+        with mock.patch('certificates.mailer.get_connection', return_value=fresh) as get_connection:
+            outcomes = CertificateMailer(connection=dropped).send_certificates(self.certificates)
+        get_connection.assert_called_once()
+        self.assertTrue(all(outcome.sent for outcome in outcomes))
+        self.assertEqual(len(fresh.sent), 3)
+        self.assertEqual(dropped.closed, 1)
+
+    def test_message_fails_when_the_retry_fails_too(self):
+        with mock.patch('certificates.mailer.get_connection', return_value=FakeConnection(failures=1)):
+            outcomes = CertificateMailer(connection=FakeConnection(failures=1)).send_certificates(self.certificates)
+        self.assertEqual([outcome.sent for outcome in outcomes], [False, True, True])
+        self.assertIsInstance(outcomes[0].error, smtplib.SMTPServerDisconnected)
+
+        flags = dict(Certificate.objects.values_list('roll_number', 'email_sent'))
+        self.assertEqual(flags, {'CS001': False, 'CS002': True, 'CS003': True})
+
+    def test_sends_are_throttled_to_the_rate(self):
+        clock = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        with mock.patch('certificates.mailer.time.monotonic', lambda: clock[0]), \
+                mock.patch('certificates.mailer.time.sleep', sleep):
+            mailer = CertificateMailer(rate_per_minute=120, connection=FakeConnection())
+            mailer.send_certificates(self.certificates[:2])
+            clock[0] += 0.2
+            mailer.send_certificates(self.certificates[2:])
+        self.assertEqual(len(sleeps), 2)
+        self.assertAlmostEqual(sleeps[0], 0.5)
+        self.assertAlmostEqual(sleeps[1], 0.3)
+
+    @override_settings(CERTIFICATE_EMAIL_RATE_PER_MINUTE=0)
+    def test_no_throttle_by_default(self):
+        with mock.patch('certificates.mailer.time.sleep') as sleep:
+            CertificateMailer(connection=FakeConnection()).send_certificates(self.certificates)
+        sleep.assert_not_called()
+
+    def test_mark_email_sent_is_one_update(self):
+        with self.assertNumQueries(1):
+            mark_email_sent(self.certificates)
+        self.assertEqual(Certificate.objects.filter(email_sent=True, email_sent_at__isnull=False).count(), 3)
+        self.assertTrue(all(certificate.email_sent for certificate in self.certificates))
+        with self.assertNumQueries(0):
+            mark_email_sent([])
+
+
+class FakeMailer:
+    """Stands in for CertificateMailer; fails the certificates in ``failing``."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    def send_certificates(self, certificates, update=True):
+        outcomes = []
+        for certificate in certificates:
+            if certificate.pk in self.failing:
+                outcomes.append(MailOutcome(certificate, error=ConnectionError('SMTP down')))
+            else:
+                self.sent.append(certificate.pk)
+                outcomes.append(MailOutcome(certificate))
+        return outcomes
+
+    def close(self):
+        pass
+
+
+@override_settings(
+    CERTIFICATE_ID_FILTER_ENABLED=False,
+    CERTIFICATE_EMAIL_MAX_ATTEMPTS=2,
+    CERTIFICATE_EMAIL_RETRY_DELAY=60,
+)
+class OutboxTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = make_certificate('CS001')
+        self.second = make_certificate('CS002')
+        enqueue_certificate_emails([self.first, self.second])
+
+    def test_enqueue_is_idempotent_while_undelivered(self):
+        enqueue_certificate_emails([self.first])
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_claims_do_not_overlap(self):
+        _, first_batch = claim_outbox_batch(limit=1)
+        _, second_batch = claim_outbox_batch(limit=5)
+        _, third_batch = claim_outbox_batch(limit=5)
+        self.assertEqual(len(first_batch), 1)
+        self.assertEqual(len(second_batch), 1)
+        self.assertNotEqual(first_batch[0].pk, second_batch[0].pk)
+        self.assertEqual(third_batch, [])
+
+    def test_stale_claim_is_released(self):
+        claim_outbox_batch()
+        EmailOutbox.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        _, messages = claim_outbox_batch(stale_after=60)
+        self.assertEqual(len(messages), 2)
+
+    def test_failed_send_is_retried_with_backoff_then_dead(self):
+        mailer = FakeMailer(failing=[self.second.pk])
+        result = drain_outbox(mailer=mailer)
+        self.assertEqual((result.sent_count, result.retry_count, result.dead_count), (1, 1, 0))
+        self.assertEqual(mailer.sent, [self.first.pk])
+
+        sent = EmailOutbox.objects.get(certificate=self.first)
+        self.assertEqual(sent.status, EmailOutbox.STATUS_SENT)
+        self.first.refresh_from_db()
+        self.assertTrue(self.first.email_sent)
+
+        retry = EmailOutbox.objects.get(certificate=self.second)
+        self.assertEqual((retry.status, retry.attempts, retry.claim_token), (EmailOutbox.STATUS_PENDING, 1, ''))
+        self.assertGreater(retry.next_attempt_at, timezone.now())
+        self.assertIn('SMTP down', retry.last_error)
+
+        # Not due yet
+        self.assertEqual(drain_outbox(mailer=mailer).processed_count, 0)
+
+        EmailOutbox.objects.filter(pk=retry.pk).update(next_attempt_at=timezone.now())
+        result = drain_outbox(mailer=mailer)
+        self.assertEqual(result.dead_count, 1)
+        retry.refresh_from_db()
+        self.assertEqual((retry.status, retry.attempts), (EmailOutbox.STATUS_DEAD, 2))
+
+    def test_message_claimed_by_another_worker_is_not_sent(self):
+        mailer = FakeMailer()
+
+        def steal_claim(certificates, update=True):
+            EmailOutbox.objects.filter(certificate=self.second).update(claim_token='other-worker')
+            return FakeMailer.send_certificates(mailer, certificates, update)
+
+        with mock.patch.object(mailer, 'send_certificates', steal_claim):
+            result = drain_outbox(mailer=mailer)
+        self.assertEqual(result.sent_count, 1)
+        self.assertEqual(mailer.sent, [self.first.pk])
+
+
+@override_settings(
+    CERTIFICATE_ID_FILTER_ENABLED=False,
+    CERTIFICATE_EMAIL_ATTACHMENTS=True,
+    CERTIFICATE_EMAIL_RATE_PER_MINUTE=0,
+    GOOGLE_DRIVE_UPLOAD_ON_GENERATE=False,
+)
+class BulkOutboxTests(TemporaryMediaMixin, TestCase):
+    """Emails queued by a bulk chunk, drained before the chunk's follow-ups run."""
+
+    def setUp(self):
+        super().setUp()
+        self.write_template(size=(1200, 850))
+        make_student('CS001')
+        make_student('CS002')
+
+    def drain_after_commit(self):
+        generator = BulkCertificateGenerator('CSCIndia', workers=1)
+        # The drain worker may run as soon as the chunk commits
+        with mock.patch.object(BulkCertificateGenerator, 'finish'):
+            generator.run(Certificate_student.objects.all())
+        return drain_outbox()
+
+    def assert_attachments(self):
+        self.assertEqual(len(mail.outbox), 2)
+        for message in mail.outbox:
+            roll_number = message.to[0].split('@')[0].upper()
+            names = [name for name, _, _ in message.attachments]
+            self.assertEqual(names, [f'{roll_number}.png', f'{roll_number}.pdf'])
+            pdf = message.attachments[1][1]
+            self.assertTrue(pdf.startswith(b'%PDF'))
+
+    @override_settings(CERTIFICATE_LAZY_RENDERING=False)
+    def test_pdf_is_stored_before_the_email_is_queued(self):
+        result = self.drain_after_commit()
+        self.assertEqual(result.sent_count, 2)
+        for certificate in Certificate.objects.all():
+            self.assertTrue(certificate.certificate_pdf.storage.exists(certificate.certificate_pdf.name))
+        self.assert_attachments()
+
+    @override_settings(CERTIFICATE_LAZY_RENDERING=True)
+    def test_lazy_certificate_is_rendered_when_sent(self):
+        result = self.drain_after_commit()
+        self.assertEqual(result.sent_count, 2)
+        self.assertFalse(Certificate.objects.filter(certificate_image='').exists())
+        self.assertFalse(Certificate.objects.filter(certificate_pdf='').exists())
+        self.assert_attachments()
+
+
+@override_settings(
+    CERTIFICATE_ID_FILTER_ENABLED=False,
+    CERTIFICATE_DOWNLOAD_LINK_MAX_AGE=3600,
+    CERTIFICATE_DOWNLOAD_BASE_URL='https://verify.example.com/',
+)
+class DownloadLinkTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_template(size=(1200, 850))
+        self.certificate = make_certificate('CS 001', full_name='ASHA <B>VERMA</B> & CO')
+
+    def download_path(self):
+        return reverse('signed_certificate_download', args=[make_download_token(self.certificate)])
+
+    def test_link_email_carries_the_download_url(self):
+        subject, text, html = render_certificate_email(self.certificate, with_attachments=False)
+        url = get_download_url(self.certificate)
+        self.assertTrue(url.startswith('https://verify.example.com/download/s/'))
+        self.assertIn(url, text)
+        self.assertIn(f'href="{url}"', html)
+        self.assertIn('valid for 1 days', html)
+
+        _, attached_text, attached_html = render_certificate_email(self.certificate, with_attachments=True)
+        self.assertNotIn('/download/s/', attached_text + attached_html)
+
+    def test_html_body_is_escaped(self):
+        _, text, html = render_certificate_email(self.certificate, with_attachments=False)
+        self.assertIn('ASHA <B>VERMA</B> & CO', text)
+        self.assertNotIn('<B>', html)
+        self.assertIn('ASHA &lt;B&gt;VERMA&lt;/B&gt; &amp; CO', html)
+
+    def test_link_downloads_the_certificate(self):
+        response = self.client.get(self.download_path())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="CS_001.', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content))
+
+    def test_expired_link_is_refused(self):
+        path = self.download_path()
+        issued = timezone.now().timestamp()
+        with mock.patch('django.core.signing.time.time', return_value=issued + 3601):
+            self.assertEqual(self.client.get(path).status_code, 404)
+        with mock.patch('django.core.signing.time.time', return_value=issued + 3500):
+            self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_tampered_link_is_refused(self):
+        path = self.download_path()
+        self.assertEqual(self.client.get(path[:-2] + 'xx/').status_code, 404)
+
+    def test_unverified_certificate_is_not_served(self):
+        path = self.download_path()
+        Certificate.objects.filter(pk=self.certificate.pk).update(is_verified=False)
+        self.assertEqual(self.client.get(path).status_code, 404)
+        self.certificate.refresh_from_db()
+        self.assertFalse(self.certificate.certificate_image)
+
+
+def file_sha256_of(certificate):
+    with certificate.certificate_image.open('rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    """Just enough of the Drive v3 resumable upload protocol for DriveUploader."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def respond(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_session(self, file_id):
+        drive = self.server.drive
+        session_id = str(len(drive.sessions) + 1)
+        drive.sessions[session_id] = {'file_id': file_id, 'metadata': json.loads(self.read_body() or b'{}'), 'data': b''}
+        location = f'http://{self.headers["Host"]}/upload/session/{session_id}'
+        self.respond(200, headers=[('Location', location)])
+
+    def do_POST(self):
+        self.server.drive.requests.append(('create', None))
+        self.start_session(None)
+
+    def do_PATCH(self):
+        file_id = self.path.split('?')[0].rsplit('/', 1)[1]
+        self.server.drive.requests.append(('update', file_id))
+        if file_id not in self.server.drive.files:
+            self.read_body()
+            return self.respond(404, b'{"error": {"code": 404}}', [('Content-Type', 'application/json')])
+        self.start_session(file_id)
+
+    def do_PUT(self):
+        drive = self.server.drive
+        session = drive.sessions[self.path.rsplit('/', 1)[1]]
+        session['data'] += self.read_body()
+        drive.chunks += 1
+        total = self.headers['Content-Range'].rsplit('/', 1)[1]
+        if total == '*' or len(session['data']) < int(total):
+            return self.respond(308, headers=[('Range', f'bytes=0-{len(session["data"]) - 1}')])
+        file_id = session['file_id'] or f'drive-{len(drive.files) + 1}'
+        drive.files[file_id] = {**session['metadata'], 'data': session['data']}
+        self.respond(200, json.dumps({'id': file_id}).encode(), [('Content-Type', 'application/json')])
+
+
+class FakeDrive:
+    """A local Drive server for GOOGLE_DRIVE_API_ROOT."""
+
+    def __init__(self):
+        self.files = {}
+        self.sessions = {}
+        self.requests = []
+        self.chunks = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeDriveHandler)
+        self.server.drive = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def api_root(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeDriveMixin(TemporaryMediaMixin):
+    """Point the Drive client at a FakeDrive."""
+
+    def setUp(self):
+        super().setUp()
+        self.drive = FakeDrive()
+        self.addCleanup(self.drive.stop)
+        drive_settings = override_settings(
+            GOOGLE_DRIVE_API_ROOT=self.drive.api_root,
+            GOOGLE_DRIVE_CREDENTIALS_FILE='',
+            GOOGLE_DRIVE_FOLDER_ID='backups',
+            GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE=256 * 1024,
+            GOOGLE_DRIVE_NUM_RETRIES=0,
+        )
+        drive_settings.enable()
+        self.addCleanup(drive_settings.disable)
+        reset_drive_clients()
+        self.addCleanup(reset_drive_clients)
+
+    def make_backed_up_certificate(self, roll_number, content=None, **fields):
+        """A certificate with an image file of ``content`` (random bytes by default)."""
+        certificate = make_certificate(roll_number, **fields)
+        certificate.certificate_image.save(f'{roll_number}.png', ContentFile(content or os.urandom(1024)))
+        return certificate
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False)
+class DriveUploadTests(FakeDriveMixin, TestCase):
+
+    def test_resumable_upload_sends_the_image_in_chunks(self):
+        content = os.urandom(600 * 1024)
+        certificate = self.make_backed_up_certificate('CS001', content, full_name='ASHA VERMA')
+
+        outcome, = DriveUploader(workers=2).upload([certificate])
+
+        self.assertTrue(outcome.uploaded, outcome.error)
+        self.assertEqual(self.drive.chunks, 3)
+        stored = self.drive.files[outcome.file_id]
+        self.assertEqual(stored['data'], content)
+        self.assertEqual(stored['name'], 'ASHA_VERMA.png')
+        self.assertEqual(stored['parents'], ['backups'])
+        certificate.refresh_from_db()
+        self.assertTrue(certificate.drive_uploaded)
+        self.assertEqual(certificate.drive_file_id, outcome.file_id)
+
+    def test_batches_share_the_upload_threads(self):
+        certificates = [self.make_backed_up_certificate(f'CS00{number}') for number in range(1, 7)]
+        self.assertIs(get_upload_pool(2), get_upload_pool(2))
+
+        from googleapiclient import discovery
+        with mock.patch('googleapiclient.discovery.build_from_document', wraps=discovery.build_from_document) as build:
+            first = DriveUploader(workers=2).upload(certificates[:3])
+            second = DriveUploader(workers=2).upload(certificates[3:])
+
+        self.assertTrue(all(outcome.uploaded for outcome in first + second))
+        self.assertEqual(len(self.drive.files), 6)
+        # One Drive service per pool thread, not per upload or per batch
+        self.assertLessEqual(build.call_count, 2)
+
+    def test_failed_upload_is_reported(self):
+        certificate = self.make_backed_up_certificate('CS001')
+        certificate.certificate_image.name = 'certificates/missing.png'
+
+        outcome, = DriveUploader(workers=1).upload([certificate])
+
+        self.assertFalse(outcome.uploaded)
+        self.assertEqual(self.drive.files, {})
+        self.assertFalse(Certificate.objects.get(pk=certificate.pk).drive_uploaded)
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False)
+class DriveSyncTests(FakeDriveMixin, TestCase):
+
+    def test_sync_uploads_only_changed_images(self):
+        unchanged = self.make_backed_up_certificate('CS001')
+        changed = self.make_backed_up_certificate('CS002')
+        self.make_backed_up_certificate('CS003')
+        make_certificate('CS004')  # not rendered yet, nothing to back up
+
+        self.assertEqual(sync_drive_backups(workers=2), (3, 0))
+        for certificate in Certificate.objects.exclude(certificate_image=''):
+            self.assertEqual(certificate.drive_sha256, file_sha256_of(certificate))
+            self.assertEqual(certificate.image_sha256, certificate.drive_sha256)
+        self.assertFalse(certificates_needing_sync().exists())
+        self.assertEqual(sync_drive_backups(workers=2), (0, 0))
+        backed_up_at = Certificate.objects.get(pk=unchanged.pk).drive_uploaded_at
+
+        # A regenerated image records a new hash
+        Certificate.objects.filter(pk=changed.pk).update(image_sha256='0' * 64)
+        self.assertEqual(list(certificates_needing_sync()), [Certificate.objects.get(pk=changed.pk)])
+        self.drive.requests.clear()
+        self.assertEqual(sync_drive_backups(workers=2), (1, 0))
+        changed.refresh_from_db()
+        self.assertEqual(self.drive.requests, [('update', changed.drive_file_id)])
+        self.assertEqual(changed.drive_sha256, '0' * 64)
+        self.assertEqual(Certificate.objects.get(pk=unchanged.pk).drive_uploaded_at, backed_up_at)
+
+    def test_existing_drive_file_is_replaced_in_place(self):
+        certificate = self.make_backed_up_certificate('CS001', b'first version')
+        outcome, = DriveUploader(workers=1).upload([certificate])
+        file_id = outcome.file_id
+
+        certificate.refresh_from_db()
+        certificate.certificate_image.save('CS001.png', ContentFile(b'second version'), save=False)
+        certificate.image_sha256 = ''
+        certificate.save()
+        outcome, = DriveUploader(workers=1).upload([certificate])
+
+        self.assertEqual(outcome.file_id, file_id)
+        self.assertEqual(list(self.drive.files), [file_id])
+        self.assertEqual(self.drive.files[file_id]['data'], b'second version')
+        certificate.refresh_from_db()
+        self.assertEqual(certificate.drive_sha256, hashlib.sha256(b'second version').hexdigest())
+        self.assertEqual(certificate.image_sha256, certificate.drive_sha256)
+
+    def test_deleted_drive_file_is_uploaded_again(self):
+        certificate = self.make_backed_up_certificate('CS001')
+        Certificate.objects.filter(pk=certificate.pk).update(drive_file_id='deleted-on-drive')
+        certificate.refresh_from_db()
+
+        outcome, = DriveUploader(workers=1).upload([certificate])
+
+        self.assertTrue(outcome.uploaded, outcome.error)
+        self.assertEqual([kind for kind, _ in self.drive.requests], ['update', 'create'])
+        self.assertNotEqual(outcome.file_id, 'deleted-on-drive')
+        self.assertEqual(Certificate.objects.get(pk=certificate.pk).drive_file_id, outcome.file_id)
+
+    def test_trust_existing_backups(self):
+        certificate = self.make_backed_up_certificate('CS001')
+        Certificate.objects.filter(pk=certificate.pk).update(
+            drive_uploaded=True,
+            drive_file_id='uploaded-before-hashes',
+            image_sha256=file_sha256_of(certificate),
+        )
+        self.assertTrue(certificates_needing_sync().exists())
+        self.assertEqual(trust_existing_backups(), 1)
+        self.assertFalse(certificates_needing_sync().exists())
+
+
+@override_settings(
+    CERTIFICATE_LAZY_RENDERING=True,
+    CERTIFICATE_ID_FILTER_ENABLED=False,
+    CERTIFICATE_RENDER_LOCK_TIMEOUT=60,
+)
+class FirstAccessRenderTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_template(size=(1200, 850))
+        self.certificate = make_certificate('CS001')
+
+    def claim(self, age):
+        Certificate.objects.filter(pk=self.certificate.pk).update(
+            render_claimed_at=timezone.now() - timedelta(seconds=age)
+        )
+
+    def claimed_at(self):
+        return Certificate.objects.get(pk=self.certificate.pk).render_claimed_at
+
+    def test_unclaimed_certificate_is_rendered_once(self):
+        with mock.patch('certificates.utils.render_certificate', wraps=render_certificate) as render:
+            ensure_certificate_rendered(self.certificate)
+            ensure_certificate_rendered(Certificate.objects.get(pk=self.certificate.pk))
+        self.assertEqual(render.call_count, 1)
+        stored = Certificate.objects.get(pk=self.certificate.pk)
+        self.assertEqual(stored.certificate_image.name, self.certificate.certificate_image.name)
+        self.assertTrue(stored.image_sha256)
+        self.assertIsNone(stored.render_claimed_at)
+
+    def test_waits_for_a_render_claimed_elsewhere(self):
+        self.claim(age=1)
+        sleeps = []
+
+        def other_process_finishes(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 3:
+                Certificate.objects.filter(pk=self.certificate.pk).update(
+                    certificate_image='certificates/rendered-elsewhere.png',
+                    render_claimed_at=None,
+                )
+
+        with mock.patch('certificates.utils.time.sleep', other_process_finishes), \
+                mock.patch('certificates.utils.render_certificate') as render:
+            ensure_certificate_rendered(self.certificate)
+        render.assert_not_called()
+        self.assertEqual(len(sleeps), 3)
+        self.assertEqual(self.certificate.certificate_image.name, 'certificates/rendered-elsewhere.png')
+
+    def test_abandoned_claim_is_taken_over(self):
+        self.claim(age=61)
+        with mock.patch('certificates.utils.time.sleep') as sleep:
+            ensure_certificate_rendered(self.certificate)
+        sleep.assert_not_called()
+        self.assertTrue(self.certificate.certificate_image)
+        self.assertIsNone(self.claimed_at())
+
+    def test_failed_render_releases_the_claim(self):
+        with mock.patch('certificates.utils.render_certificate', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                ensure_certificate_rendered(self.certificate)
+        self.assertIsNone(self.claimed_at())
+        self.assertFalse(Certificate.objects.get(pk=self.certificate.pk).certificate_image)
+
+    def test_pdf_waits_for_the_same_claim(self):
+        self.claim(age=1)
+
+        def other_process_finishes(seconds):
+            Certificate.objects.filter(pk=self.certificate.pk).update(
+                certificate_pdf='certificates/pdf/rendered-elsewhere.pdf',
+                render_claimed_at=None,
+            )
+
+        with mock.patch('certificates.utils.time.sleep', other_process_finishes), \
+                mock.patch('certificates.utils.generate_certificate_pdf') as generate:
+            ensure_certificate_pdf(self.certificate)
+        generate.assert_not_called()
+        self.assertEqual(self.certificate.certificate_pdf.name, 'certificates/pdf/rendered-elsewhere.pdf')
+
+    def test_pdf_download_generates_the_pdf_on_first_access(self):
+        url = reverse('download_certificate_pdf', args=[self.certificate.certificate_id])
+        with mock.patch('certificates.utils.generate_certificate_pdf', wraps=generate_certificate_pdf) as generate:
+            first = self.client.get(url)
+            second = self.client.get(url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        self.assertTrue(first.content.startswith(b'%PDF'))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(generate.call_count, 1)
+        stored = Certificate.objects.get(pk=self.certificate.pk)
+        self.assertTrue(stored.certificate_pdf.storage.exists(stored.certificate_pdf.name))
+        self.assertIsNone(stored.render_claimed_at)
+
+
+@override_settings(CERTIFICATE_LAZY_RENDERING=False, CERTIFICATE_ID_FILTER_ENABLED=False)
+class RegenerateCertificateTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_template(size=(1200, 850))
+        self.certificate = make_certificate('CS001')
+        self.assertTrue(regenerate_certificate(self.certificate))
+
+    def stored_files(self):
+        return {
+            field: (getattr(self.certificate, field).name, getattr(self.certificate, field).read())
+            for field in ('certificate_image', 'qr_code_image', 'certificate_pdf')
+        }
+
+    def media_files(self):
+        return sorted(
+            path.relative_to(self.media_root).as_posix()
+            for folder in ('certificates', 'qr_codes')
+            for path in (self.media_root / folder).rglob('*')
+            if path.is_file()
+        )
+
+    def test_unchanged_certificate_is_skipped(self):
+        before = self.stored_files()
+        with mock.patch('certificates.utils.render_certificate') as render, \
+                mock.patch('certificates.utils.generate_certificate_pdf') as generate_pdf:
+            self.assertFalse(regenerate_certificate(Certificate.objects.get(pk=self.certificate.pk)))
+        render.assert_not_called()
+        generate_pdf.assert_not_called()
+        self.certificate.refresh_from_db()
+        self.assertEqual(self.stored_files(), before)
+
+    def test_changed_certificate_is_overwritten_in_place(self):
+        before = self.stored_files()
+        files = self.media_files()
+        self.assertEqual(len(files), 3)
+
+        Certificate.objects.filter(pk=self.certificate.pk).update(full_name='ASHA RAO')
+        certificate = Certificate.objects.get(pk=self.certificate.pk)
+        self.assertTrue(regenerate_certificate(certificate))
+
+        self.certificate.refresh_from_db()
+        after = self.stored_files()
+        for field in ('certificate_image', 'certificate_pdf'):
+            self.assertEqual(after[field][0], before[field][0])
+            self.assertNotEqual(after[field][1], before[field][1])
+        self.assertNotEqual(self.certificate.render_fingerprint, '')
+        self.assertEqual(self.media_files(), files)
+
+    def test_forced_regeneration_renders_again(self):
+        with mock.patch('certificates.utils.render_certificate', wraps=render_certificate) as render:
+            self.assertTrue(regenerate_certificate(self.certificate, force=True))
+        render.assert_called_once()
+
+    def test_failed_rename_keeps_the_old_file(self):
+        before = self.stored_files()
+        files = self.media_files()
+        with mock.patch('certificates.utils.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                regenerate_certificate(self.certificate, force=True)
+        self.certificate.refresh_from_db()
+        self.assertEqual(self.stored_files(), before)
+        self.assertEqual(self.media_files(), files)
+
+    @override_settings(CERTIFICATE_LAZY_RENDERING=True)
+    def test_lazy_certificate_without_pdf_gets_none(self):
+        certificate = make_certificate('CS002')
+        self.assertTrue(regenerate_certificate(certificate))
+        self.assertTrue(certificate.certificate_image)
+        self.assertFalse(Certificate.objects.get(pk=certificate.pk).certificate_pdf)
+
+
+def png_bytes(size=(600, 400), color='white'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False, CERTIFICATE_RENDER_PLAN_CHECK_INTERVAL=5)
+class RenderPlanTests(TemporaryMediaMixin, TestCase):
+
+    def make_template(self, **fields):
+        template = CertificateTemplate(name='Spring Fest', name_x=120, name_y=90, qr_x=500, qr_y=300, qr_size=80, **fields)
+        template.template_image.save('spring.png', ContentFile(png_bytes()), save=False)
+        template.save()
+        return template
+
+    def test_image_template_without_row_uses_the_builtin_layout(self):
+        plan = get_render_plan('CSCIndia')
+        self.assertEqual(plan.source, 'builtin')
+        self.assertEqual(plan.background_path, str(get_template_path('CSCIndia')))
+
+    def test_template_row_is_compiled(self):
+        template = self.make_template(text_align='center', font_color='#112233')
+        plan = get_render_plan('springfest')
+
+        self.assertEqual(plan.source, f'CertificateTemplate:{template.pk}:{template.updated_at.isoformat()}')
+        self.assertEqual(plan.background_path, template.template_image.path)
+        name_box = next(box for box in plan.texts if box.field == 'full_name')
+        self.assertEqual((name_box.x, name_box.y, name_box.align, name_box.fill), (120, 90, 'center', '#112233'))
+        self.assertEqual((plan.qr.x, plan.qr.y, plan.qr.width, plan.qr.height), (500, 300, 80, 80))
+        self.assertIs(get_render_plan('Spring Fest'), plan)
+
+        image_bytes, _ = render_certificate(get_render_fields(make_certificate()), plan=plan)
+        self.assertEqual(Image.open(BytesIO(image_bytes)).size, (600, 400))
+
+    def test_signature_is_checked_at_most_once_per_interval(self):
+        self.make_template()
+        clock = [1000.0]
+        with mock.patch('certificates.layout.time.monotonic', lambda: clock[0]):
+            plan = get_render_plan('Spring Fest')
+            with self.assertNumQueries(0):
+                for _ in range(3):
+                    self.assertIs(get_render_plan('Spring Fest'), plan)
+
+            # Edited by another process: no signal reaches this one
+            CertificateTemplate.objects.update(name_x=300, updated_at=timezone.now() + timedelta(seconds=1))
+            clock[0] += 4
+            self.assertIs(get_render_plan('Spring Fest'), plan)
+            clock[0] += 1
+            edited = get_render_plan('Spring Fest')
+
+        self.assertIsNot(edited, plan)
+        self.assertEqual(next(box for box in edited.texts if box.field == 'full_name').x, 300)
+        self.assertNotEqual(edited.digest, plan.digest)
+
+    def test_saving_a_template_invalidates_right_away(self):
+        template = self.make_template()
+        self.assertNotEqual(get_render_plan('Spring Fest').source, 'builtin')
+        template.name_y = 140
+        template.save()
+        self.assertEqual(next(box for box in get_render_plan('Spring Fest').texts if box.field == 'full_name').y, 140)
+
+        template.delete()
+        self.assertEqual(get_render_plan('Spring Fest').source, 'builtin')
+
+    @override_settings(CERTIFICATE_LAZY_RENDERING=False)
+    def test_regenerate_resolves_the_plan_once(self):
+        self.make_template()
+        certificate = make_certificate('CS001', template_name='Spring Fest')
+        with mock.patch('certificates.utils.get_render_plan', wraps=get_render_plan) as lookup, \
+                mock.patch('certificates.pdf.get_render_plan', wraps=get_render_plan) as pdf_lookup:
+            self.assertTrue(regenerate_certificate(certificate))
+        lookup.assert_called_once_with('Spring Fest')
+        pdf_lookup.assert_not_called()
+        self.assertTrue(certificate.certificate_pdf)
+
+
+QR_FORMAT_MASK = 0b101010000010010
+QR_LEVELS = {0b01: 'L', 0b00: 'M', 0b11: 'Q', 0b10: 'H'}
+
+
+def read_qr(image, box):
+    """
+    Read the QR symbol drawn in ``box`` of ``image`` back into modules.
+
+    Returns ``(matrix, level, scale, margins)``: the dark modules, the error
+    correction level from the format information, the pixels per module and
+    the white margins (left, top, right, bottom) between symbol and box.
+    """
+    x, y, width, height = box
+    region = image.convert('L').crop((x, y, x + width, y + height))
+    left, top, right, bottom = region.point(lambda value: 255 if value < 128 else 0).getbbox()
+    # The top-left finder pattern is a run of 7 dark modules
+    finder = 0
+    while region.getpixel((left + finder, top)) < 128:
+        finder += 1
+    scale = finder // 7
+    modules = (right - left) // scale
+    matrix = [
+        [region.getpixel((left + column * scale + scale // 2, top + row * scale + scale // 2)) < 128
+         for column in range(modules)]
+        for row in range(modules)
+    ]
+    cells = [(8, column) for column in (0, 1, 2, 3, 4, 5, 7, 8)] + [(row, 8) for row in (7, 5, 4, 3, 2, 1, 0)]
+    format_bits = 0
+    for row, column in cells:
+        format_bits = format_bits << 1 | matrix[row][column]
+    level = QR_LEVELS[(format_bits ^ QR_FORMAT_MASK) >> 13]
+    return matrix, level, scale, (left, top, width - right, height - bottom)
+
+
+def qr_symbol(data, level):
+    qr = qrcode.QRCode(error_correction=getattr(qrcode.constants, f'ERROR_CORRECT_{level}'), border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False, CERTIFICATE_QR_SIGNING_KEY_FILE='')
+class CertificateQrTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_template(size=(1250, 884))
+        self.certificate = make_certificate('CS001')
+
+    def read_certificate_qr(self):
+        fields = get_render_fields(self.certificate)
+        image_bytes, _ = render_certificate(fields, 'CSCIndia')
+        return fields['verification_url'], read_qr(Image.open(BytesIO(image_bytes)), DEFAULT_QR_BOX)
+
+    def assert_quiet_zone(self, scale, margins):
+        for margin in margins:
+            self.assertGreaterEqual(margin, QR_BORDER * scale)
+
+    def test_rendered_qr_reads_back_at_level_h(self):
+        url, (matrix, level, scale, margins) = self.read_certificate_qr()
+        self.assertEqual(level, 'H')
+        self.assertEqual(scale, 2)
+        self.assertEqual(matrix, qr_symbol(url, 'H'))
+        self.assert_quiet_zone(scale, margins)
+
+    def test_signed_qr_reads_back_with_its_quiet_zone(self):
+        key_file = self.media_root / 'qr.pem'
+        call_command('generate_qr_signing_key', str(key_file), stdout=StringIO())
+        with override_settings(CERTIFICATE_QR_SIGNING_KEY_FILE=str(key_file)), \
+                self.assertLogs('certificates.qr', 'WARNING'):
+            url, (matrix, level, scale, margins) = self.read_certificate_qr()
+        self.assertIn('?t=', url)
+        self.assertEqual(level, 'M')
+        self.assertEqual(matrix, qr_symbol(url, 'M'))
+        self.assert_quiet_zone(scale, margins)
+
+    def test_small_box_keeps_the_quiet_zone(self):
+        url = self.certificate.get_verification_url()
+        with self.assertLogs('certificates.qr', 'WARNING') as logs:
+            modules, _, scale = fit_qr_matrix(url, 80)
+        self.assertIn('error correction L', logs.output[0])
+        self.assertLessEqual((modules + 2 * QR_BORDER) * scale, 80)
+
+    def test_standalone_qr_image_has_the_quiet_zone(self):
+        url = self.certificate.get_verification_url()
+        image = generate_qr_code(url, (130, 130)).convert('L')
+        matrix, level, scale, margins = read_qr(image, (0, 0, image.width, image.height))
+        self.assertEqual(level, 'H')
+        self.assertEqual(matrix, qr_symbol(url, 'H'))
+        self.assertEqual(margins, (QR_BORDER * scale,) * 4)
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False)
+class CertificatePdfTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write_template()
+
+    def assert_well_formed(self, data, pages):
+        """Every cross-reference entry points at its object and the pages are all there."""
+        self.assertTrue(data.startswith(b'%PDF-1.7'))
+        self.assertTrue(data.endswith(b'%%EOF\n'))
+        xref = int(data.rsplit(b'startxref\n', 1)[1].split()[0])
+        self.assertTrue(data[xref:].startswith(b'xref\n'))
+        entries = data[xref:].split(b'\n')[3:]
+        for obj_id, entry in enumerate(entries, start=1):
+            if not entry.endswith(b' n '):
+                break
+            offset = int(entry[:10])
+            self.assertTrue(data[offset:].startswith(f'{obj_id} 0 obj'.encode()), obj_id)
+        self.assertIn(f'/Count {pages} >>'.encode(), data)
+
+    def test_single_certificate_pdf(self):
+        data = render_certificate_pdf(get_render_fields(make_certificate()), 'CSCIndia')
+        self.assert_well_formed(data, pages=1)
+
+    def test_booklet_has_a_page_per_certificate(self):
+        make_certificate('CS001')
+        make_certificate('CS002', full_name='RAVI KUMAR')
+        data = b''.join(stream_certificates_pdf(Certificate.objects.order_by('roll_number')))
+        self.assert_well_formed(data, pages=2)
+
+    @skipUnless(pypdf, 'pypdf is not installed')
+    def test_pdf_parses_with_text(self):
+        make_certificate('CS001')
+        make_certificate('CS002', full_name='RAVI KUMAR')
+        data = b''.join(stream_certificates_pdf(Certificate.objects.order_by('roll_number')))
+        reader = pypdf.PdfReader(BytesIO(data), strict=True)
+        self.assertEqual(len(reader.pages), 2)
+        self.assertIn('ASHA VERMA', reader.pages[0].extract_text())
+        self.assertIn('RAVI KUMAR', reader.pages[1].extract_text())
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False)
+class VerificationCacheTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.certificate = make_certificate('CS001')
+
+    def lookup(self, method='roll_number', value='CS001'):
+        return lookup_certificate(method, value)
+
+    def test_repeated_lookups_are_served_from_the_cache(self):
+        self.assertEqual(self.lookup()['course'], 'Python Programming')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup()['course'], 'Python Programming')
+            self.assertEqual(lookup_certificates('roll_number', ['cs001'])['cs001']['roll_number'], 'CS001')
+
+    def test_not_found_is_cached_until_the_certificate_is_saved(self):
+        self.assertIsNone(self.lookup(value='CS002'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.lookup(value='CS002'))
+        make_certificate('CS002')
+        self.assertEqual(self.lookup(value='CS002')['roll_number'], 'CS002')
+
+    def test_save_drops_the_cached_lookup(self):
+        self.lookup()
+        self.certificate.course = 'Data Science'
+        self.certificate.save()
+        self.assertEqual(self.lookup()['course'], 'Data Science')
+
+    def test_changed_roll_number_drops_the_old_lookup(self):
+        self.lookup()
+        self.certificate.roll_number = 'CS009'
+        self.certificate.save()
+        self.assertIsNone(self.lookup())
+        self.assertEqual(self.lookup(value='cs009')['certificate_id'], self.certificate.certificate_id)
+
+    def test_unverify_drops_the_cached_lookups(self):
+        self.lookup()
+        self.lookup('certificate_id', self.certificate.certificate_id)
+        self.certificate.is_verified = False
+        self.certificate.save()
+        self.assertIsNone(self.lookup())
+        self.assertFalse(self.lookup('certificate_id', self.certificate.certificate_id)['is_verified'])
+
+    def test_delete_drops_the_cached_lookups(self):
+        certificate_id = self.certificate.certificate_id
+        self.lookup()
+        self.lookup('certificate_id', certificate_id)
+        self.certificate.delete()
+        self.assertIsNone(self.lookup())
+        self.assertIsNone(self.lookup('certificate_id', certificate_id))
+
+    def test_queryset_updates_are_forgotten_explicitly(self):
+        self.lookup()
+        Certificate.objects.filter(pk=self.certificate.pk).update(course='Data Science')
+        self.assertEqual(self.lookup()['course'], 'Python Programming')
+        forget_certificates(Certificate.objects.filter(pk=self.certificate.pk))
+        self.assertEqual(self.lookup()['course'], 'Data Science')
+
+    def test_cache_is_shared_between_processes(self):
+        # Every process opens its own connection to the verification cache;
+        # the workers' invalidations must reach the web process
+        from django.core.cache import caches
+        from django.core.cache.backends.locmem import LocMemCache
+
+        self.lookup()
+        worker_cache = caches.create_connection('verification')
+        self.assertNotIsInstance(worker_cache, LocMemCache)
+        with mock.patch('certificates.verification.get_verification_cache', return_value=worker_cache):
+            Certificate.objects.filter(pk=self.certificate.pk).update(course='Data Science')
+            forget_certificates([self.certificate])
+        self.assertEqual(self.lookup()['course'], 'Data Science')
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False)
+class VerificationLookupTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.certificate = make_certificate('CS2024001', email='Asha.Verma@Example.com')
+
+    def test_lookups_ignore_case_and_whitespace(self):
+        certificate_id = self.certificate.certificate_id
+        for method, value in [
+            ('certificate_id', certificate_id.upper()),
+            ('certificate_id', f'  {certificate_id.lower()} '),
+            ('email', 'asha.verma@EXAMPLE.COM'),
+            ('roll_number', 'cs2024001'),
+        ]:
+            with self.subTest(method=method, value=value):
+                get_verification_cache().clear()
+                result = lookup_certificate(method, value)
+                self.assertIsNotNone(result)
+                self.assertEqual(result['certificate_id'], certificate_id)
+
+    def test_email_and_roll_number_only_match_verified_certificates(self):
+        Certificate.objects.filter(pk=self.certificate.pk).update(is_verified=False)
+        self.assertIsNone(lookup_certificate('roll_number', 'CS2024001'))
+        self.assertIsNotNone(lookup_certificate('certificate_id', self.certificate.certificate_id))
+
+    def test_batch_lookup_matches_mixed_case(self):
+        results = lookup_certificates('roll_number', ['Cs2024001', 'CS9999999'])
+        self.assertEqual(results['cs2024001']['certificate_id'], self.certificate.certificate_id)
+        self.assertIsNone(results['cs9999999'])
+
+    def test_lower_lookup_is_limited_to_the_indexed_fields(self):
+        self.assertTrue(Certificate.objects.filter(roll_number__lower='cs2024001').exists())
+        with self.assertRaises(FieldError):
+            Certificate.objects.filter(full_name__lower='asha verma').exists()
+
+    def test_benchmark_refuses_the_default_database(self):
+        for database in ['default', 'missing']:
+            with self.subTest(database=database), self.assertRaises(CommandError):
+                call_command('benchmark_verification_lookups', database=database, rows=10, stdout=StringIO())
+        self.assertEqual(Certificate.objects.count(), 1)
+
+
+class CertificateIdFilterTests(TemporaryMediaMixin, TestCase):
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        items = [f'cscindia-{number:08x}' for number in range(5000)]
+        for item in items:
+            bloom.add(item)
+        # Even far beyond its capacity every added item is still reported
+        self.assertTrue(all(item in bloom for item in items))
+
+    @override_settings(CERTIFICATE_ID_FILTER_ERROR_RATE=1e-9)
+    def test_filter_admits_every_issued_id(self):
+        issued = make_certificate('CS001')
+        id_filter = CertificateIdFilter()
+        id_filter.build()
+        self.assertTrue(id_filter.might_be_issued(issued.certificate_id.upper()))
+        self.assertFalse(id_filter.might_be_issued('CSCIndia-neverissued'))
+
+        # Issued by another process: this filter learns it through the stamp
+        later = make_certificate('CS002')
+        touch_stamp()
+        self.assertTrue(id_filter.might_be_issued(later.certificate_id))
+
+    @override_settings(CERTIFICATE_ID_FILTER_ERROR_RATE=1e-9)
+    def test_unknown_ids_skip_the_database(self):
+        issued = make_certificate('CS001')
+        id_filter = CertificateIdFilter()
+        id_filter.build()
+        with mock.patch('certificates.verification.certificate_id_filter', id_filter):
+            with self.assertNumQueries(0):
+                self.assertIsNone(lookup_certificate('certificate_id', 'CSCIndia-neverissued'))
+            self.assertEqual(
+                lookup_certificate('certificate_id', issued.certificate_id)['certificate_id'], issued.certificate_id
+            )
+
+
+@override_settings(
+    CERTIFICATE_ID_FILTER_ENABLED=False,
+    CERTIFICATE_BATCH_VERIFY_API_KEYS=['partner-key'],
+    CERTIFICATE_BATCH_VERIFY_RATE_LIMIT=0,
+)
+class BatchVerifyApiTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = make_certificate('CS001')
+        self.second = make_certificate('CS002', is_verified=False)
+
+    def verify(self, values, method='roll_number', api_key='partner-key'):
+        return self.client.post(
+            reverse('api_verify_batch'), json.dumps({'method': method, 'values': values}),
+            content_type='application/json', HTTP_X_API_KEY=api_key,
+        )
+
+    def verify_csv(self, content, api_key='partner-key'):
+        return self.client.post(
+            reverse('api_verify_batch_csv'),
+            {'file': SimpleUploadedFile('students.csv', content.encode(), content_type='text/csv')},
+            HTTP_X_API_KEY=api_key,
+        )
+
+    def test_results_follow_the_request_order_with_duplicates(self):
+        response = self.verify(['cs002', 'CS404', 'CS001', ' cs001 '])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([result['query'] for result in results], ['cs002', 'CS404', 'CS001', ' cs001 '])
+        self.assertEqual([result['found'] for result in results], [False, False, True, True])
+        self.assertEqual(results[2]['certificate_id'], self.first.certificate_id)
+        self.assertEqual(results[2], {**results[3], 'query': 'CS001'})
+
+        by_id = self.verify([self.second.certificate_id, self.first.certificate_id], method='certificate_id').json()
+        # Looked up by ID the unverified certificate is found, but not verified
+        self.assertEqual([(result['found'], result['verified']) for result in by_id], [(True, False), (True, True)])
+
+    def test_email_lookups_are_refused(self):
+        response = self.verify(['asha.verma@example.com'], method='email')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('certificate_id, roll_number', response.json()['error'])
+
+    @override_settings(CERTIFICATE_BATCH_VERIFY_MAX_ITEMS=3)
+    def test_at_most_max_items_values(self):
+        self.assertEqual(self.verify(['CS001'] * 3).status_code, 200)
+        response = self.verify(['CS001'] * 4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 3', response.json()['error'])
+
+    def test_requests_need_a_valid_api_key(self):
+        for api_key in ['', 'partner-key-2', 'wrong']:
+            with self.subTest(api_key=api_key):
+                self.assertEqual(self.verify(['CS001'], api_key=api_key).status_code, 403)
+                self.assertEqual(self.verify_csv('roll_number\nCS001\n', api_key=api_key).status_code, 403)
+        with override_settings(CERTIFICATE_BATCH_VERIFY_API_KEYS=[]):
+            self.assertEqual(self.verify(['CS001']).status_code, 403)
+
+    @override_settings(CERTIFICATE_BATCH_VERIFY_RATE_LIMIT=2)
+    def test_requests_are_throttled_per_key(self):
+        with mock.patch('certificates.verification.time.time', return_value=600.0):
+            self.assertEqual(self.verify(['CS001']).status_code, 200)
+            self.assertEqual(self.verify_csv('roll_number\nCS001\n').status_code, 200)
+            response = self.verify(['CS001'])
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            with override_settings(CERTIFICATE_BATCH_VERIFY_API_KEYS=['partner-key', 'other-key']):
+                self.assertEqual(self.verify(['CS001'], api_key='other-key').status_code, 200)
+        # A new minute, a new quota
+        with mock.patch('certificates.verification.time.time', return_value=660.0):
+            self.assertEqual(self.verify(['CS001']).status_code, 200)
+
+    def test_csv_rows_are_streamed_back_with_results(self):
+        response = self.verify_csv('Name,Roll Number\nAsha,cs001\nNobody,CS404\nShort\nAsha again,CS001\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['Name', 'Roll Number'] + CSV_RESULT_COLUMNS)
+        self.assertEqual([row[0] for row in rows[1:]], ['Asha', 'Nobody', 'Short', 'Asha again'])
+        self.assertEqual(rows[1][2:5], ['yes', 'yes', self.first.certificate_id])
+        self.assertEqual(rows[2][2:], ['no', 'no', '', '', '', '', ''])
+        self.assertEqual(rows[3][1:3], ['no', 'no'])
+        self.assertEqual(rows[4][2:], rows[1][2:])
+
+    def test_csv_needs_a_batch_lookup_column(self):
+        for header in ['Name,Email', 'Name,Phone']:
+            with self.subTest(header=header):
+                response = self.verify_csv(f'{header}\nAsha,asha.verma@example.com\n')
+                self.assertEqual(response.status_code, 400)
+
+    @override_settings(CERTIFICATE_BATCH_VERIFY_MAX_CSV_ROWS=3)
+    def test_csv_stops_after_max_rows(self):
+        response = self.verify_csv('roll_number\n' + 'CS001\n' * 5)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1 + 3)
+
+    def test_csv_chunks_keep_the_row_order(self):
+        rows = [['CS002'], ['CS001'], ['CS404'], ['cs001'], ['CS002']]
+        lines = list(annotate_csv(iter(rows), ['roll_number'], 0, 'roll_number', max_rows=100, chunk_size=2))
+        results = list(csv.reader(StringIO(''.join(lines))))[1:]
+        self.assertEqual([row[0] for row in results], ['CS002', 'CS001', 'CS404', 'cs001', 'CS002'])
+        self.assertEqual([row[1] for row in results], ['no', 'yes', 'no', 'yes', 'no'])
+
+
+@override_settings(CERTIFICATE_ID_FILTER_ENABLED=False)
+class QrTokenTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+        key_file = self.media_root / 'qr_signing_key.pem'
+        key_file.write_bytes(Ed25519PrivateKey.generate().private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+        signing_settings = override_settings(CERTIFICATE_QR_SIGNING_KEY_FILE=str(key_file))
+        signing_settings.enable()
+        self.addCleanup(signing_settings.disable)
+        self.certificate = make_certificate()
+
+    def token_for(self, certificate):
+        return sign_certificate(
+            certificate.certificate_id, certificate.full_name, certificate.course, certificate.created_at
+        )
+
+    def test_signed_url_verifies_offline(self):
+        url = signed_verification_url(self.certificate)
+        certificate_id, _ = parse_qr(url)
+        self.assertEqual(certificate_id, self.certificate.certificate_id)
+
+        claims = verify_qr(url, get_public_key())
+        self.assertEqual(claims.certificate_id, self.certificate.certificate_id)
+        self.assertEqual(claims.course, self.certificate.course)
+        self.assertTrue(claims.matches_name('  asha   verma '))
+        self.assertFalse(claims.matches_name('Someone Else'))
+
+    def test_published_public_key_verifies_rows(self):
+        payload = self.client.get(reverse('api_verification_public_key')).json()
+        url = signed_verification_url(self.certificate)
+        for key_data in [payload['public_key'], payload['pem']]:
+            with self.subTest(key_data=key_data[:10]):
+                rows = list(verify_rows([
+                    {'qr': url, 'full_name': 'Asha Verma'},
+                    {'qr': url, 'full_name': 'Someone Else'},
+                    {'qr': self.certificate.get_verification_url(), 'full_name': ''},
+                ], load_public_key(key_data)))
+                self.assertEqual([row['valid'] for row in rows], ['yes', 'yes', 'no'])
+                self.assertEqual([row['name_matches'] for row in rows], ['yes', 'no', ''])
+                self.assertEqual(rows[0]['certificate_id'], self.certificate.certificate_id)
+
+    def test_tampered_or_moved_tokens_are_rejected(self):
+        token = self.token_for(self.certificate)
+        tampered = ('A' if token[10] != 'A' else 'B').join([token[:10], token[11:]])
+        with self.assertRaises(InvalidToken):
+            verify_token(self.certificate.certificate_id, tampered, get_public_key())
+        self.assertIsNone(check_token('CSCIndia-otherid1', token))
+        self.assertIsNotNone(check_token(self.certificate.certificate_id, token))
+
+    def test_signed_qr_matches_current_record(self):
+        token = self.token_for(self.certificate)
+        certificate = lookup_certificate('certificate_id', self.certificate.certificate_id)
+        self.assertTrue(check_signed_qr(certificate, token))
+        self.assertIsNone(check_signed_qr(certificate, ''))
+
+        # An edited certificate no longer matches the claims of its old QR code
+        self.certificate.full_name = 'ASHA SHARMA'
+        self.certificate.save()
+        self.assertFalse(check_signed_qr(serialise_certificate(self.certificate), token))
+
+    def test_api_reports_the_signed_qr_check(self):
+        token = self.token_for(self.certificate)
+        url = reverse('api_verify_certificate', args=[self.certificate.certificate_id])
+        self.assertTrue(self.client.get(url, {'t': token}).json()['signed_qr'])
+        self.assertNotIn('signed_qr', self.client.get(url).json())
+        other = make_certificate('CS2024002')
+        other_url = reverse('api_verify_certificate', args=[other.certificate_id])
+        self.assertFalse(self.client.get(other_url, {'t': token}).json()['signed_qr'])
+
+    def test_deleted_certificate_does_not_verify(self):
+        certificate_id = self.certificate.certificate_id
+        self.certificate.delete()
+        self.assertIsNone(lookup_certificate('certificate_id', certificate_id))
@@ -33,7 +33,9 @@ urlpatterns = [
     path('stats/', views.stats, name='stats'),
     path('upload/', views.upload_excel, name='upload_excel'),
     path('generate-from-db/', views.generate_certificates_from_db, name='generate_certificates_from_db'),
+    path('generate-from-db/jobs/<int:job_id>/', views.certificate_job_progress, name='certificate_job_progress'),
     path('certificates/export/', views.export_certificates, name='export_certificates'),
+    path('certificates/export/pdf/', views.export_certificates_pdf, name='export_certificates_pdf'),
     path('certificate/<str:certificate_id>/', views.certificate_detail, name='certificate_detail'),
     path('verify/<str:certificate_id>/', views.verify_certificate, name='verify_certificate'),
     path('download_excel_template/', views.download_excel_template, name='download_excel_template'),
@@ -41,8 +43,12 @@ urlpatterns = [
     # Download endpoints
     path('download/<str:certificate_id>/', views.download_certificate, name='download_certificate'),
     path('download-pdf/<str:certificate_id>/', views.download_certificate_pdf, name='download_certificate_pdf'),
+    path('download/s/<str:token>/', views.signed_certificate_download, name='signed_certificate_download'),
     
     # API endpoints
+    path('api/verify/public-key/', views.api_verification_public_key, name='api_verification_public_key'),
+    path('api/verify/batch/', views.api_verify_batch, name='api_verify_batch'),
+    path('api/verify/batch/csv/', views.api_verify_batch_csv, name='api_verify_batch_csv'),
     path('api/verify/<str:certificate_id>/', views.api_verify_certificate, name='api_verify_certificate'),
 
 
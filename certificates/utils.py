@@ -3,15 +3,27 @@ Certificate generation utilities using PIL (Pillow)
 """
 
 import os
+import json
 import uuid
+import time
+import hashlib
+import threading
+import weakref
 import qrcode
+from datetime import timedelta
 from PIL import Image, ImageDraw, ImageFont
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db.models import Q
 from django.utils import timezone
 from io import BytesIO
 import logging
 
+from .fonts import font_registry
+from .layout import ALIGN_CENTER, ALIGN_RIGHT, get_render_plan
+from .qr import generate_qr_code, paste_qr_code
+from .template_images import template_cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -281,32 +293,6 @@ def draw_text_with_wrap(draw, text, x, y, font, max_width, fill):
 #     img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
 #     return img.resize(size, Image.LANCZOS)  # Ensure sharp resizing
 
-from PIL import Image
-import qrcode
-
-def generate_qr_code(data, size):
-    """
-    Generate a high-resolution QR code without increasing visual size.
-    """
-    # Generate a large QR code internally
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=20,  # Bigger for higher resolution
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-
-    # Render large QR image
-    large_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-    # Resize down to final size for certificate (improves sharpness)
-    high_quality_qr = large_img.resize(size, Image.LANCZOS)
-
-    return high_quality_qr
-
-
 class MockCertificateObj:
     def __init__(self):
         self.full_name = "John Doe"
@@ -355,22 +341,12 @@ from PIL import ImageFont
 import os
 from django.conf import settings
 
+
 def get_default_font(size):
     """
     Returns a PIL ImageFont object using the custom font from settings or falls back to default.
     """
-    try:
-        font_path = getattr(settings, "CERTIFICATE_FONT_PATH", None)
-        if font_path and os.path.exists(font_path):
-            print(f"Font loaded from: {font_path}")  # Or alert if it falls back
-            return ImageFont.truetype(str(font_path), size)  # ✅ Ensure it's a string
-
-        else:
-            print("Font path not found. Using default PIL font.")
-            return ImageFont.load_default()
-    except Exception as e:
-        print(f"Font loading error: {e}")
-        return ImageFont.load_default()
+    return font_registry.get(size)
 from PIL import Image, ImageDraw
 from django.core.files.base import ContentFile
 import os
@@ -395,6 +371,8 @@ def draw_left(draw, text, font, x, y, fill="black"):
     """Draw left-aligned text."""
     draw.text((x, y), text, font=font, fill=fill)
 
+
+
 # --- Main function ---
 #today code
 
@@ -520,65 +498,331 @@ def draw_left(draw, text, font, x, y, fill="black"):
 #         raise
 
 
-def generate_certificate(certificate_obj, template_name='CSCIndia'):
+def get_render_fields(certificate_obj):
+    """Collect the plain values that are drawn onto a certificate."""
+    # The QR code carries a signed token when a signing key is configured
+    from .qrtoken import signed_verification_url
+
+    return {
+        'full_name': certificate_obj.full_name,
+        'college_name': certificate_obj.college_name,
+        'affiliated_name': certificate_obj.affiliated_name,
+        'roll_number': certificate_obj.roll_number,
+        'course': certificate_obj.course,
+        'start_date': certificate_obj.start_date,
+        'end_date': certificate_obj.end_date,
+        'certificate_id': str(certificate_obj.certificate_id),
+        'created_at': certificate_obj.created_at,
+        'verification_url': signed_verification_url(certificate_obj),
+    }
+
+
+def render_certificate(fields, template_name='CSCIndia', plan=None):
+    """
+    Draw a certificate and its QR code and return both as PNG bytes.
+
+    Executes the compiled RenderPlan of the template (see
+    certificates.layout) against ``fields`` (see get_render_fields). Pass a
+    ``plan`` resolved up front to render without any lookups, e.g. in a
+    worker process.
+    """
+    plan = plan or get_render_plan(template_name)
+
+    # Load certificate template (decoded once per process, see TemplateImageCache)
+    template = template_cache.get(plan.template_name, plan.background_path)
+    draw = ImageDraw.Draw(template)
+
+    # Draw Fields (fonts are loaded once per process, see FontRegistry)
+    for box in plan.texts:
+        font = font_registry.get_file(box.font_path, box.font_size)
+        text = box.get_text(fields)
+        if box.align == ALIGN_CENTER:
+            draw_centered(draw, text, font, box.y, box.x, box.x + box.width, fill=box.fill)
+        elif box.align == ALIGN_RIGHT:
+            bbox = font.getbbox(text)
+            draw_left(draw, text, font, box.x + box.width - (bbox[2] - bbox[0]), box.y, fill=box.fill)
+        else:
+            draw_left(draw, text, font, box.x, box.y, fill=box.fill)
+
+    # QR Code (the module matrix is cached per URL, see get_qr_matrix)
+    qr = plan.qr
+    paste_qr_code(template, fields['verification_url'], qr.x, qr.y, qr.width, qr.height)
+
+    # Convert template image to memory
+    image_io = BytesIO()
+    template.save(image_io, format="PNG", quality=95)
+
+    qr_io = BytesIO()
+    generate_qr_code(fields['verification_url'], (qr.width, qr.height)).save(qr_io, format="PNG")
+
+    return image_io.getvalue(), qr_io.getvalue()
+
+
+# Bump when render_certificate draws a plan differently so existing
+# certificates count as stale (layout changes are covered by the plan digest)
+RENDER_LAYOUT_VERSION = 2
+
+_file_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file, cached per process by path, size and modification time."""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return ''
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    digest = _file_digests.get(key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        _file_digests[key] = digest
+    return digest
+
+
+def get_render_fingerprint(fields, template_name, plan=None):
+    """
+    Hash of everything a rendered certificate depends on: the template
+    image, the font files, the compiled layout and the drawn fields.
+    """
+    plan = plan or get_render_plan(template_name)
+    payload = {
+        'renderer': RENDER_LAYOUT_VERSION,
+        'plan': plan.digest,
+        'background': file_digest(plan.background_path),
+        'fonts': sorted({file_digest(box.font_path) for box in plan.texts}),
+        'fields': fields,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replace_file(field_file, filename, content):
+    """
+    Save ``content`` under ``filename`` (within the field's upload_to), replacing old files.
+
+    The content is written to a temporary name next to the target and then
+    renamed over it, so a concurrent download sees either the old or the new
+    file, never a missing or half-written one.
+    """
+    storage = field_file.storage
+    target = field_file.field.generate_filename(field_file.instance, filename)
+    temp_name = storage.save(f"{target}.{uuid.uuid4().hex}.tmp", content)
     try:
-        # Load certificate template
-        template_filename = f"original_certificate_{template_name.lower().replace(' ', '')}.jpg"
-        template_path = os.path.join(settings.MEDIA_ROOT, 'templates', template_filename)
-        if not os.path.exists(template_path):
-            raise FileNotFoundError(f"Template not found: {template_path}")
-
-        template = Image.open(template_path).convert("RGB")
-        draw = ImageDraw.Draw(template)
-
-        # Fonts
-        base_size = settings.CERTIFICATE_FONT_SIZE
-        name_font = get_default_font(int(base_size * 1.4))
-        small_font = get_default_font(int(base_size * 1.0))
-        small_font2 = get_default_font(int(base_size * 0.8))
-
-        # Draw Fields
-        draw_centered(draw, certificate_obj.full_name, small_font, y=375, x_start=460, x_end=1080)
-        draw_centered(draw, certificate_obj.college_name, small_font, y=415, x_start=245, x_end=1065)
-        draw_centered(draw, certificate_obj.affiliated_name, small_font, y=462, x_start=290, x_end=670)
-        draw_centered(draw, certificate_obj.roll_number, small_font, y=458, x_start=915, x_end=1080)
-        draw_centered(draw, certificate_obj.course, small_font, y=512, x_start=690, x_end=1130)
-        draw_centered(draw, certificate_obj.start_date.strftime("%d-%m-%Y"), small_font, y=605, x_start=600, x_end=830)
-        draw_centered(draw, certificate_obj.end_date.strftime("%d-%m-%Y"), small_font, y=605, x_start=910, x_end=1130)
-        draw_left(draw, str(certificate_obj.certificate_id), small_font2, x=296, y=665)
-        draw_left(draw, certificate_obj.created_at.strftime("%d-%m-%Y"), small_font2, x=229, y=700)
-        draw_centered(draw, "Verify at https://verify.cscindia.org.in/", small_font2, 805, 292, 1080)
-        
-
-        # QR Code
-        verification_url = certificate_obj.get_verification_url()
-        qr_img = generate_qr_code(verification_url, size=(110, 80))
-        template.paste(qr_img, (963, 278))
-
-        # Convert template image to memory
-        image_io = BytesIO()
-        template.save(image_io, format="PNG", quality=95)
-        image_io.seek(0)
-
-        # Use only the student's name for the filename, spaces replaced by underscores
-        base_filename = certificate_obj.roll_number.replace(' ', '_')
-        certificate_filename = f"{base_filename}.png"
-        certificate_obj.certificate_image.save(certificate_filename, ContentFile(image_io.read()), save=False)
+        os.replace(storage.path(temp_name), storage.path(target))
+    except Exception:
+        storage.delete(temp_name)
+        raise
+    if field_file.name and field_file.name != target:
+        storage.delete(field_file.name)
+    setattr(field_file.instance, field_file.field.attname, target)
+
+
+def save_certificate_images(certificate_obj, image_bytes, qr_bytes, save=True, overwrite=False):
+    """
+    Store rendered certificate and QR PNGs on the model and save it.
+
+    With ``save=False`` the files are written to storage but the model is not
+    saved, so the caller decides when the row is written. With ``overwrite``
+    the certificate's current files are replaced in place instead of being
+    stored next to them under a suffixed name.
+    """
+    # Use only the student's roll number for the filename, spaces replaced by underscores
+    base_filename = certificate_obj.roll_number.replace(' ', '_')
+    certificate_filename = f"{base_filename}.png"
+    qr_filename = f"qr_{base_filename}.png"
+
+    if overwrite:
+        _replace_file(certificate_obj.certificate_image, certificate_filename, ContentFile(image_bytes))
+        _replace_file(certificate_obj.qr_code_image, qr_filename, ContentFile(qr_bytes))
+    else:
+        certificate_obj.certificate_image.save(certificate_filename, ContentFile(image_bytes), save=False)
 
         # Save QR to model (optional)
-        qr_io = BytesIO()
-        qr_img.save(qr_io, format="PNG")
-        qr_io.seek(0)
-        qr_filename = f"qr_{base_filename}.png"
-        certificate_obj.qr_code_image.save(qr_filename, ContentFile(qr_io.read()), save=False)
+        certificate_obj.qr_code_image.save(qr_filename, ContentFile(qr_bytes), save=False)
+    certificate_obj.image_sha256 = hashlib.sha256(image_bytes).hexdigest()
 
+    if save:
         certificate_obj.save()
+    return certificate_filename
+
+
+def regenerate_certificate(certificate_obj, template_name=None, force=False):
+    """
+    Re-render a certificate if anything it depends on changed.
+
+    Returns False without touching the files when the stored
+    render_fingerprint still matches (unless ``force``); otherwise renders
+    the images and the PDF again, replacing the existing files in place, and
+    returns True. In lazy mode a certificate without a PDF keeps none, it is
+    generated on first access.
+    """
+    template_name = template_name or certificate_obj.template_name or 'CSCIndia'
+    plan = get_render_plan(template_name)
+    fingerprint = get_render_fingerprint(get_render_fields(certificate_obj), template_name, plan)
+    if (
+        not force
+        and certificate_obj.certificate_image
+        and certificate_obj.render_fingerprint == fingerprint
+        and certificate_obj.certificate_image.storage.exists(certificate_obj.certificate_image.name)
+    ):
+        return False
+    generate_certificate(certificate_obj, template_name, plan=plan)
+
+    if certificate_obj.certificate_pdf or not lazy_rendering_enabled():
+        try:
+            generate_certificate_pdf(certificate_obj, plan=plan)
+        except Exception as e:
+            logger.warning(f"PDF generation failed: {e}")
+            # Never leave the PDF of the old render behind
+            if certificate_obj.certificate_pdf:
+                certificate_obj.certificate_pdf.delete(save=False)
+                certificate_obj.save(update_fields=['certificate_pdf'])
+    return True
+
+
+def lazy_rendering_enabled():
+    """Whether certificates are created without images (CERTIFICATE_LAZY_RENDERING)."""
+    return getattr(settings, 'CERTIFICATE_LAZY_RENDERING', False)
+
+
+_render_locks = weakref.WeakValueDictionary()
+_render_locks_guard = threading.Lock()
+
+
+def _get_render_lock(pk):
+    with _render_locks_guard:
+        lock = _render_locks.get(pk)
+        if lock is None:
+            lock = _render_locks[pk] = threading.Lock()
+        return lock
+
+
+def _claim_render(certificate_obj, pending, fields, timeout):
+    """
+    Claim the render of a certificate row still matched by ``pending``.
+
+    Returns True once this process holds the claim on render_claimed_at, or
+    False as soon as another process has stored the file (``fields`` are
+    refreshed from the database, the file field first). Waits while a claim
+    younger than ``timeout`` seconds is held elsewhere and takes over older
+    ones.
+    """
+    while True:
+        now = timezone.now()
+        claimed = pending.filter(
+            Q(render_claimed_at__isnull=True) | Q(render_claimed_at__lt=now - timedelta(seconds=timeout))
+        ).update(render_claimed_at=now)
+        certificate_obj.refresh_from_db(fields=fields)
+        if getattr(certificate_obj, fields[0]):
+            if claimed:
+                pending.model.objects.filter(pk=certificate_obj.pk).update(render_claimed_at=None)
+            return False
+        if claimed:
+            return True
+        # Another process is rendering it
+        time.sleep(0.1)
+
+
+def ensure_certificate_rendered(certificate_obj, timeout=None):
+    """
+    Render and store the certificate and QR images if the certificate has none yet.
+
+    Concurrent first requests render only once: threads of a process wait on
+    a per-certificate lock, and processes claim the render in the database
+    with a conditional UPDATE of render_claimed_at on a row without an
+    image, so the web process and the job and outbox workers never render
+    the same certificate twice. The others wait for the image to appear. A
+    claim older than ``timeout`` seconds (CERTIFICATE_RENDER_LOCK_TIMEOUT)
+    is treated as abandoned and can be taken over.
+    """
+    from .models import Certificate
+
+    if certificate_obj.certificate_image or certificate_obj.pk is None:
+        return certificate_obj
+    if timeout is None:
+        timeout = getattr(settings, 'CERTIFICATE_RENDER_LOCK_TIMEOUT', 60)
+    image_fields = ['certificate_image', 'qr_code_image', 'image_sha256', 'render_fingerprint']
+    unrendered = Certificate.objects.filter(
+        Q(certificate_image='') | Q(certificate_image__isnull=True),
+        pk=certificate_obj.pk,
+    )
+
+    with _get_render_lock(certificate_obj.pk):
+        if not _claim_render(certificate_obj, unrendered, image_fields, timeout):
+            return certificate_obj
+
+        try:
+            plan = get_render_plan(certificate_obj.template_name or 'CSCIndia')
+            fields = get_render_fields(certificate_obj)
+            image_bytes, qr_bytes = render_certificate(fields, plan=plan)
+            certificate_obj.render_fingerprint = get_render_fingerprint(fields, plan.template_name, plan)
+            save_certificate_images(certificate_obj, image_bytes, qr_bytes, save=False)
+        except Exception:
+            unrendered.update(render_claimed_at=None)
+            raise
+        Certificate.objects.filter(pk=certificate_obj.pk).update(
+            render_claimed_at=None,
+            **{field: getattr(certificate_obj, field) for field in image_fields}
+        )
+        # The verification pages show the image once it exists
+        from .verification import forget_certificates
+        forget_certificates([certificate_obj])
+        logger.info(f"Rendered certificate {certificate_obj.certificate_id} on first access")
+    return certificate_obj
+
+
+def ensure_certificate_pdf(certificate_obj, timeout=None):
+    """
+    Generate and store the certificate PDF if the certificate has none yet.
+
+    The PDF counterpart of ensure_certificate_rendered, serialised by the
+    same per-certificate lock and render_claimed_at claim.
+    """
+    from .models import Certificate
+
+    if certificate_obj.certificate_pdf or certificate_obj.pk is None:
+        return certificate_obj
+    if timeout is None:
+        timeout = getattr(settings, 'CERTIFICATE_RENDER_LOCK_TIMEOUT', 60)
+    without_pdf = Certificate.objects.filter(
+        Q(certificate_pdf='') | Q(certificate_pdf__isnull=True),
+        pk=certificate_obj.pk,
+    )
+
+    with _get_render_lock(certificate_obj.pk):
+        if not _claim_render(certificate_obj, without_pdf, ['certificate_pdf'], timeout):
+            return certificate_obj
+
+        try:
+            generate_certificate_pdf(certificate_obj, save=False)
+        except Exception:
+            without_pdf.update(render_claimed_at=None)
+            raise
+        Certificate.objects.filter(pk=certificate_obj.pk).update(
+            render_claimed_at=None,
+            certificate_pdf=certificate_obj.certificate_pdf.name,
+        )
+        logger.info(f"Generated certificate PDF {certificate_obj.certificate_id} on first access")
+    return certificate_obj
+
 
-        print(f"✅ Saved via Django model: {certificate_filename}")
+def generate_certificate(certificate_obj, template_name=None, plan=None):
+    try:
+        # Default to the template the certificate was issued with
+        template_name = template_name or certificate_obj.template_name or 'CSCIndia'
+        certificate_obj.template_name = template_name
+        plan = plan or get_render_plan(template_name)
+        fields = get_render_fields(certificate_obj)
+        image_bytes, qr_bytes = render_certificate(fields, plan=plan)
+        certificate_obj.render_fingerprint = get_render_fingerprint(fields, template_name, plan)
+        certificate_filename = save_certificate_images(
+            certificate_obj, image_bytes, qr_bytes, overwrite=bool(certificate_obj.certificate_image)
+        )
+
+        logger.info(f"Saved certificate image {certificate_filename}")
         return certificate_obj.certificate_image.url
 
     except Exception as e:
-        print(f"❌ Error: {e}")
         logger.error(f"Error generating certificate: {str(e)}")
         raise
 
@@ -640,10 +884,6 @@ def generate_certificate(certificate_obj, template_name='CSCIndia'):
 #         print(f"❌ Error: {e}")
 #         raise
 
-# Example usage (for testing)
-if __name__ == "__main__":
-    mock_cert = MockCertificateObj()
-    generate_certificate(mock_cert)
 
 
 
@@ -697,8 +937,6 @@ if __name__ == "__main__":
 #     except Exception as e:
 #         logger.error(f"Error generating certificate PDF: {str(e)}")
 #         raise
-from django.template.loader import render_to_string
-from xhtml2pdf import pisa
 from django.conf import settings
 from django.core.files.base import ContentFile
 import os
@@ -732,44 +970,49 @@ import os
 #     return cert_path
 
 
-def generate_certificate_pdf(certificate_obj):
-    context = {
-        'full_name': certificate_obj.full_name.upper(),
-        'college_name': certificate_obj.college_name,
-        'roll_number': certificate_obj.roll_number,
-        'course': certificate_obj.course,
-        'certificate_id': str(certificate_obj.certificate_id)[:12],
-        'issue_date': certificate_obj.created_at.strftime("%d-%m-%Y"),
-        'qr_code_url': certificate_obj.qr_code_image.url  # Must be full/static URL
-    }
+def generate_certificate_pdf(certificate_obj, save=True, plan=None):
+    """
+    Write the certificate as a vector PDF (see certificates.pdf) and save it
+    to certificate_pdf; returns the file's path.
+
+    With ``save=False`` the file is written but the model is not saved.
+    """
+    from .pdf import render_certificate_pdf
 
-    html = render_to_string("certificate_template.html", context)
+    template_name = certificate_obj.template_name or 'CSCIndia'
+    pdf_bytes = render_certificate_pdf(get_render_fields(certificate_obj), template_name, plan=plan)
     cert_filename = certificate_obj.get_certificate_filename().replace('.png', '.pdf')
-    cert_path = os.path.join(settings.CERTIFICATE_OUTPUT_PATH, cert_filename)
-    os.makedirs(settings.CERTIFICATE_OUTPUT_PATH, exist_ok=True)
 
-    with open(cert_path, "wb") as out_file:
-        pisa_status = pisa.CreatePDF(html, dest=out_file)
+    if certificate_obj.certificate_pdf:
+        _replace_file(certificate_obj.certificate_pdf, cert_filename, ContentFile(pdf_bytes))
+    else:
+        certificate_obj.certificate_pdf.save(cert_filename, ContentFile(pdf_bytes), save=False)
 
-    if pisa_status.err:
-        raise Exception("Error creating PDF")
+    if save:
+        certificate_obj.save()
+    return certificate_obj.certificate_pdf.path
 
-    with open(cert_path, 'rb') as f:
-        certificate_obj.certificate_pdf.save(cert_filename, ContentFile(f.read()), save=False)
 
-    certificate_obj.save()
-    return cert_path
+from datetime import datetime
+def create_certificate_record(form_data):
+    """
+    Create the Certificate row for form data without generating any files
+    """
+    certificate = build_certificate_record(form_data)
+    certificate.save(force_insert=True)
+    return certificate
 
 
-from datetime import datetime
-def create_certificate_from_form_data(form_data):
+def build_certificate_record(form_data, certificate_id=None):
     """
-    Create certificate from form data and generate all files
+    Build an unsaved Certificate for form data, with its certificate ID set
+
+    Pass ``certificate_id`` (see allocate_certificate_ids) to skip the
+    per-certificate ID lookup.
     """
     from .models import Certificate
 
-    # Create certificate object
-    certificate = Certificate.objects.create(
+    certificate = Certificate(
         full_name=form_data['full_name'].upper(),
         roll_number=form_data['roll_number'],
         course=form_data['course'],
@@ -778,11 +1021,26 @@ def create_certificate_from_form_data(form_data):
         email=form_data['email'],
         start_date=form_data['start_date'],
         end_date=form_data['end_date'],
+        template_name=form_data.get('template', ''),
     )
+    certificate.assign_certificate_id(certificate_id)
+    return certificate
+
+
+def create_certificate_from_form_data(form_data):
+    """
+    Create certificate from form data and generate all files
+    """
+    # Create certificate object
+    form_data = {**form_data, 'template': form_data.get('template', 'DataValley')}
+    certificate = create_certificate_record(form_data)
+
+    # Images are rendered on first access in lazy mode
+    if lazy_rendering_enabled():
+        return certificate
 
     # Generate certificate image and QR code
-    template_name = form_data.get('template', 'DataValley')
-    generate_certificate(certificate, template_name=template_name)
+    generate_certificate(certificate, template_name=certificate.template_name)
 
 
     # Generate PDF (optional)
@@ -794,167 +1052,61 @@ def create_certificate_from_form_data(form_data):
 
     return certificate
 
-def send_certificate_email(certificate_obj):
+def build_certificate_email(certificate_obj, connection=None, with_attachments=None):
     """
-    Send internship certificate via email with professional styled HTML and plain-text fallback.
+    Build the certificate email (styled HTML with plain-text fallback, and the
+    certificate attached or linked, see CERTIFICATE_EMAIL_ATTACHMENTS)
+    without sending it.
     """
-    try:
-        from django.core.mail import EmailMultiAlternatives
-        from django.conf import settings
-        from django.utils import timezone
-        import logging
-        import os
-
-        logger = logging.getLogger(__name__)
-
-        if not certificate_obj.certificate_image:
-            raise ValueError("Certificate image must be generated first")
-
-        subject = f"🎓 Internship Completion Certificate – {certificate_obj.course}"
-        from_email = settings.DEFAULT_FROM_EMAIL
-        to_email = [certificate_obj.email]
-
-        # Plain text fallback
-        text_content = f"""
-Dear {certificate_obj.full_name},
+    from django.core.mail import EmailMultiAlternatives
+    from django.conf import settings
+    from .emails import attachments_enabled, render_certificate_email
 
-Greetings from Council for Skills and Competencies (CSC India)!
+    if with_attachments is None:
+        with_attachments = attachments_enabled()
 
-We are delighted to inform you that you have successfully completed the internship program titled "{certificate_obj.course}", organized under the guidance of CSC India.
+    ensure_certificate_rendered(certificate_obj)
+    if not certificate_obj.certificate_image:
+        raise ValueError("Certificate image must be generated first")
 
-Your official internship certificate is attached with this email. You may also verify the certificate using the unique Certificate ID or through the link provided below.
-Verify your certificate at "https://verify.cscindia.org.in/".
-Certificate Details:
-• Course: {certificate_obj.course}
-• College: {certificate_obj.college_name}
-• Roll Number: {certificate_obj.roll_number}
-• Certificate ID: {certificate_obj.certificate_id}
-• Issue Date: {certificate_obj.created_at.strftime("%d %B %Y")}
+    subject, text_content, html_content = render_certificate_email(certificate_obj, with_attachments)
+    from_email = settings.DEFAULT_FROM_EMAIL
+    to_email = [certificate_obj.email]
 
-Verify your certificate here: {certificate_obj.verification_url}
+    # Compose and attach email contents
+    email = EmailMultiAlternatives(subject, text_content, from_email, to_email, connection=connection)
+    email.attach_alternative(html_content, "text/html")
 
-We congratulate you on this achievement and wish you continued success in your academic and professional journey.
+    if not with_attachments:
+        return email
 
-Warm regards,
-Certificate Management Team
-Council for Skills and Competencies (CSC India)
-Visakhapatnam, Andhra Pradesh, India
+    # Attach certificate image with name only
+    image_filename = f"{certificate_obj.roll_number.replace(' ', '_')}.png"
+    with open(certificate_obj.certificate_image.path, 'rb') as f:
+        email.attach(image_filename, f.read(), 'image/png')
 
-WhatsApp: 9666500222
-Email: rammohan@cscindia.org.in
-Website: www.cscindia.org.in
-"""
+    # Attach the PDF; one that was not stored (lazy mode, or its generation
+    # failed) is generated now rather than silently left out
+    try:
+        ensure_certificate_pdf(certificate_obj)
+    except Exception as e:
+        logger.warning(f"PDF generation failed: {e}")
+    if certificate_obj.certificate_pdf:
+        pdf_filename = f"{certificate_obj.roll_number.replace(' ', '_')}.pdf"
+        with open(certificate_obj.certificate_pdf.path, 'rb') as f:
+            email.attach(pdf_filename, f.read(), 'application/pdf')
 
-        # HTML version
-        html_content = f"""
-<html>
-<head>
-    <style>
-        body {{
-            font-family: 'Segoe UI', Tahoma, sans-serif;
-            background-color: #f9fafc;
-            color: #333;
-            padding: 30px;
-        }}
-        .container {{
-            background: #fff;
-            border-radius: 12px;
-            box-shadow: 0 4px 10px rgba(0,0,0,0.05);
-            max-width: 600px;
-            margin: auto;
-            padding: 30px;
-        }}
-        h2 {{
-            text-align: center;
-            color: #2c3e50;
-        }}
-        p {{
-            font-size: 15px;
-            line-height: 1.6;
-        }}
-        .details-table {{
-            width: 100%;
-            border-collapse: collapse;
-            margin: 20px 0;
-        }}
-        .details-table th {{
-            background-color: #004c97;
-            color: white;
-            padding: 10px;
-            text-align: left;
-        }}
-        .details-table td {{
-            padding: 10px;
-            border-bottom: 1px solid #ddd;
-        }}
-        .verify-button {{
-            display: block;
-            width: max-content;
-            margin: 20px auto;
-            padding: 12px 20px;
-            background-color: #28a745;
-            color: white;
-            text-decoration: none;
-            font-weight: bold;
-            border-radius: 5px;
-        }}
-        .important {{
-            font-size: 13px;
-            text-align: center;
-            margin-top: 30px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h2>🎉 Congratulations, {certificate_obj.full_name}!</h2>
-
-        <p>We are pleased to inform you that you have successfully completed the internship program titled
-        <strong>"{certificate_obj.course}"</strong>, organized under the guidance of the <strong>Council for Skills and Competencies (CSC India)</strong>.</p>
-
-        <p>Your internship completion certificate is attached for your reference. You may also verify the authenticity of this certificate using the Certificate ID mentioned below or by visiting the verification link provided.</p>
-		 
-        <table class="details-table">
-            <tr><th colspan="2">📋 Certificate Summary</th></tr>
-            <tr><td><strong>Full Name</strong></td><td>{certificate_obj.full_name}</td></tr>
-            <tr><td><strong>Course</strong></td><td>{certificate_obj.course}</td></tr>
-            <tr><td><strong>College</strong></td><td>{certificate_obj.college_name}</td></tr>
-            <tr><td><strong>Roll Number</strong></td><td>{certificate_obj.roll_number}</td></tr>
-            <tr><td><strong>Certificate ID</strong></td><td>{certificate_obj.certificate_id}</td></tr>
-            <tr><td><strong>Issue Date</strong></td><td>{certificate_obj.created_at.strftime("%d %B %Y")}</td></tr>
-        </table>
-
-        <a class="verify-button" href="{certificate_obj.verification_url}" target="_blank">✅ Verify Certificate</a>
-
-        <div class="important">
-            Best Regards,<br>
-            <strong>Certificate Management Team</strong><br>
-            Council for Skills and Competencies (CSC India)<br>
-            Visakhapatnam, Andhra Pradesh, India<br><br>
-            <b>WhatsApp:</b> 9666500222<br>
-            <b>Email:</b> <a href="mailto:rammohan@cscindia.org.in">rammohan@cscindia.org.in</a><br>
-            <b>Website:</b> <a href="https://www.cscindia.org.in" target="_blank">www.cscindia.org.in</a><br>
-            <b>Credentials can be verified at</b> <a href="https://verify.cscindia.org.in/" target="_blank">verify.cscindia.org.in</a><br>
-        </div>
-    </div>
-</body>
-</html>
-"""
+    return email
 
-        # Compose and attach email contents
-        email = EmailMultiAlternatives(subject, text_content, from_email, to_email)
-        email.attach_alternative(html_content, "text/html")
 
-        # Attach certificate image with name only
-        image_filename = f"{certificate_obj.roll_number.replace(' ', '_')}.png"
-        with open(certificate_obj.certificate_image.path, 'rb') as f:
-            email.attach(image_filename, f.read(), 'image/png')
+def send_certificate_email(certificate_obj):
+    """
+    Send internship certificate via email with professional styled HTML and plain-text fallback.
+    """
+    try:
+        from django.utils import timezone
 
-        # Attach PDF if available
-        if certificate_obj.certificate_pdf:
-            pdf_filename = f"{certificate_obj.roll_number.replace(' ', '_')}.pdf"
-            with open(certificate_obj.certificate_pdf.path, 'rb') as f:
-                email.attach(pdf_filename, f.read(), 'application/pdf')
+        email = build_certificate_email(certificate_obj)
 
         # Send email
         email.send()
@@ -967,71 +1119,26 @@ Website: www.cscindia.org.in
         logger.info(f"✅ Certificate email sent successfully to {certificate_obj.email}")
 
     except Exception as e:
-        logger = logging.getLogger(__name__)
         logger.error(f"❌ Error sending certificate email: {str(e)}")
         raise
 def upload_to_google_drive(certificate_obj):
     """
     Upload certificate to Google Drive
     """
-    from django.conf import settings
-    import os
-    import logging
-
-    logger = logging.getLogger(__name__)
-
-    # ✅ Log the credential file path and check existence
-    logger.info("📁 Checking Google Drive credentials file:")
-    logger.info(f"Path: {settings.GOOGLE_DRIVE_CREDENTIALS_FILE}")
-    logger.info(f"Exists: {os.path.exists(settings.GOOGLE_DRIVE_CREDENTIALS_FILE)}")
+    from django.utils import timezone
+    from .drive import upload_certificate_image
 
     try:
-        from googleapiclient.discovery import build
-        from google.oauth2.service_account import Credentials
-        from googleapiclient.http import MediaFileUpload
-        from django.utils import timezone
-
-        if not certificate_obj.certificate_image:
-            raise ValueError("Certificate image must be generated first")
-
-        # ✅ Check if credentials file exists
-        credentials_file = settings.GOOGLE_DRIVE_CREDENTIALS_FILE
-        if not credentials_file or not os.path.exists(credentials_file):
-            raise FileNotFoundError("Google Drive credentials file not found")
-
-        # ✅ Set up credentials and service
-        SCOPES = ['https://www.googleapis.com/auth/drive.file']
-        credentials = Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
-        service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
-
-        # ✅ Prepare file metadata
-        file_name = f"{certificate_obj.full_name.replace(' ', '_')}.png"
-        # file_name = f"certificate_{certificate_obj.full_name.replace(' ', '_')}_{certificate_obj.certificate_id}.png"
-        file_metadata = {
-            'name': file_name,
-            'parents': [settings.GOOGLE_DRIVE_FOLDER_ID] if settings.GOOGLE_DRIVE_FOLDER_ID else []
-        }
-
-        # ✅ Upload file
-        media = MediaFileUpload(
-            certificate_obj.certificate_image.path,
-            mimetype='image/png'
-        )
-
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id'
-        ).execute()
+        file_id = upload_certificate_image(certificate_obj)
 
         # ✅ Update certificate model
         certificate_obj.drive_uploaded = True
-        certificate_obj.drive_file_id = file.get('id')
+        certificate_obj.drive_file_id = file_id
         certificate_obj.drive_uploaded_at = timezone.now()
         certificate_obj.save()
 
-        logger.info(f"✅ Certificate uploaded to Google Drive: {file.get('id')}")
-        return file.get('id')
+        logger.info(f"✅ Certificate uploaded to Google Drive: {file_id}")
+        return file_id
 
     except Exception as e:
         logger.error(f"❌ Error uploading to Google Drive: {str(e)}")
@@ -1042,20 +1149,20 @@ def process_certificate_request(form_data):
     Complete certificate processing workflow:
     1. Create certificate
     2. Generate image and QR code
-    3. Send email
+    3. Queue the email
     4. Upload to Google Drive
     """
     try:
         # Create and generate certificate
         certificate = create_certificate_from_form_data(form_data)
 
-        # Send email (if configured)
-		
+        # Queue the email; drain_email_outbox delivers it
         try:
-            send_certificate_email(certificate)
+            from .outbox import enqueue_certificate_email
+            enqueue_certificate_email(certificate)
         except Exception as e:
-            logger.warning(f"Email sending failed: {e}")
-        
+            logger.warning(f"Queueing certificate email failed: {e}")
+
 
         # Upload to Google Drive (if configured)
         # try:
@@ -0,0 +1,323 @@
+"""
+Cache for the public, QR-driven verification lookups.
+
+verify_student, verify_certificate and api_verify_certificate resolve a
+certificate by ID, email or roll number. The result of each lookup is cached
+as a plain dict (see serialise_certificate) under the normalised lookup
+value, in the "verification" cache, so repeated scans of the same
+certificate never reach the database. A lookup that found nothing is
+cached too, for a shorter CERTIFICATE_VERIFICATION_MISS_TTL, and IDs that
+were never issued are turned away by the filter in certificates.idfilter.
+The batch API (verify_batch) shares the cache and resolves whatever it
+misses with chunked IN queries; it takes certificate IDs and roll numbers
+only, from clients with an API key (see batch_api_client). The signed token of a scanned QR code
+(see certificates.qrtoken) is checked against the looked up certificate by
+check_signed_qr.
+
+Cached results are dropped whenever a certificate is saved or deleted
+(see apps.py) and by the code paths that change certificates with
+queryset updates or bulk_create, which send no signals.
+"""
+
+import csv
+import hashlib
+import hmac
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .idfilter import certificate_id_filter
+from .models import Certificate
+
+CACHE_ALIAS = 'verification'
+CACHE_PREFIX = 'certificate-verification'
+
+# Lookup method -> Certificate field it matches (case-insensitively)
+LOOKUP_FIELDS = {
+    'certificate_id': 'certificate_id',
+    'email': 'email',
+    'roll_number': 'roll_number',
+}
+
+# Methods the batch API accepts. Not email: a batch of guessed addresses
+# would tell which people hold certificates.
+BATCH_LOOKUP_FIELDS = {method: LOOKUP_FIELDS[method] for method in ('certificate_id', 'roll_number')}
+
+_MISSING = object()
+
+
+def get_verification_cache():
+    return caches[CACHE_ALIAS]
+
+
+def normalise_lookup(value):
+    return str(value).strip().lower()
+
+
+def verification_cache_key(method, value):
+    digest = hashlib.sha256(normalise_lookup(value).encode()).hexdigest()
+    return f"{CACHE_PREFIX}:{method}:{digest}"
+
+
+def serialise_certificate(certificate_obj):
+    """
+    The fields the verification pages and API show, as a dict the templates
+    can use in place of the Certificate.
+    """
+    return {
+        'certificate_id': str(certificate_obj.certificate_id),
+        'full_name': certificate_obj.full_name,
+        'email': certificate_obj.email,
+        'roll_number': certificate_obj.roll_number,
+        'course': certificate_obj.course,
+        'college_name': certificate_obj.college_name,
+        'created_at': certificate_obj.created_at,
+        'is_verified': certificate_obj.is_verified,
+        'verification_url': certificate_obj.verification_url,
+        'certificate_image': {'url': certificate_obj.certificate_image.url} if certificate_obj.certificate_image else None,
+        'certificate_pdf': {'url': certificate_obj.certificate_pdf.url} if certificate_obj.certificate_pdf else None,
+    }
+
+
+def find_certificates(method, value):
+    """
+    The certificates a verification lookup matches, newest first.
+
+    Certificate IDs match whatever the is_verified flag; emails and roll
+    numbers only match verified certificates. Each method is an index seek
+    on LOWER(field), see Certificate.Meta.indexes.
+    """
+    field = LOOKUP_FIELDS[method]
+    certificates = Certificate.objects.filter(**{f'{field}__lower': normalise_lookup(value)})
+    if method != 'certificate_id':
+        certificates = certificates.filter(is_verified=True)
+    return certificates
+
+
+def lookup_certificate(method, value):
+    """The serialised certificate for a verification lookup (see find_certificates), or None."""
+    if method == 'certificate_id' and not certificate_id_filter.might_be_issued(value):
+        return None
+
+    cache = get_verification_cache()
+    key = verification_cache_key(method, value)
+    result = cache.get(key, _MISSING)
+    if result is not _MISSING:
+        return result
+
+    certificate = find_certificates(method, value).first()
+    if certificate is None:
+        cache.set(key, None, getattr(settings, 'CERTIFICATE_VERIFICATION_MISS_TTL', 30))
+        return None
+    result = serialise_certificate(certificate)
+    cache.set(key, result, getattr(settings, 'CERTIFICATE_VERIFICATION_CACHE_TTL', 300))
+    return result
+
+
+def check_signed_qr(certificate, token):
+    """
+    Whether the signed token of a scanned QR code vouches for ``certificate``
+    (a lookup_certificate result) as it stands: validly signed for its ID
+    and naming the same holder, course and issue date. None without a token.
+
+    Deleted certificates are not found by the lookup in the first place,
+    and edited ones no longer match the claims of their old QR codes.
+    """
+    from .qrtoken import check_token, get_issue_date
+
+    if not token:
+        return None
+    claims = check_token(certificate['certificate_id'], token)
+    return bool(
+        claims
+        and claims.matches_name(certificate['full_name'])
+        and claims.course == certificate['course']
+        and claims.issue_date == get_issue_date(certificate['created_at'])
+    )
+
+
+def verification_payload(certificate):
+    """The public API representation of a serialised certificate."""
+    return {
+        'verified': certificate['is_verified'],
+        'certificate_id': certificate['certificate_id'],
+        'full_name': certificate['full_name'],
+        'course': certificate['course'],
+        'college_name': certificate['college_name'],
+        'roll_number': certificate['roll_number'],
+        'issue_date': certificate['created_at'].strftime('%d %B %Y'),
+        'verification_url': certificate['verification_url'],
+    }
+
+
+def lookup_certificates(method, values, chunk_size=500):
+    """
+    Batch version of lookup_certificate: ``{normalised value: serialised
+    certificate or None}`` for all ``values``.
+
+    Cached results are used as they are; the rest are resolved with one
+    ``LOWER(field) IN (...)`` query per ``chunk_size`` values and cached.
+    """
+    field = LOOKUP_FIELDS[method]
+    cache = get_verification_cache()
+    wanted = {normalise_lookup(value) for value in values if str(value).strip()}
+    results = {}
+
+    if method == 'certificate_id':
+        for value in [value for value in wanted if not certificate_id_filter.might_be_issued(value)]:
+            results[value] = None
+            wanted.discard(value)
+
+    keys = {verification_cache_key(method, value): value for value in wanted}
+    for key, result in cache.get_many(list(keys)).items():
+        results[keys[key]] = result
+    missing = sorted(wanted - set(results))
+
+    found = {}
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        certificates = Certificate.objects.filter(**{f'{field}__lower__in': chunk})
+        if method != 'certificate_id':
+            certificates = certificates.filter(is_verified=True)
+        # Newest first, like lookup_certificate's .first()
+        for certificate in certificates:
+            value = normalise_lookup(getattr(certificate, field))
+            if value not in found:
+                found[value] = serialise_certificate(certificate)
+
+    cache.set_many(
+        {verification_cache_key(method, value): found[value] for value in missing if value in found},
+        getattr(settings, 'CERTIFICATE_VERIFICATION_CACHE_TTL', 300),
+    )
+    cache.set_many(
+        {verification_cache_key(method, value): None for value in missing if value not in found},
+        getattr(settings, 'CERTIFICATE_VERIFICATION_MISS_TTL', 30),
+    )
+    for value in missing:
+        results[value] = found.get(value)
+    return results
+
+
+def verify_batch(method, values):
+    """
+    One compact result per value, in order: ``{'query', 'found', 'verified'}``
+    plus the certificate's public fields when it was found.
+    """
+    certificates = lookup_certificates(method, values)
+    results = []
+    for value in values:
+        certificate = certificates.get(normalise_lookup(value))
+        if certificate is None:
+            results.append({'query': value, 'found': False, 'verified': False})
+        else:
+            results.append({'query': value, 'found': True, **verification_payload(certificate)})
+    return results
+
+
+# Columns appended to each row of an uploaded CSV by annotate_csv
+CSV_RESULT_COLUMNS = ['found', 'verified', 'certificate_id', 'full_name', 'course', 'college_name', 'issue_date']
+
+
+class _Echo:
+    """Pseudo-buffer for csv.writer: write() hands the line back."""
+
+    def write(self, value):
+        return value
+
+
+def find_lookup_column(header):
+    """(index, method) of the first header cell naming a batch lookup method, e.g. "Roll Number"."""
+    for index, cell in enumerate(header):
+        method = cell.strip().lower().replace(' ', '_')
+        if method in BATCH_LOOKUP_FIELDS:
+            return index, method
+    return None
+
+
+def annotate_csv(reader, header, index, method, max_rows, chunk_size=500):
+    """
+    Stream ``header`` and the rows of ``reader`` back as CSV lines with the
+    batch verification result columns appended, resolving ``chunk_size``
+    rows at a time. Stops after ``max_rows`` rows.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header + CSV_RESULT_COLUMNS)
+    remaining = max_rows
+    while remaining > 0:
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) >= min(chunk_size, remaining):
+                break
+        if not rows:
+            return
+        remaining -= len(rows)
+        values = [row[index] if index < len(row) else '' for row in rows]
+        for row, result in zip(rows, verify_batch(method, values)):
+            yield writer.writerow(row + [
+                'yes' if result['found'] else 'no',
+                'yes' if result['verified'] else 'no',
+            ] + [result.get(column, '') for column in CSV_RESULT_COLUMNS[2:]])
+
+
+def batch_api_client(api_key):
+    """The configured batch API key (CERTIFICATE_BATCH_VERIFY_API_KEYS) matching ``api_key``, or None."""
+    for key in getattr(settings, 'CERTIFICATE_BATCH_VERIFY_API_KEYS', []):
+        if api_key and hmac.compare_digest(key.encode(), api_key.encode()):
+            return key
+    return None
+
+
+def batch_api_throttled(api_key):
+    """
+    Count a batch API request against the quota of ``api_key`` for the
+    current minute, kept in the verification cache so every process sees it.
+    True once that exceeds CERTIFICATE_BATCH_VERIFY_RATE_LIMIT (0 = no limit).
+    """
+    limit = getattr(settings, 'CERTIFICATE_BATCH_VERIFY_RATE_LIMIT', 30)
+    if not limit:
+        return False
+    cache = get_verification_cache()
+    digest = hashlib.sha256(api_key.encode()).hexdigest()
+    key = f"{CACHE_PREFIX}:batch-quota:{digest}:{int(time.time() // 60)}"
+    cache.add(key, 0, timeout=120)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Evicted since the add
+        cache.set(key, 1, timeout=120)
+        count = 1
+    return count > limit
+
+
+def forget_certificates(certificates):
+    """Drop the cached lookups of these certificates (by ID, email and roll number)."""
+    keys = [
+        verification_cache_key(method, getattr(certificate, field))
+        for certificate in certificates
+        for method, field in LOOKUP_FIELDS.items()
+        if getattr(certificate, field)
+    ]
+    if keys:
+        get_verification_cache().delete_many(keys)
+
+
+def invalidate_certificate_verification(instance, **kwargs):
+    """Signal handler for Certificate post_save/post_delete."""
+    forget_certificates([instance])
+
+
+def forget_replaced_lookups(instance, raw=False, **kwargs):
+    """
+    Signal handler for Certificate pre_save: drop the cached lookups under the
+    stored values, which post_save no longer knows once an email or roll
+    number was changed.
+    """
+    if raw or instance.pk is None:
+        return
+    stored = Certificate.objects.filter(pk=instance.pk).only(*LOOKUP_FIELDS.values()).first()
+    if stored is not None and any(
+        getattr(stored, field) != getattr(instance, field) for field in LOOKUP_FIELDS.values()
+    ):
+        forget_certificates([stored])
@@ -4,14 +4,20 @@ from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
+from django.db import IntegrityError
 from django.db.models import Q
 from django.conf import settings
 import json
 import logging
+import time
 
 from .models import Certificate
 from .forms import CertificateForm, CertificateSearchForm, ContactForm
-from .utils import process_certificate_request
+from .utils import ensure_certificate_pdf, ensure_certificate_rendered, process_certificate_request
+from .verification import (
+    BATCH_LOOKUP_FIELDS, LOOKUP_FIELDS, annotate_csv, batch_api_client, batch_api_throttled, check_signed_qr,
+    find_lookup_column, lookup_certificate, verification_payload, verify_batch,
+)
 
 logger = logging.getLogger(__name__)
 from django.http import Http404,HttpResponse
@@ -65,6 +71,9 @@ def generate_certificate(request):
                     )
                     # Redirect to certificate detail page
                     return redirect('certificate_detail', certificate_id=certificate.certificate_id)
+                except IntegrityError:
+                    # Issued concurrently after the exists() check above
+                    messages.error(request, f'A certificate has already been generated for roll number: {roll_number}. Duplicate certificates are not allowed.')
                 except Exception as e:
                     logger.error(f"Error generating certificate: {str(e)}")
                     messages.error(
@@ -88,6 +97,7 @@ def certificate_detail(request, certificate_id):
     """Certificate detail view"""
     try:
         certificate = get_object_or_404(Certificate, certificate_id=certificate_id)
+        ensure_certificate_rendered(certificate)
 
         context = {
             'certificate': certificate,
@@ -102,25 +112,31 @@ def certificate_detail(request, certificate_id):
 
 def verify_certificate(request, certificate_id):
     """Certificate verification view"""
+    not_found_context = {
+        'certificate': None,
+        'is_verified': False,
+        'page_title': 'Certificate Verification',
+        'error_message': 'Certificate not found or invalid.'
+    }
     try:
-        certificate = get_object_or_404(Certificate, certificate_id=certificate_id)
+        # Cached lookup, see certificates.verification; unknown IDs are a
+        # normal outcome (mistyped scans), not an error worth logging
+        certificate = lookup_certificate('certificate_id', certificate_id)
+        if certificate is None:
+            return render(request, 'certificates/verify.html', not_found_context)
 
         context = {
             'certificate': certificate,
-            'is_verified': certificate.is_verified,
+            'is_verified': certificate['is_verified'],
+            # Signed QR codes are checked against the record (see certificates.qrtoken)
+            'signed_qr': check_signed_qr(certificate, request.GET.get('t')),
             'page_title': 'Certificate Verification',
         }
         return render(request, 'certificates/verify.html', context)
 
     except Exception as e:
         logger.error(f"Error verifying certificate: {str(e)}")
-        context = {
-            'certificate': None,
-            'is_verified': False,
-            'page_title': 'Certificate Verification',
-            'error_message': 'Certificate not found or invalid.'
-        }
-        return render(request, 'certificates/verify.html', context)
+        return render(request, 'certificates/verify.html', not_found_context)
 
 from django.shortcuts import render, redirect
 from django.http import HttpResponse
@@ -226,6 +242,39 @@ def export_certificates(request):
     return response
 
 
+@login_required_404
+def export_certificates_pdf(request):
+    """Stream the certificates matching the list filters as one PDF booklet."""
+    from django.http import StreamingHttpResponse
+    from .pdf import booklet_filename, check_booklet, stream_certificates_pdf
+
+    college_filter = request.GET.get('college_filter', '').strip()
+    course_filter = request.GET.get('course_filter', '').strip()
+
+    certificates = Certificate.objects.filter(is_verified=True)
+    if college_filter:
+        certificates = certificates.filter(college_name__iexact=college_filter)
+    if course_filter:
+        certificates = certificates.filter(course__iexact=course_filter)
+
+    if not certificates.exists():
+        messages.warning(request, "No certificate data found for the selected filters.")
+        return redirect('certificate_list')
+
+    try:
+        check_booklet(certificates)
+    except Exception as e:
+        logger.error(f"Cannot build PDF booklet: {e}")
+        messages.error(request, "The PDF booklet could not be created, a certificate template is broken.")
+        return redirect('certificate_list')
+
+    response = StreamingHttpResponse(
+        stream_certificates_pdf(certificates.order_by('roll_number', 'pk')), content_type='application/pdf'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{booklet_filename(certificates)}"'
+    return response
+
+
 
 
 
@@ -234,6 +283,7 @@ def download_certificate(request, certificate_id):
     """Download certificate image"""
     try:
         certificate = get_object_or_404(Certificate, certificate_id=certificate_id)
+        ensure_certificate_rendered(certificate)
 
         if not certificate.certificate_image:
             raise Http404("Certificate image not found")
@@ -256,6 +306,7 @@ def download_certificate_pdf(request, certificate_id):
     """Download certificate PDF"""
     try:
         certificate = get_object_or_404(Certificate, certificate_id=certificate_id)
+        ensure_certificate_pdf(certificate)
 
         if not certificate.certificate_pdf:
             raise Http404("Certificate PDF not found")
@@ -274,6 +325,34 @@ def download_certificate_pdf(request, certificate_id):
         raise Http404("Certificate PDF not found")
 
 
+def signed_certificate_download(request, token):
+    """Download a certificate through the expiring link sent in link-only emails"""
+    from django.core import signing
+    from django.http import FileResponse
+    from .emails import read_download_token
+
+    try:
+        certificate_id = read_download_token(token)
+    except signing.SignatureExpired:
+        raise Http404("This download link has expired")
+    except signing.BadSignature:
+        raise Http404("Invalid download link")
+
+    # A link stops working once its certificate is un-verified
+    certificate = get_object_or_404(Certificate, certificate_id=certificate_id, is_verified=True)
+    ensure_certificate_rendered(certificate)
+    try:
+        ensure_certificate_pdf(certificate)
+    except Exception as e:
+        logger.warning(f"PDF generation failed: {e}")
+    filename = certificate.roll_number.replace(" ", "_")
+    if certificate.certificate_pdf:
+        return FileResponse(certificate.certificate_pdf.open('rb'), as_attachment=True, filename=f"{filename}.pdf")
+    if certificate.certificate_image:
+        return FileResponse(certificate.certificate_image.open('rb'), as_attachment=True, filename=f"{filename}.png")
+    raise Http404("Certificate image not found")
+
+
 @require_http_methods(["GET", "POST"])
 def contact(request):
     """Contact form view"""
@@ -321,19 +400,14 @@ def api_verify_certificate(request, certificate_id):
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
     try:
-        certificate = Certificate.objects.get(certificate_id=certificate_id)
-
-        data = {
-            'verified': certificate.is_verified,
-            'certificate_id': str(certificate.certificate_id),
-            'full_name': certificate.full_name,
-            'course': certificate.course,
-            'college_name': certificate.college_name,
-            'roll_number': certificate.roll_number,
-            'issue_date': certificate.created_at.strftime('%d %B %Y'),
-            'verification_url': certificate.verification_url,
-        }
-
+        certificate = lookup_certificate('certificate_id', certificate_id)
+        if certificate is None:
+            raise Certificate.DoesNotExist
+
+        data = verification_payload(certificate)
+        signed_qr = check_signed_qr(certificate, request.GET.get('t'))
+        if signed_qr is not None:
+            data['signed_qr'] = signed_qr
         return JsonResponse(data)
 
     except Certificate.DoesNotExist:
@@ -348,6 +422,102 @@ def api_verify_certificate(request, certificate_id):
             'error': 'Verification failed'
         }, status=500)
 
+def api_verification_public_key(request):
+    """The public key that checks the signed tokens in certificate QR codes (see certificates.offline_verifier)."""
+    from .qrtoken import public_key_payload
+
+    payload = public_key_payload()
+    if payload is None:
+        return JsonResponse({'error': 'QR codes are not signed'}, status=404)
+    response = JsonResponse(payload)
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+def batch_api_denied(request):
+    """
+    The error response for a batch API request without a valid X-API-Key
+    header or beyond its key's rate limit, None if it may proceed.
+    """
+    api_key = batch_api_client(request.headers.get('X-API-Key', ''))
+    if api_key is None:
+        return JsonResponse({'error': 'A valid X-API-Key header is required'}, status=403)
+    if batch_api_throttled(api_key):
+        response = JsonResponse({'error': 'Rate limit exceeded, try again later'}, status=429)
+        response['Retry-After'] = str(60 - int(time.time()) % 60)
+        return response
+    return None
+
+
+@csrf_exempt
+def api_verify_batch(request):
+    """
+    Batch verification API: POST ``{"method": "certificate_id", "values": [...]}``
+    (method may also be roll_number) with an X-API-Key header and get back
+    one result per value, in order, with "found" and "verified" flags.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    denied = batch_api_denied(request)
+    if denied is not None:
+        return denied
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object'}, status=400)
+
+    method = payload.get('method', 'certificate_id')
+    values = payload.get('values')
+    if method not in BATCH_LOOKUP_FIELDS:
+        return JsonResponse({'error': f"method must be one of {', '.join(BATCH_LOOKUP_FIELDS)}"}, status=400)
+    if not isinstance(values, list) or not all(isinstance(value, (str, int)) for value in values):
+        return JsonResponse({'error': 'values must be a list of strings'}, status=400)
+    max_items = getattr(settings, 'CERTIFICATE_BATCH_VERIFY_MAX_ITEMS', 1000)
+    if len(values) > max_items:
+        return JsonResponse({'error': f"At most {max_items} values per request"}, status=400)
+
+    try:
+        return JsonResponse(verify_batch(method, [str(value) for value in values]), safe=False)
+    except Exception as e:
+        logger.error(f"API batch verification error: {str(e)}")
+        return JsonResponse({'error': 'Verification failed'}, status=500)
+
+
+@csrf_exempt
+def api_verify_batch_csv(request):
+    """
+    CSV variant of api_verify_batch: POST a CSV as the "file" upload whose
+    header has a certificate_id or roll_number column (e.g. "Roll Number");
+    the rows are streamed back with the verification results appended.
+    """
+    import csv
+    import io
+    from django.http import StreamingHttpResponse
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    denied = batch_api_denied(request)
+    if denied is not None:
+        return denied
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Upload the CSV as "file"'}, status=400)
+
+    reader = csv.reader(io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline=''))
+    header = next(reader, None)
+    column = find_lookup_column(header or [])
+    if column is None:
+        return JsonResponse({'error': f"The CSV header needs a {' or '.join(BATCH_LOOKUP_FIELDS)} column"}, status=400)
+
+    max_rows = getattr(settings, 'CERTIFICATE_BATCH_VERIFY_MAX_CSV_ROWS', 50000)
+    response = StreamingHttpResponse(annotate_csv(reader, header, *column, max_rows), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="verification_results.csv"'
+    return response
+
+
 @login_required_404
 def stats(request):
     """Statistics page"""
@@ -371,6 +541,7 @@ def stats(request):
 from django.shortcuts import render, redirect
 from .forms import CertificateExcelForm
 from .models import Certificate_student
+from .importers import InvalidSheet, import_student_sheet
 import pandas as pd
 from django.contrib import messages
 from django.utils.dateparse import parse_date
@@ -381,24 +552,19 @@ def upload_excel(request):
         form = CertificateExcelForm(request.POST, request.FILES)
         if form.is_valid():
             instance = form.save()
-            df = pd.read_excel(instance.excel_file.path)
-
-            for _, row in df.iterrows():
-                Certificate_student.objects.create(
-                    full_name=row['Name'],
-                    course=row['Course'],
-                    roll_number=row['Roll No'],
-                    college_name=row['College Name'],
-                    affiliated_name=row['Affiliated Name'],
-                    start_date=row['Start Date'],
-                    end_date=row['End Date'],
-
-                    email=row['Email'],
-                    contact=str(row.get('Contact', 'NONE')) if pd.notna(row.get('Contact')) else 'NONE',
-                    gender=row.get('Gender', 'NONE') if pd.notna(row.get('Gender')) else 'NONE'
-                )
-
-            messages.success(request, "Excel file uploaded and all records added to the database.")
+            try:
+                report = import_student_sheet(instance.excel_file.path)
+            except InvalidSheet as e:
+                messages.error(request, f"Excel file could not be imported: {e}")
+                return redirect('upload_excel')
+
+            messages.success(
+                request,
+                f"Excel file uploaded: {report.inserted} records added, "
+                f"{report.skipped} skipped as already uploaded, {report.invalid} invalid."
+            )
+            for row_number, error in report.errors[:20]:
+                messages.warning(request, f"Row {row_number}: {error}")
             return redirect('upload_excel')
     else:
         form = CertificateExcelForm()
@@ -409,68 +575,63 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from .models import Certificate_student
 from .utils import process_certificate_request, send_certificate_email, upload_to_google_drive
+from .jobs import enqueue_bulk_job
+from .models import CertificateJob
+from django.urls import reverse
 import logging
 
 logger = logging.getLogger(__name__)
 @login_required_404
 def generate_certificates_from_db(request):
     """
-    Bulk generate certificates from Certificate_student model.
-    Successfully processed rows will be deleted from the database.
+    Queue bulk generation of certificates from the Certificate_student model.
+    The job is run by the run_certificate_jobs worker; successfully processed
+    rows will be deleted from the database. Progress is polled from
+    certificate_job_progress.
     """
     if request.method == 'POST':
         students = Certificate_student.objects.all()
-        success_count = 0
-        fail_count = 0
-        duplicate_count = 0  # Track duplicates
         if not students.exists():
             messages.warning(request, "⚠️ No data found. Please insert student details before generating certificates.")
             return redirect('generate_certificates_from_db')
-        
+
         selected_template = request.POST.get('template') or request.session.get('bulk_selected_template', 'Pragna')
-        for student in students:
-            try:
-                # Check for duplicate roll number
-                if Certificate.objects.filter(roll_number=student.roll_number).exists():
-                    logger.info(f"Certificate already exists for roll number: {student.roll_number}. Skipping.")
-                    duplicate_count += 1
-                    continue
-
-                data = {
-                    'full_name': student.full_name.upper(),
-                    'course': student.course,
-                    'roll_number': student.roll_number,
-                    'college_name': student.college_name,
-                    'affiliated_name': student.affiliated_name,
-                    'start_date': student.start_date,
-                    'end_date': student.end_date,
-                    'email': student.email,
-                    'template': selected_template,
-                }
-
-                # Step 1: Generate the certificate
-                certificate = process_certificate_request(data)
-
-                # If successful, delete the student entry
-                student.delete()
-
-                success_count += 1
+        job = enqueue_bulk_job(selected_template, user=request.user)
 
-            except Exception as e:
-                logger.error(f"Error for {student.full_name}: {str(e)}")
-                fail_count += 1
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({
+                'job_id': job.pk,
+                'progress_url': reverse('certificate_job_progress', args=[job.pk]),
+            }, status=202)
 
         messages.success(
             request,
-            f"✅ {success_count} certificates generated. ❌ {fail_count} failed and were retained. 🚫 {duplicate_count} skipped due to duplicate roll numbers."
+            f"⏳ Job #{job.pk} queued for {job.total_count} students. Progress is shown below."
         )
-        return redirect('generate_certificates_from_db')
+        return redirect(f"{reverse('generate_certificates_from_db')}?job={job.pk}")
+
+    job = None
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        job = CertificateJob.objects.filter(pk=job_id).first()
+    if job is None:
+        job = CertificateJob.objects.exclude(
+            status__in=[CertificateJob.STATUS_COMPLETED, CertificateJob.STATUS_FAILED]
+        ).order_by('-created_at').first()
 
     return render(request, 'certificates/generate_from_db.html', {
         'page_title': 'Generate Certificates from Uploaded Data',
+        'job': job,
     })
 
 
+@login_required_404
+def certificate_job_progress(request, job_id):
+    """JSON progress of a bulk generation job"""
+    job = get_object_or_404(CertificateJob, pk=job_id)
+    return JsonResponse(job.as_progress())
+
+
 
 import pandas as pd
 from django.http import HttpResponse
@@ -530,20 +691,27 @@ def verify_student(request):
         verification_attempted = True  # Mark that verification was attempted
         query = Q()
         
+        # __lower lookups seek the LOWER() indexes, see Certificate.Meta.indexes
         if method == 'certificate_id':
-            query = Q(certificate_id__iexact=value)
+            query = Q(certificate_id__lower=value.lower())
         elif method == 'phone':
             query = Q(phone__icontains=value)  # Assumes a phone field exists
         elif method == 'email':
-            query = Q(email__iexact=value)
+            query = Q(email__lower=value.lower())
         elif method == 'roll_number':
-            query = Q(roll_number__iexact=value)
+            query = Q(roll_number__lower=value.lower())
         else:
             error_message = 'Invalid verification method.'
 
         if not error_message:
             try:
-                certificate = Certificate.objects.filter(query, is_verified=True).first()
+                if method in LOOKUP_FIELDS:
+                    # Cached lookup, see certificates.verification
+                    certificate = lookup_certificate(method, value)
+                    if certificate and not certificate['is_verified']:
+                        certificate = None
+                else:
+                    certificate = Certificate.objects.filter(query, is_verified=True).first()
                 if certificate:
                     is_verified = True
                 else:
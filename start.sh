@@ -1,2 +1,4 @@
 #!/bin/bash
 nohup python3 manage.py runserver 127.0.0.1:8090 &
+nohup python3 manage.py run_certificate_jobs &
+nohup python3 manage.py drain_email_outbox &